@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""Time building a :py:class:`profiletools.Profile` from many small batches.
+
+Compares :py:meth:`Profile.add_data`, which appends to capacity-doubling
+buffers, with the previous approach of stacking every batch onto the existing
+arrays, which is reproduced here. Run as::
+
+    python bench/bench_add_data.py
+"""
+
+from __future__ import division
+from __future__ import print_function
+from builtins import range
+
+import time
+import scipy
+import profiletools
+
+BATCH_SIZE = 50
+X_DIM = 2
+
+def add_stacked(num_batches, X, y, err_y):
+    """Append the batches the way Profile.add_data used to.
+    """
+    all_X = scipy.zeros((0, X_DIM))
+    all_err_X = scipy.zeros((0, X_DIM))
+    all_y = scipy.zeros(0)
+    all_err_y = scipy.zeros(0)
+    channels = scipy.zeros((0, X_DIM))
+    for k in range(0, num_batches):
+        all_X = scipy.vstack((all_X, X))
+        all_err_X = scipy.vstack((all_err_X, scipy.zeros_like(X)))
+        all_y = scipy.append(all_y, y)
+        all_err_y = scipy.append(all_err_y, err_y)
+        channels = scipy.vstack((channels, X))
+    return all_X, all_y
+
+def add_buffered(num_batches, X, y, err_y):
+    """Append the batches with Profile.add_data.
+    """
+    p = profiletools.Profile(X_dim=X_DIM)
+    for k in range(0, num_batches):
+        p.add_data(X, y, err_y=err_y)
+    return p.X, p.y
+
+if __name__ == '__main__':
+    X = scipy.random.uniform(size=(BATCH_SIZE, X_DIM))
+    y = scipy.random.uniform(size=BATCH_SIZE)
+    err_y = 0.1 * scipy.ones(BATCH_SIZE)
+    print("Appending batches of %d points (X_dim=%d):" % (BATCH_SIZE, X_DIM))
+    print("%10s %12s %12s" % ('batches', 'stacked', 'buffered'))
+    for num_batches in (500, 2000, 8000):
+        t = time.time()
+        X_s, y_s = add_stacked(num_batches, X, y, err_y)
+        t_stacked = time.time() - t
+        t = time.time()
+        X_b, y_b = add_buffered(num_batches, X, y, err_y)
+        t_buffered = time.time() - t
+        assert (X_s == X_b).all() and (y_s == y_b).all()
+        print("%10d %10.3f s %10.3f s" % (num_batches, t_stacked, t_buffered))
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""Time the weighted percentiles of many columns at once.
+
+Compares :py:func:`profiletools.robust_stdw`, which sorts all of the columns in
+a single call, with the previous approach of finding the percentiles of one
+column at a time, which is reproduced here. Run as::
+
+    python bench/bench_percentiles.py
+"""
+
+from __future__ import division
+from __future__ import print_function
+from builtins import range
+
+import time
+import scipy
+import profiletools
+
+def scoreatpercentilew_column(x, p, weights):
+    """Weighted percentiles `p` of the 1d array `x`, as computed before.
+    """
+    srt = x.argsort()
+    x = x[srt]
+    w = weights[srt]
+    Sn = w.cumsum()
+    pn = 100.0 / Sn[-1] * (Sn - w / 2.0)
+    k = scipy.digitize(scipy.atleast_1d(p), pn) - 1
+    return x[k] + (p - pn[k]) / (pn[k + 1] - pn[k]) * (x[k + 1] - x[k])
+
+def robust_stdw_loop(x, weights):
+    """Robust standard deviation of each column of `x`, one column at a time.
+    """
+    std = scipy.zeros(x.shape[1])
+    for i in range(0, x.shape[1]):
+        lq, uq = scoreatpercentilew_column(x[:, i], [25, 75], weights)
+        std[i] = (uq - lq) / profiletools.IQR_TO_STD
+    return std
+
+if __name__ == '__main__':
+    print("robust_stdw with shared 1d weights:")
+    print("%16s %12s %12s" % ('points x columns', 'loop', 'batched'))
+    for M, K in ((200, 20), (200, 2000), (2000, 200)):
+        x = scipy.random.uniform(size=(M, K))
+        w = scipy.random.uniform(size=M) + 0.1
+        t = time.time()
+        std_loop = robust_stdw_loop(x, w)
+        t_loop = time.time() - t
+        t = time.time()
+        std_batched = profiletools.robust_stdw(x, w, axis=0)
+        t_batched = time.time() - t
+        assert scipy.allclose(std_loop, std_batched)
+        print("%16s %9.1f ms %9.1f ms"
+              % ('%d x %d' % (M, K), 1e3 * t_loop, 1e3 * t_batched))
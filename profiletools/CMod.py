@@ -23,10 +23,13 @@ from __future__ import print_function
 from builtins import zip
 from builtins import range
 
-from .core import Profile, Channel, read_csv, read_NetCDF
+from .core import (Profile, Channel, TransformedSet, FitPredictor, read_csv,
+                   read_NetCDF, read_npz, read_files, LinearFunctionals)
 from . import transformations
 
 import warnings
+import os.path
+import threading
 try:
     import MDSplus
 except ImportError:
@@ -38,6 +41,7 @@ except ImportError:
 import scipy
 import scipy.interpolate
 import scipy.stats
+import scipy.sparse
 import gptools
 import matplotlib.pyplot as plt
 try:
@@ -45,6 +49,11 @@ try:
 except ImportError:
     warnings.warn("Module TRIPPy could not be loaded!", RuntimeWarning)
 
+# MDSplus (and hence the EFIT trees read through it) is not thread-safe, so the
+# readers only open and read the trees while holding this lock. This lets
+# read_plasma_files parse several files at once:
+_tree_lock = threading.RLock()
+
 _X_label_mapping = {'psinorm': r'$\psi_n$',
                     'phinorm': r'$\phi_n$',
                     'volnorm': r'$V_n$',
@@ -63,7 +72,123 @@ _X_unit_mapping = {'psinorm': '',
                    'sqrtpsinorm': '',
                    'sqrtphinorm': '',
                    'sqrtvolnorm': '',
-                   'sqrtr/a': ''} 
+                   'sqrtr/a': ''}
+
+# Quantities copied into an :py:class:`EFITSnapshot`: getter name, default
+# units (None for quantities which don't take a `length_unit`) and whether or
+# not the leading dimension is time.
+_efit_snapshot_quantities = [('getTimeBase', None, True),
+                             ('getFluxGrid', None, True),
+                             ('getRGrid', 'm', False),
+                             ('getZGrid', 'm', False),
+                             ('getFluxAxis', None, True),
+                             ('getFluxLCFS', None, True),
+                             ('getFluxVol', 'm^3', True),
+                             ('getVolLCFS', 'm^3', True),
+                             ('getQProfile', None, True),
+                             ('getMagR', 'm', True),
+                             ('getMagZ', 'm', True),
+                             ('getRmidOut', 'm', True),
+                             ('getAOut', 'm', True),
+                             ('getRmidPsi', 'm', True),
+                             ('getBtVac', None, True),
+                             ('getCurrentSign', None, False)]
+
+def _efit_snapshot_getter(name, units):
+    """Make a getter for :py:class:`EFITSnapshot` returning the stored copy of `name`.
+    
+    Parameters
+    ----------
+    name : str
+        The name of the :py:class:`eqtools.Equilibrium` getter to emulate.
+    units : str or None
+        The units the quantity is stored in. If None, the getter does not
+        accept a `length_unit` keyword.
+    """
+    def check(self):
+        if self._data[name] is None:
+            raise ValueError(
+                "%s was not available when the EFIT snapshot was made!" % (name,)
+            )
+        return scipy.copy(self._data[name])
+    
+    if units is None:
+        def getter(self):
+            return check(self)
+    else:
+        def getter(self, length_unit=3 if units == 'm^3' else 1):
+            unit_factor = self._getLengthConversionFactor(units, length_unit)
+            return unit_factor * check(self)
+    getter.__name__ = name
+    getter.__doc__ = "Returns a copy of the stored result of `%s`." % (name,)
+    return getter
+
+# Fall back to a plain object so the module still imports without eqtools:
+class EFITSnapshot(eqtools.Equilibrium if 'eqtools' in globals() else object):
+    """In-memory copy of the parts of an EFIT tree needed to map a profile.
+    
+    Unlike :py:class:`eqtools.CModEFITTree`, a snapshot holds no connection to
+    the MDSplus tree, so it can be pickled and sent to worker processes. Only
+    the EFIT time slices covering [`t_min`, `t_max`] (plus `margin` slices on
+    either side) are kept, so the snapshot is small even for long shots.
+    
+    The location of the GH limiter can be stored alongside the equilibrium so
+    that :py:meth:`BivariatePlasmaProfile.get_limiter_locations` does not need
+    to go back to the tree either.
+    
+    Parameters
+    ----------
+    tree : :py:class:`eqtools.Equilibrium`
+        The equilibrium to copy.
+    t_min : float, optional
+        The earliest time needed. Default is to start at the first EFIT time.
+    t_max : float, optional
+        The latest time needed. Default is to end at the last EFIT time.
+    margin : int, optional
+        The number of extra EFIT time slices to keep on either side of
+        [`t_min`, `t_max`] so that nearest-neighbor lookups and interpolation
+        in time near the ends of the window give the same result as with the
+        full tree. Default is 1.
+    R_lim : array of float, optional
+        The major radii of the limiter, in meters.
+    Z_lim : array of float, optional
+        The elevations of the limiter, in meters.
+    """
+    def __init__(self, tree, t_min=None, t_max=None, margin=1, R_lim=None,
+                 Z_lim=None):
+        t_efit = tree.getTimeBase()
+        i_min = 0 if t_min is None else scipy.searchsorted(t_efit, t_min, side='right') - 1
+        i_max = len(t_efit) if t_max is None else scipy.searchsorted(t_efit, t_max, side='left') + 1
+        i_min = max(i_min - margin, 0)
+        i_max = min(i_max + margin, len(t_efit))
+        
+        self._shot = getattr(tree, '_shot', None)
+        self._data = {}
+        for name, units, time_dependent in _efit_snapshot_quantities:
+            kwargs = {} if units is None else {'length_unit': units}
+            try:
+                v = getattr(tree, name)(**kwargs)
+            except Exception:
+                # Not all trees have every quantity, only fail if it is used:
+                self._data[name] = None
+                continue
+            v = scipy.asarray(v)
+            if time_dependent:
+                v = v[i_min:i_max].copy()
+            self._data[name] = v
+        
+        self.R_lim = None if R_lim is None else scipy.atleast_1d(scipy.asarray(R_lim, dtype=float))
+        self.Z_lim = None if Z_lim is None else scipy.atleast_1d(scipy.asarray(Z_lim, dtype=float))
+        
+        super(EFITSnapshot, self).__init__(
+            length_unit=tree._length_unit,
+            tspline=tree._tricubic,
+            monotonic=tree._monotonic,
+            verbose=tree._verbose
+        )
+
+for _name, _units, _time_dependent in _efit_snapshot_quantities:
+    setattr(EFITSnapshot, _name, _efit_snapshot_getter(_name, _units))
 
 class BivariatePlasmaProfile(Profile):
     """Class to represent bivariate (y=f(t, psi)) plasma data.
@@ -72,16 +197,85 @@ class BivariatePlasmaProfile(Profile):
     second column is `R` and the third is `Z`. Otherwise the second column is
     the desired abscissa (psinorm, etc.).
     """
+    # The EFIT tree is remade from the shot number when reading:
+    _unserialized_attributes = Profile._unserialized_attributes + ('efit_tree',)
     
     def remake_efit_tree(self):
         """Remake the EFIT tree.
         
         This is needed since EFIT tree instances aren't pickleable yet, so to
         store a :py:class:`BivariatePlasmaProfile` in a pickle file, you must
-        delete the EFIT tree.
+        either delete the EFIT tree or replace it with a snapshot using
+        :py:meth:`snapshot_efit`.
         """
         self.efit_tree = eqtools.CModEFITTree(self.shot)
     
+    def snapshot_efit(self, t_min=None, t_max=None, margin=1):
+        """Replace the EFIT tree with a picklable :py:class:`EFITSnapshot`.
+        
+        The snapshot only holds the EFIT time slices needed for this profile,
+        along with the limiter location, so the profile can then be pickled
+        and sent to worker processes (e.g., with :py:mod:`multiprocessing`)
+        without needing access to the MDSplus tree. All of the mapping
+        routines (:py:meth:`convert_abscissa`, :py:meth:`remove_edge_points`,
+        the constraints in :py:meth:`create_gp`, volume averaging, etc.) work
+        with the snapshot as they do with the tree.
+        
+        Parameters
+        ----------
+        t_min : float, optional
+            The earliest time to keep. Default is to use the earliest time in
+            the profile, including the transformed quantities.
+        t_max : float, optional
+            The latest time to keep. Default is to use the latest time in the
+            profile, including the transformed quantities.
+        margin : int, optional
+            The number of extra EFIT time slices to keep on either side of the
+            window. Default is 1.
+        """
+        if isinstance(self.efit_tree, EFITSnapshot):
+            return
+        if t_min is None or t_max is None:
+            t_lo, t_hi = self._get_time_window()
+            if t_min is None:
+                t_min = t_lo
+            if t_max is None:
+                t_max = t_hi
+        R_lim, Z_lim = self.get_limiter_locations()
+        self.efit_tree = EFITSnapshot(
+            self.efit_tree,
+            t_min=t_min,
+            t_max=t_max,
+            margin=margin,
+            R_lim=R_lim,
+            Z_lim=Z_lim
+        )
+    
+    def _get_time_window(self):
+        """Get the range of times spanned by the profile.
+        
+        If the profile has been time-averaged, the original bounds (or
+        :py:attr:`times`, if present) are used. Otherwise the time column of
+        both the local and transformed points is used. Returns (None, None) if
+        no time information is available.
+        """
+        if hasattr(self, 'times'):
+            return min(self.times), max(self.times)
+        elif hasattr(self, 't_min'):
+            return self.t_min, self.t_max
+        elif self.X_dim == 1:
+            return None, None
+        # Profiles with only transformed quantities have no local points:
+        t = []
+        if self.X is not None:
+            t.append(scipy.asarray(self.X[:, 0]).ravel())
+        for p in self.transformed:
+            t.append(scipy.asarray(p.X[..., 0]).ravel())
+        if sum(len(v) for v in t) == 0:
+            return None, None
+        t = scipy.concatenate(t)
+        return t.min(), t.max()
+    
     def convert_abscissa(self, new_abscissa, drop_nan=True, ddof=1):
         """Convert the internal representation of the abscissa to new coordinates.
         
@@ -111,7 +305,9 @@ class BivariatePlasmaProfile(Profile):
         """
         if self.abscissa == new_abscissa:
             return
-        elif self.X_dim == 1 or (self.X_dim == 2 and self.abscissa == 'RZ'):
+        # The transformed quantities are modified in place:
+        self.transformed.unshare()
+        if self.X_dim == 1 or (self.X_dim == 2 and self.abscissa == 'RZ'):
             if self.abscissa.startswith('sqrt') and self.abscissa[4:] == new_abscissa:
                 if self.X is not None:
                     new_rho = scipy.power(self.X[:, 0], 2)
@@ -119,9 +315,10 @@ class BivariatePlasmaProfile(Profile):
                     err_new_rho = self.err_X[:, 0] * 2 * self.X[:, 0]
                 
                 # Handle transformed quantities:
-                for p in self.transformed:
-                    p.X[:, :, 0] = scipy.power(p.X[:, :, 0], 2)
-                    p.err_X[:, :, 0] = p.err_X[:, :, 0] * 2 * p.X[:, :, 0]
+                p = self.transformed
+                if len(p) > 0:
+                    p.X[..., 0] = scipy.power(p.X[..., 0], 2)
+                    p.err_X[..., 0] = p.err_X[..., 0] * 2 * p.X[..., 0]
             elif new_abscissa.startswith('sqrt') and self.abscissa == new_abscissa[4:]:
                 if self.X is not None:
                     new_rho = scipy.power(self.X[:, 0], 0.5)
@@ -129,9 +326,10 @@ class BivariatePlasmaProfile(Profile):
                     err_new_rho = self.err_X[:, 0] / (2 * scipy.sqrt(self.X[:, 0]))
                 
                 # Handle transformed quantities:
-                for p in self.transformed:
-                    p.X[:, :, 0] = scipy.power(p.X[:, :, 0], 0.5)
-                    p.err_X[:, :, 0] = p.err_X[:, :, 0]  / (2 * scipy.sqrt(p.X[:, :, 0]))
+                p = self.transformed
+                if len(p) > 0:
+                    p.X[..., 0] = scipy.power(p.X[..., 0], 0.5)
+                    p.err_X[..., 0] = p.err_X[..., 0]  / (2 * scipy.sqrt(p.X[..., 0]))
             else:
                 times = self._get_efit_times_to_average()
                 
@@ -148,18 +346,18 @@ class BivariatePlasmaProfile(Profile):
                     self.X_dim = 1
                     
                     # Handle transformed quantities:
-                    for p in self.transformed:
-                        new_rhos = self.efit_tree.rz2rho(
+                    p = self.transformed
+                    if len(p) > 0:
+                        new_rhos_T = self.efit_tree.rz2rho(
                             new_abscissa,
-                            p.X[:, :, 0],
-                            p.X[:, :, 1],
+                            p.X[..., 0],
+                            p.X[..., 1],
                             times,
                             each_t=True
                         )
-                        p.X = scipy.delete(p.X, 1, axis=2)
-                        p.err_X = scipy.delete(p.err_X, 1, axis=2)
-                        p.X[:, :, 0] = scipy.atleast_3d(scipy.mean(new_rhos, axis=0))
-                        p.err_X[:, :, 0] = scipy.atleast_3d(scipy.std(new_rhos, axis=0, ddof=ddof))
+                        p.drop_axis(1)
+                        p.X[..., 0] = scipy.mean(new_rhos_T, axis=0)
+                        p.err_X[..., 0] = scipy.std(new_rhos_T, axis=0, ddof=ddof)
                         p.err_X[scipy.isnan(p.err_X)] = 0
                 else:
                     if self.X is not None:
@@ -172,16 +370,17 @@ class BivariatePlasmaProfile(Profile):
                         )
                     
                     # Handle transformed quantities:
-                    for p in self.transformed:
-                        new_rhos = self.efit_tree.rho2rho(
+                    p = self.transformed
+                    if len(p) > 0:
+                        new_rhos_T = self.efit_tree.rho2rho(
                             self.abscissa,
                             new_abscissa,
-                            p.X[:, :, 0],
+                            p.X[..., 0],
                             times,
                             each_t=True
                         )
-                        p.X[:, :, 0] = scipy.atleast_3d(scipy.mean(new_rhos, axis=0))
-                        p.err_X[:, :, 0] = scipy.atleast_3d(scipy.std(new_rhos, axis=0, ddof=ddof))
+                        p.X[..., 0] = scipy.mean(new_rhos_T, axis=0)
+                        p.err_X[..., 0] = scipy.std(new_rhos_T, axis=0, ddof=ddof)
                         p.err_X[scipy.isnan(p.err_X)] = 0
                 if self.X is not None:
                     new_rho = scipy.mean(new_rhos, axis=0)
@@ -199,17 +398,19 @@ class BivariatePlasmaProfile(Profile):
                     new_rho = scipy.power(self.X[:, 1], 2)
                 
                 # Handle transformed quantities:
-                for p in self.transformed:
-                    p.X[:, :, 1] = scipy.power(p.X[:, :, 1], 2)
-                    p.err_X[:, :, 1] = scipy.zeros_like(p.X[:, :, 1])
+                p = self.transformed
+                if len(p) > 0:
+                    p.X[..., 1] = scipy.power(p.X[..., 1], 2)
+                    p.err_X[..., 1] = 0.0
             elif new_abscissa.startswith('sqrt') and self.abscissa == new_abscissa[4:]:
                 if self.X is not None:
                     new_rho = scipy.power(self.X[:, 1], 0.5)
                 
                 # Handle transformed quantities:
-                for p in self.transformed:
-                    p.X[:, :, 1] = scipy.power(p.X[:, :, 1], 0.5)
-                    p.err_X[:, :, 1] = scipy.zeros_like(p.X[:, :, 1])
+                p = self.transformed
+                if len(p) > 0:
+                    p.X[..., 1] = scipy.power(p.X[..., 1], 0.5)
+                    p.err_X[..., 1] = 0.0
             elif self.abscissa == 'RZ':
                 # Need to handle this case separately because of the extra column:
                 if self.X is not None:
@@ -224,17 +425,17 @@ class BivariatePlasmaProfile(Profile):
                 self.X_dim = 2
                 
                 # Handle transformed quantities:
-                for p in self.transformed:
-                    p.X[:, :, 1] = self.efit_tree.rz2rho(
+                p = self.transformed
+                if len(p) > 0:
+                    p.X[..., 1] = self.efit_tree.rz2rho(
                         new_abscissa,
-                        p.X[:, :, 1],
-                        p.X[:, :, 2],
-                        p.X[:, :, 0],
+                        p.X[..., 1],
+                        p.X[..., 2],
+                        p.X[..., 0],
                         each_t=False
                     )
-                    p.X = scipy.delete(p.X, 2, axis=2)
-                    p.err_X = scipy.delete(p.err_X, 2, axis=2)
-                    p.err_X[:, :, 1] = scipy.zeros_like(p.X[:, :, 1])
+                    p.drop_axis(2)
+                    p.err_X[..., 1] = 0.0
             else:
                 if self.X is not None:
                     new_rho = self.efit_tree.rho2rho(
@@ -246,15 +447,16 @@ class BivariatePlasmaProfile(Profile):
                     )
                 
                 # Handle transformed quantities:
-                for p in self.transformed:
-                    p.X[:, :, 1] = self.efit_tree.rho2rho(
+                p = self.transformed
+                if len(p) > 0:
+                    p.X[..., 1] = self.efit_tree.rho2rho(
                         self.abscissa,
                         new_abscissa,
-                        p.X[:, :, 1],
-                        p.X[:, :, 0],
+                        p.X[..., 1],
+                        p.X[..., 0],
                         each_t=False
                     )
-                    p.err_X[:, :, 1] = scipy.zeros_like(p.X[:, :, 1])
+                    p.err_X[..., 1] = 0.0
             
             if self.X is not None:
                 err_new_rho = scipy.zeros_like(self.X[:, 0])
@@ -285,8 +487,9 @@ class BivariatePlasmaProfile(Profile):
             self.t_min = self.X[:, 0].min()
             self.t_max = self.X[:, 0].max()
         if len(self.transformed) > 0:
-            t_min_T = min([p.X[:, :, 0].min() for p in self.transformed])
-            t_max_T = max([p.X[:, :, 0].max() for p in self.transformed])
+            t_T = self.transformed.X[self.transformed.mask][:, :, 0]
+            t_min_T = t_T.min()
+            t_max_T = t_T.max()
             if self.X is None:
                 self.t_min = t_min_T
                 self.t_max = t_max_T
@@ -308,8 +511,9 @@ class BivariatePlasmaProfile(Profile):
                 self.t_min = self.X[:, 0].min()
                 self.t_max = self.X[:, 0].max()
             if len(self.transformed) > 0:
-                t_min_T = min([p.X[:, :, 0].min() for p in self.transformed])
-                t_max_T = max([p.X[:, :, 0].max() for p in self.transformed])
+                t_T = self.transformed.X[self.transformed.mask][:, :, 0]
+                t_min_T = t_T.min()
+                t_max_T = t_T.max()
                 if self.X is None:
                     self.t_min = t_min_T
                     self.t_max = t_max_T
@@ -355,6 +559,43 @@ class BivariatePlasmaProfile(Profile):
         if self.y_label != other.y_label:
             self.y_label = self.y_label.split(', ')[0]
     
+    @classmethod
+    def concat(cls, profiles):
+        """Merge several profiles into a new one in a single pass.
+        
+        The abscissa of (a copy of) each profile is converted to that of
+        ``profiles[0]`` before merging, and the diagnostic description is split off the label
+        if the profiles come from different diagnostics, just as with
+        :py:meth:`add_profile`.
+        
+        Parameters
+        ----------
+        profiles : list of :py:class:`BivariatePlasmaProfile`
+            The profiles to merge.
+        
+        Returns
+        -------
+        p : :py:class:`BivariatePlasmaProfile`
+            The merged profile.
+        """
+        profiles = list(profiles)
+        if len(profiles) == 0:
+            raise ValueError("Must provide at least one profile to merge!")
+        first = profiles[0]
+        for k, other in enumerate(profiles[1:], 1):
+            # Warn about merging profiles from different shots:
+            if first.shot != other.shot:
+                warnings.warn("Merging data from two different shots: %d and %d"
+                              % (first.shot, other.shot,))
+            # Convert a copy so the inputs are left as they were:
+            if other.abscissa != first.abscissa:
+                profiles[k] = other.copy()
+                profiles[k].convert_abscissa(first.abscissa)
+        p = super(BivariatePlasmaProfile, cls).concat(profiles)
+        if any([other.y_label != first.y_label for other in profiles[1:]]):
+            p.y_label = first.y_label.split(', ')[0]
+        return p
+    
     def remove_edge_points(self, allow_conversion=True):
         """Removes points that are outside the LCFS.
         
@@ -541,7 +782,7 @@ class BivariatePlasmaProfile(Profile):
         
         This is accomplished by setting their weights to zero. When
         :py:meth:`create_gp` is called, it will call
-        :py:meth:`GaussianProcess.condense_duplicates` which will remove any
+        :py:func:`~profiletools.core.condense_transform` which will remove any
         points for which all of the weights are zero.
         
         This only affects the transformed quantities in `self.transformed`.
@@ -553,6 +794,7 @@ class BivariatePlasmaProfile(Profile):
                 "or Rmid to use this method." % (self.abscissa,)
             )
         R_lim, Z_lim = self.get_limiter_locations()
+        self.transformed.unshare()
         if self.X_dim == 1:
             # In this case, there is a unique set of times, and we can just find
             # one unique limiter location:
@@ -562,17 +804,17 @@ class BivariatePlasmaProfile(Profile):
                 axis=0
             )
             xa = rho_lim.min()
-            for t in self.transformed:
-                t.T[t.X[:, :, 0] > xa] = 0.0
+            if len(self.transformed) > 0:
+                self.transformed.T[self.transformed.X[..., 0] > xa] = 0.0
         elif self.X_dim == 2:
-            # This case is harder. For each transformed variable, we must find
-            # the limiter location at each time value present.
-            for t in self.transformed:
-                times = scipy.unique(scipy.asarray(t.X[:, :, 0]).ravel())
+            # This case is harder. We must find the limiter location at each
+            # time value present, then look it up for every quadrature point.
+            t = self.transformed
+            if len(t) > 0:
+                times, time_idx = scipy.unique(t.X[..., 0], return_inverse=True)
                 rho_lim = self.efit_tree.rz2rho(self.abscissa, R_lim, Z_lim, times, each_t=True)
                 xa = rho_lim.min(axis=1)
-                for t_val, xa_val in zip(times, xa):
-                    t.T[(t.X[:, :, 0] == t_val) & (t.X[:, :, 1] > xa_val)] = 0.0
+                t.T[t.X[..., 1] > xa[time_idx.reshape(t.T.shape)]] = 0.0
         else:
             raise ValueError(
                 "Removal of quadrature points outside of the limiter is not "
@@ -584,8 +826,11 @@ class BivariatePlasmaProfile(Profile):
         """Retrieve the location of the GH limiter from the tree.
         
         If the data are not there (they are missing for some old shots), use
-        R=0.91m, Z=0.0m.
+        R=0.91m, Z=0.0m. If :py:attr:`efit_tree` is an :py:class:`EFITSnapshot`
+        holding the limiter location, that is used instead.
         """
+        if getattr(self.efit_tree, 'R_lim', None) is not None:
+            return self.efit_tree.R_lim, self.efit_tree.Z_lim
         # Fail back to a conservative position if the limiter data are not in
         # the tree:
         try:
@@ -648,7 +893,8 @@ class BivariatePlasmaProfile(Profile):
     def compute_a_over_L(self, X, force_update=False, plot=False,
                          gp_kwargs={}, MAP_kwargs={}, plot_kwargs={},
                          return_prediction=False, special_vals=0,
-                         special_X_vals=0, compute_2=False, **predict_kwargs):
+                         special_X_vals=0, compute_2=False, functionals=None,
+                         full_cov=True, **predict_kwargs):
         """Compute the normalized inverse gradient scale length.
         
         Only works on data that have already been time-averaged at the moment.
@@ -692,6 +938,24 @@ class BivariatePlasmaProfile(Profile):
             is True). You should almost always have r/a for your abscissa when
             using this: the expressions for other coordinate systems are not as
             well-vetted. Default is False (don't compute second derivative).
+        functionals : :py:class:`~profiletools.core.LinearFunctionals`, optional
+            Other linear functionals of the profile (such as the volume average)
+            to evaluate in the same prediction. Their results are added to the
+            output structure (if `return_prediction` is True) as described in
+            :py:meth:`~profiletools.core.LinearFunctionals.evaluate`. Cannot be
+            used together with `output_transform`. Default is None (no other
+            functionals).
+        full_cov : bool, optional
+            If False, only the variances and the covariances between the value
+            and derivatives at the same point are computed, using
+            :py:meth:`~profiletools.core.PredictionSession.predict_local`. The
+            error propagation is the same, but the memory needed is linear in
+            the number of points instead of quadratic, which matters for dense
+            grids. In this case 'cov' in the output structure is None and
+            'cov_local' holds the same-point covariances, and any `functionals`
+            are evaluated with a separate prediction. Cannot be used with MCMC,
+            samples, `output_transform` or the special values. Default is True
+            (compute the full covariance matrix).
         **predict_kwargs : optional parameters
             All other parameters are passed to the Gaussian process'
             :py:meth:`predict` method.
@@ -703,131 +967,124 @@ class BivariatePlasmaProfile(Profile):
             if not predict_kwargs.get('use_MCMC', False):
                 self.find_gp_MAP_estimate(**MAP_kwargs)
         if self.X_dim == 1:
-            # Get GP fit:
-            XX = scipy.concatenate((X, X[special_X_vals:]))
-            if compute_2:
-                XX = scipy.concatenate((XX, X[special_X_vals:]))
-            n = scipy.concatenate((
-                scipy.zeros_like(X), scipy.ones_like(X[special_X_vals:])
-            ))
-            if compute_2:
-                n = scipy.concatenate((n, 2 * scipy.ones_like(X[special_X_vals:])))
-            out = self.gp.predict(XX, n=n, full_output=True, **predict_kwargs)
-            mean = out['mean']
-            cov = out['cov']
-            if predict_kwargs.get('return_mean_func', False) and self.gp.mu is not None:
-                mean_func = out['mean_func']
-                std_func = out['std_func']
-                mean_without_func = out['mean_without_func']
-                std_without_func = out['std_without_func']
+            if not full_cov:
+                for k in ('use_MCMC', 'full_MC', 'return_samples', 'return_mean_func'):
+                    if predict_kwargs.get(k, False):
+                        raise ValueError("Cannot use %s with full_cov=False!" % (k,))
+                if (predict_kwargs.get('output_transform', None) is not None or
+                        special_vals or special_X_vals):
+                    raise ValueError(
+                        "Cannot use output_transform or special values with "
+                        "full_cov=False!"
+                    )
+                if functionals is not None:
+                    functionals_res = functionals.evaluate(self, **predict_kwargs)
+                mean, cov_local = self.get_prediction_session().predict_local(
+                    X,
+                    orders=(0, 1, 2) if compute_2 else (0, 1),
+                    noise=predict_kwargs.get('noise', False)
+                )
+                cov = None
+                special_mean = scipy.zeros(0)
+                special_cov = scipy.zeros((0, 0))
+                mean_val = mean[0]
+                var_val = cov_local[0, 0]
+                mean_grad = mean[1]
+                var_grad = cov_local[1, 1]
+                cov_val_grad = cov_local[0, 1]
+                if compute_2:
+                    mean_2 = mean[2]
+                    var_2 = cov_local[2, 2]
+                    cov_val_2 = cov_local[0, 2]
+                    cov_grad_2 = cov_local[1, 2]
+            else:
+                # Get GP fit:
+                XX = scipy.concatenate((X, X[special_X_vals:]))
+                if compute_2:
+                    XX = scipy.concatenate((XX, X[special_X_vals:]))
+                n = scipy.concatenate((
+                    scipy.zeros_like(X), scipy.ones_like(X[special_X_vals:])
+                ))
+                if compute_2:
+                    n = scipy.concatenate((n, 2 * scipy.ones_like(X[special_X_vals:])))
+                if functionals is not None:
+                    if predict_kwargs.get('output_transform', None) is not None:
+                        raise ValueError(
+                            "Cannot use functionals together with output_transform!"
+                        )
+                    # Put the functionals after the value and gradient so the
+                    # indices used here (and by RejectionFunc) are unchanged.
+                    # Points shared with the functionals (such as a volume
+                    # average on the same grid) are only predicted once:
+                    num_XX = len(XX)
+                    X_f, n_f, T_f, slices_f = functionals.assemble(X=XX, n=n)
+                    predict_kwargs['output_transform'] = T_f
+                    XX = X_f[:, 0]
+                    n = n_f[:, 0]
+                out = self.get_prediction_session().predict(XX, n=n, full_output=True, **predict_kwargs)
+                if functionals is not None:
+                    functionals_res = functionals._unpack(out, slices_f, start=num_XX)
+                    out = dict(out)
+                    for k in ('mean', 'std', 'samp', 'mean_func', 'std_func',
+                              'mean_without_func', 'std_without_func'):
+                        if k in out:
+                            out[k] = out[k][:num_XX]
+                    for k in ('cov', 'cov_func', 'cov_without_func'):
+                        if k in out:
+                            out[k] = out[k][:num_XX, :num_XX]
+                mean = out['mean']
+                cov = out['cov']
+                if predict_kwargs.get('return_mean_func', False) and self.gp.mu is not None:
+                    mean_func = out['mean_func']
+                    std_func = out['std_func']
+                    mean_without_func = out['mean_without_func']
+                    std_without_func = out['std_without_func']
             
-            # Ditch the special values:
-            special_mean = mean[:special_vals]
-            special_cov = cov[:special_vals, :special_vals]
-            X = X[special_X_vals:]
+                # Ditch the special values:
+                special_mean = mean[:special_vals]
+                special_cov = cov[:special_vals, :special_vals]
+                X = X[special_X_vals:]
             
-            cov = cov[special_vals:, special_vals:]
-            mean = mean[special_vals:]
-            if predict_kwargs.get('return_mean_func', False) and self.gp.mu is not None:
-                mean_func = mean_func[special_vals:]
-                std_func = std_func[special_vals:]
-                mean_without_func = mean_without_func[special_vals:]
-                std_without_func = std_without_func[special_vals:]
+                cov = cov[special_vals:, special_vals:]
+                mean = mean[special_vals:]
+                if predict_kwargs.get('return_mean_func', False) and self.gp.mu is not None:
+                    mean_func = mean_func[special_vals:]
+                    std_func = std_func[special_vals:]
+                    mean_without_func = mean_without_func[special_vals:]
+                    std_without_func = std_without_func[special_vals:]
             
-            var = scipy.diagonal(cov)
-            mean_val = mean[:len(X)]
-            var_val = var[:len(X)]
-            mean_grad = mean[len(X):2 * len(X)]
-            var_grad = var[len(X):2 * len(X)]
-            if predict_kwargs.get('return_mean_func', False) and self.gp.mu is not None:
-                mean_func_val = mean_func[:len(X)]
-                std_func_val = std_func[:len(X)]
-                mean_func_grad = mean_func[len(X):]
-                std_func_grad = std_func[len(X):]
+                var = scipy.diagonal(cov)
+                mean_val = mean[:len(X)]
+                var_val = var[:len(X)]
+                mean_grad = mean[len(X):2 * len(X)]
+                var_grad = var[len(X):2 * len(X)]
+                if predict_kwargs.get('return_mean_func', False) and self.gp.mu is not None:
+                    mean_func_val = mean_func[:len(X)]
+                    std_func_val = std_func[:len(X)]
+                    mean_func_grad = mean_func[len(X):]
+                    std_func_grad = std_func[len(X):]
                 
-                mean_without_func_val = mean_without_func[:len(X)]
-                std_without_func_val = std_without_func[:len(X)]
-                mean_without_func_grad = mean_without_func[len(X):]
-                std_without_func_grad = std_without_func[len(X):]
-            if compute_2:
-                mean_2 = mean[2 * len(X):]
-                var_2 = var[2 * len(X):]
-            i = list(range(0, len(X)))
-            j = list(range(len(X), 2 * len(X)))
-            cov_val_grad = scipy.asarray(cov[i, j]).flatten()
+                    mean_without_func_val = mean_without_func[:len(X)]
+                    std_without_func_val = std_without_func[:len(X)]
+                    mean_without_func_grad = mean_without_func[len(X):]
+                    std_without_func_grad = std_without_func[len(X):]
+                if compute_2:
+                    mean_2 = mean[2 * len(X):]
+                    var_2 = var[2 * len(X):]
+                i = list(range(0, len(X)))
+                j = list(range(len(X), 2 * len(X)))
+                cov_val_grad = scipy.asarray(cov[i, j]).flatten()
             
-            if compute_2:
-                k = list(range(2 * len(X), 3 * len(X)))
-                cov_val_2 = scipy.asarray(cov[i, k]).flatten()
-                cov_grad_2 = scipy.asarray(cov[j, k]).flatten()
+                if compute_2:
+                    k = list(range(2 * len(X), 3 * len(X)))
+                    cov_val_2 = scipy.asarray(cov[i, k]).flatten()
+                    cov_grad_2 = scipy.asarray(cov[j, k]).flatten()
             
             # Get geometry from EFIT:
-            t_efit = self.efit_tree.getTimeBase()
-            ok_idxs = self._get_efit_times_to_average(return_idxs=True)
-            
-            # Get correction factor for converting the abscissa back to Rmid:
-            if self.abscissa == 'Rmid':
-                a = self.efit_tree.getAOut()[ok_idxs]
-                var_a = scipy.var(a, ddof=1)
-                if scipy.isnan(var_a):
-                    var_a = 0
-                mean_a = scipy.mean(a)
-                
-                mean_dX_droa = mean_a
-                var_dX_droa = var_a
-                
-                if compute_2:
-                    mean_dX_droa_2 = 0.0
-                    var_dX_droa_2 = 0.0
-                    cov_dX_droa_2 = 0.0
-            elif self.abscissa == 'r/a':
-                mean_dX_droa = 1.0
-                var_dX_droa = 0.0
-                
-                if compute_2:
-                    mean_dX_droa_2 = 0.0
-                    var_dX_droa_2 = 0.0
-                    cov_dX_droa_2 = 0.0
-            else:
-                # Code taken from core.py of eqtools, modified to use
-                # InterpolatedUnivariateSpline to get access to derivatives:
-                dX_droa = scipy.zeros((len(X), len(ok_idxs)))
-                if compute_2:
-                    dX_droa_2 = scipy.zeros((len(X), len(ok_idxs)))
-                # Loop over time indices:
-                for idx, k in zip(ok_idxs, list(range(0, len(ok_idxs)))):
-                    resample_factor = 3
-                    roa_grid = scipy.linspace(0, 2, resample_factor * len(self.efit_tree.getRGrid()))
-                    
-                    X_on_grid = self.efit_tree.roa2rho(self.abscissa, roa_grid, t_efit[idx])
-                    # Rmid is handled specially up here, so we can filter the
-                    # origin out properly:
-                    X_on_grid[roa_grid == 0.0] = 0.0
-                    
-                    good_idxs = ~scipy.isnan(X_on_grid)
-                    X_on_grid = X_on_grid[good_idxs]
-                    roa_grid = roa_grid[good_idxs]
-                    
-                    spline = scipy.interpolate.InterpolatedUnivariateSpline(
-                        roa_grid, X_on_grid, k=3
-                    )
-                    roa_X = self.efit_tree.rho2rho(self.abscissa, 'r/a', X, t_efit[idx])
-                    roa_X[X == 0.0] = 0.0
-                    dX_droa[:, k] = spline(roa_X, nu=1)
-                    
-                    if compute_2:
-                        # dX_droa_2[:, k] = -spline(X, nu=2) * (dX_droa[:, k])**3.0
-                        dX_droa_2[:, k] = spline(roa_X, nu=2)
-                
-                mean_dX_droa = scipy.mean(dX_droa, axis=1)
-                var_dX_droa = scipy.var(dX_droa, ddof=predict_kwargs.get('ddof', 1), axis=1)
-                var_dX_droa[scipy.isnan(var_dX_droa)] = 0.0
-                
-                if compute_2:
-                    mean_dX_droa_2 = scipy.mean(dX_droa_2, axis=1)
-                    var_dX_droa_2 = scipy.var(dX_droa_2, ddof=predict_kwargs.get('ddof', 1), axis=1)
-                    var_dX_droa_2[scipy.isnan(var_dX_droa_2)] = 0.0
-                    cov_dX_droa_2 = scipy.cov(dX_droa, dX_droa_2, ddof=predict_kwargs.get('ddof', 1))[i, j]
+            (mean_dX_droa, var_dX_droa, mean_dX_droa_2, var_dX_droa_2,
+             cov_dX_droa_2) = self._get_dX_droa(
+                X, compute_2=compute_2, ddof=predict_kwargs.get('ddof', 1)
+            )
             
             if predict_kwargs.get('full_MC', False):
                 # TODO: Doesn't include uncertainty in EFIT quantities!
@@ -939,10 +1196,141 @@ class BivariatePlasmaProfile(Profile):
                 retval['std_a2_2'] = std_a2_2
             if predict_kwargs.get('full_MC', False) or predict_kwargs.get('return_samples', False):
                 retval['samp'] = out['samp']
+            if not full_cov:
+                retval['cov_local'] = cov_local
+            if functionals is not None:
+                retval.update(functionals_res)
             return retval
         else:
             return (mean_a_L, std_a_L)
     
+    def _get_dX_droa(self, X, compute_2=False, ddof=1):
+        """Get the derivative of the abscissa with respect to r/a from EFIT.
+        
+        The derivatives are averaged over the EFIT time slices used for the
+        profile.
+        
+        Parameters
+        ----------
+        X : array, (`M`,)
+            The values of the abscissa to evaluate the derivatives at.
+        compute_2 : bool, optional
+            If True, the second derivative is also computed. Default is False.
+        ddof : int, optional
+            The degree of freedom correction used when computing the variance
+            over time. Default is 1.
+        
+        Returns
+        -------
+        mean_dX_droa, var_dX_droa : float or :py:class:`Array`, (`M`,)
+            The mean and variance of the first derivative.
+        mean_dX_droa_2, var_dX_droa_2, cov_dX_droa_2 : float or :py:class:`Array`, (`M`,)
+            The mean and variance of the second derivative and its covariance
+            with the first derivative. These are None unless `compute_2` is
+            True.
+        """
+        mean_dX_droa_2 = None
+        var_dX_droa_2 = None
+        cov_dX_droa_2 = None
+        t_efit = self.efit_tree.getTimeBase()
+        ok_idxs = self._get_efit_times_to_average(return_idxs=True)
+        
+        # Get correction factor for converting the abscissa back to Rmid:
+        if self.abscissa == 'Rmid':
+            a = self.efit_tree.getAOut()[ok_idxs]
+            var_a = scipy.var(a, ddof=1)
+            if scipy.isnan(var_a):
+                var_a = 0
+            mean_a = scipy.mean(a)
+            
+            mean_dX_droa = mean_a
+            var_dX_droa = var_a
+            
+            if compute_2:
+                mean_dX_droa_2 = 0.0
+                var_dX_droa_2 = 0.0
+                cov_dX_droa_2 = 0.0
+        elif self.abscissa == 'r/a':
+            mean_dX_droa = 1.0
+            var_dX_droa = 0.0
+            
+            if compute_2:
+                mean_dX_droa_2 = 0.0
+                var_dX_droa_2 = 0.0
+                cov_dX_droa_2 = 0.0
+        else:
+            # Code taken from core.py of eqtools, modified to use
+            # InterpolatedUnivariateSpline to get access to derivatives:
+            dX_droa = scipy.zeros((len(X), len(ok_idxs)))
+            if compute_2:
+                dX_droa_2 = scipy.zeros((len(X), len(ok_idxs)))
+            # Loop over time indices:
+            for idx, k in zip(ok_idxs, list(range(0, len(ok_idxs)))):
+                resample_factor = 3
+                roa_grid = scipy.linspace(0, 2, resample_factor * len(self.efit_tree.getRGrid()))
+                
+                X_on_grid = self.efit_tree.roa2rho(self.abscissa, roa_grid, t_efit[idx])
+                # Rmid is handled specially up here, so we can filter the
+                # origin out properly:
+                X_on_grid[roa_grid == 0.0] = 0.0
+                
+                good_idxs = ~scipy.isnan(X_on_grid)
+                X_on_grid = X_on_grid[good_idxs]
+                roa_grid = roa_grid[good_idxs]
+                
+                spline = scipy.interpolate.InterpolatedUnivariateSpline(
+                    roa_grid, X_on_grid, k=3
+                )
+                roa_X = self.efit_tree.rho2rho(self.abscissa, 'r/a', X, t_efit[idx])
+                roa_X[X == 0.0] = 0.0
+                dX_droa[:, k] = spline(roa_X, nu=1)
+                
+                if compute_2:
+                    # dX_droa_2[:, k] = -spline(X, nu=2) * (dX_droa[:, k])**3.0
+                    dX_droa_2[:, k] = spline(roa_X, nu=2)
+            
+            mean_dX_droa = scipy.mean(dX_droa, axis=1)
+            var_dX_droa = scipy.var(dX_droa, ddof=ddof, axis=1)
+            var_dX_droa[scipy.isnan(var_dX_droa)] = 0.0
+            
+            if compute_2:
+                mean_dX_droa_2 = scipy.mean(dX_droa_2, axis=1)
+                var_dX_droa_2 = scipy.var(dX_droa_2, ddof=ddof, axis=1)
+                var_dX_droa_2[scipy.isnan(var_dX_droa_2)] = 0.0
+                # The covariance of each first derivative with the matching
+                # second derivative:
+                i = list(range(0, len(X)))
+                j = list(range(len(X), 2 * len(X)))
+                cov_dX_droa_2 = scipy.cov(dX_droa, dX_droa_2, ddof=ddof)[i, j]
+        
+        return (mean_dX_droa, var_dX_droa, mean_dX_droa_2, var_dX_droa_2,
+                cov_dX_droa_2)
+    
+    def get_fit_predictor(self, force_update=False, gp_kwargs={}, MAP_kwargs={},
+                          grid=None):
+        """Get a lightweight :py:class:`PlasmaFitPredictor` for the current fit.
+        
+        Parameters
+        ----------
+        force_update : bool, optional
+            If True, a new Gaussian process will be created and fit even if one
+            already exists. Default is False (use current Gaussian process if
+            it exists).
+        gp_kwargs : dict, optional
+            The entries of this dictionary are passed as kwargs to
+            :py:meth:`create_gp` if it gets called. Default is {}.
+        MAP_kwargs : dict, optional
+            The entries of this dictionary are passed as kwargs to
+            :py:meth:`find_gp_MAP_estimate` if it gets called. Default is {}.
+        grid : array, (`M`,), optional
+            The values of the abscissa to tabulate the EFIT geometry at. See
+            :py:class:`PlasmaFitPredictor`.
+        """
+        if force_update or self.gp is None:
+            self.create_gp(**gp_kwargs)
+            self.find_gp_MAP_estimate(**MAP_kwargs)
+        return PlasmaFitPredictor(self, grid=grid)
+    
     def _get_efit_times_to_average(self, return_idxs=False):
         """Get the EFIT times to average over for a profile that has already been time-averaged.
         
@@ -1107,7 +1495,7 @@ class BivariatePlasmaProfile(Profile):
                     self.find_gp_MAP_estimate(**MAP_kwargs)
             rho_grid, weights = self._make_volume_averaging_matrix(rho_grid=grid, npts=npts)
             
-            res = self.gp.predict(
+            res = self.get_prediction_session().predict(
                 rho_grid,
                 output_transform=weights,
                 return_std=return_std,
@@ -1123,6 +1511,21 @@ class BivariatePlasmaProfile(Profile):
             raise NotImplementedError("Volume averaging not yet supported for "
                                       "X_dim > 1!")
     
+    def get_peaking_core_location(self):
+        r"""Get the location of the core point used for the peaking, :math:`\psi_n=0.2`, on the instance's abscissa.
+        """
+        if 'psinorm' in self.abscissa:
+            if self.abscissa.startswith('sqrt'):
+                return scipy.sqrt(0.2)
+            else:
+                return 0.2
+        else:
+            times = self._get_efit_times_to_average()
+            
+            core_loc = self.efit_tree.psinorm2rho(self.abscissa, 0.2, times, each_t=True)
+            # Use nanmean in case the mapping fails at some of the EFIT times:
+            return scipy.stats.nanmean(scipy.asarray(core_loc).ravel())
+    
     def compute_peaking(self, return_std=True, grid=None, npts=400,
                         force_update=False, gp_kwargs={}, MAP_kwargs={},
                         **predict_kwargs):
@@ -1165,49 +1568,107 @@ class BivariatePlasmaProfile(Profile):
                 self.create_gp(**gp_kwargs)
                 if not predict_kwargs.get('use_MCMC', False):
                     self.find_gp_MAP_estimate(**MAP_kwargs)
-            rho_grid, weights = self._make_volume_averaging_matrix(rho_grid=grid, npts=npts)
-            weights = scipy.append(weights, 0)
-            
-            # Find the relevant core location:
-            if 'psinorm' in self.abscissa:
-                if self.abscissa.startswith('sqrt'):
-                    core_loc = scipy.sqrt(0.2)
-                else:
-                    core_loc = 0.2
-            else:
-                times = self._get_efit_times_to_average()
-                
-                core_loc = self.efit_tree.psinorm2rho(self.abscissa, 0.2, times, each_t=True)
-                core_loc = scipy.mean(core_loc)
-            
-            rho_grid = scipy.append(rho_grid, core_loc)
-            core_select = scipy.zeros_like(weights)
-            core_select[-1] = 1
-            weights = scipy.vstack((weights, core_select))
-            res = self.gp.predict(
-                rho_grid,
-                output_transform=weights,
-                return_std=return_std,
-                return_cov=return_std,
-                full_output=False,
-                **predict_kwargs
-            )
+            lf = LinearFunctionals()
+            lf.add_volume_average('vol_avg', self, grid=grid, npts=npts)
+            lf.add_peaking_core('core', self)
+            res = lf.evaluate(self, **predict_kwargs)
+            mean_vol_avg = res['mean_vol_avg'][0]
+            mean_core = res['mean_core'][0]
+            mean = mean_core / mean_vol_avg
             if return_std:
-                mean_res = res[0]
-                cov_res = res[1]
-                mean = mean_res[1] / mean_res[0]
                 std = scipy.sqrt(
-                    cov_res[1, 1] / mean_res[0]**2 +
-                    cov_res[0, 0] * mean_res[1]**2 / mean_res[0]**4 -
-                    2.0 * cov_res[0, 1] * mean_res[1] / mean_res[0]**3
+                    res['cov_core'][0, 0] / mean_vol_avg**2 +
+                    res['cov_vol_avg'][0, 0] * mean_core**2 / mean_vol_avg**4 -
+                    2.0 * lf.cross_cov(res, 'vol_avg', 'core')[0, 0] * mean_core / mean_vol_avg**3
                 )
                 return (mean, std)
             else:
-                return res[1] / res[0]
+                return mean
         else:
             raise NotImplementedError("Computation of peaking factors not yet "
                                       "supported for X_dim > 1!")
 
+class PlasmaFitPredictor(FitPredictor):
+    """:py:class:`FitPredictor` for a :py:class:`BivariatePlasmaProfile`, which can also compute a/L.
+    
+    The derivative of the abscissa with respect to r/a which
+    :py:meth:`compute_a_over_L` needs is tabulated from EFIT when the
+    predictor is made and is linearly interpolated afterwards, so the
+    predictor never needs MDSplus or EFIT. Note that :py:meth:`compute_a_over_L`
+    cannot be called with `force_update` set, and that the `ddof` used for the
+    variance of the geometry over time is fixed when the predictor is made.
+    
+    Parameters
+    ----------
+    p : :py:class:`BivariatePlasmaProfile`
+        The profile whose Gaussian process is used. It must already have been
+        fit.
+    grid : array, (`M`,), optional
+        The values of the abscissa to tabulate the EFIT geometry at. Only used
+        if the abscissa is not r/a or Rmid. Default is 400 points spanning the
+        range 0 <= r/a <= 2 which EFIT is mapped over, converted to the
+        abscissa. :py:meth:`compute_a_over_L` raises a :py:class:`ValueError`
+        for points outside of the grid.
+    ddof : int, optional
+        The degree of freedom correction used for the variance of the geometry
+        over time. Default is 1.
+    """
+    def __init__(self, p, grid=None, ddof=1):
+        super(PlasmaFitPredictor, self).__init__(
+            p.gp, p.X_dim, p.X_units, p.y_units, p.X_labels, p.y_label
+        )
+        self.abscissa = p.abscissa
+        for k in ('shot', 't_min', 't_max', 'times'):
+            if hasattr(p, k):
+                setattr(self, k, getattr(p, k))
+        if p.abscissa in ('r/a', 'Rmid'):
+            # The geometry does not depend on the abscissa:
+            self._grid = None
+            self._dX_droa = p._get_dX_droa(scipy.zeros(1), compute_2=True, ddof=ddof)
+        else:
+            if grid is None:
+                # Only go as far out as EFIT maps at every time slice, but
+                # always cover the data:
+                t_efit = p.efit_tree.getTimeBase()[
+                    p._get_efit_times_to_average(return_idxs=True)
+                ]
+                roa_grid = scipy.linspace(0, 2, 3 * len(p.efit_tree.getRGrid()))
+                X_max = min(
+                    scipy.nanmax(p.efit_tree.roa2rho(p.abscissa, roa_grid, t))
+                    for t in scipy.atleast_1d(t_efit)
+                )
+                grid = scipy.linspace(0, max(X_max, self.gp.X[:, -1].max()), 400)
+            self._grid = scipy.sort(scipy.asarray(grid, dtype=float))
+            self._dX_droa = p._get_dX_droa(self._grid, compute_2=True, ddof=ddof)
+    
+    # The computation itself is the same as for the profile, the geometry just
+    # comes from the tables:
+    compute_a_over_L = BivariatePlasmaProfile.__dict__['compute_a_over_L']
+    
+    def _get_dX_droa(self, X, compute_2=False, ddof=1):
+        """Interpolate the tabulated derivative of the abscissa with respect to r/a.
+        
+        Takes the same parameters and returns the same values as
+        :py:meth:`BivariatePlasmaProfile._get_dX_droa`, except that `ddof` is
+        ignored. Raises a :py:class:`ValueError` if `X` is outside of the
+        tabulated grid, since the values would otherwise be clamped to the end
+        points.
+        """
+        if self._grid is None:
+            vals = list(self._dX_droa)
+        else:
+            X = scipy.asarray(X, dtype=float)
+            if (X < self._grid[0]).any() or (X > self._grid[-1]).any():
+                raise ValueError(
+                    "X must be within the range [%g, %g] the EFIT geometry was "
+                    "tabulated over. Make the predictor with a larger grid!"
+                    % (self._grid[0], self._grid[-1])
+                )
+            vals = [scipy.interp(X, self._grid, v) for v in self._dX_droa]
+        if not compute_2:
+            vals[2:] = [None] * 3
+        return tuple(vals)
+
 def neCTS(shot, abscissa='RZ', t_min=None, t_max=None, electrons=None,
           efit_tree=None, remove_edge=False, remove_zeros=True, Z_shift=0.0):
     """Returns a profile representing electron density from the core Thomson scattering system.
@@ -1280,7 +1741,8 @@ def neCTS(shot, abscissa='RZ', t_min=None, t_max=None, electrons=None,
     
     p.add_data(X, ne, err_y=err_ne, channels={1: channels, 2: channels})
     
-    # Remove flagged points:
+    # Flag the bad points, then remove them all with a single copy:
+    t_data = scipy.asarray(p.X[:, 0]).flatten()
     p.remove_points(
         scipy.isnan(p.err_y) |
         scipy.isinf(p.err_y) |
@@ -1289,12 +1751,14 @@ def neCTS(shot, abscissa='RZ', t_min=None, t_max=None, electrons=None,
         (p.err_y == 2.0) |
         ((p.y == 0.0) & remove_zeros) |
         scipy.isnan(p.y) |
-        scipy.isinf(p.y)
+        scipy.isinf(p.y),
+        defer=True
     )
     if t_min is not None:
-        p.remove_points(scipy.asarray(p.X[:, 0]).flatten() < t_min)
+        p.remove_points(t_data < t_min, defer=True)
     if t_max is not None:
-        p.remove_points(scipy.asarray(p.X[:, 0]).flatten() > t_max)
+        p.remove_points(t_data > t_max, defer=True)
+    p.compact()
     p.convert_abscissa(abscissa)
     
     if remove_edge:
@@ -1374,11 +1838,12 @@ def neETS(shot, abscissa='RZ', t_min=None, t_max=None, electrons=None,
     p.abscissa = 'RZ'
     
     p.add_data(X, ne, err_y=err_ne, channels={1: channels, 2: channels})
-    # Remove flagged points:
+    # Flag the bad points, then remove them all with a single copy:
     try:
         pm = electrons.getNode(r'yag_edgets.data:pointmask').data().flatten()
     except:
         pm = scipy.ones_like(p.y)
+    t_data = scipy.asarray(p.X[:, 0]).flatten()
     p.remove_points(
         (pm == 0) |
         scipy.isnan(p.err_y) |
@@ -1388,12 +1853,14 @@ def neETS(shot, abscissa='RZ', t_min=None, t_max=None, electrons=None,
         (p.err_y == 2.0) |
         ((p.y == 0.0) & remove_zeros) |
         scipy.isnan(p.y) |
-        scipy.isinf(p.y)
+        scipy.isinf(p.y),
+        defer=True
     )
     if t_min is not None:
-        p.remove_points(scipy.asarray(p.X[:, 0]).flatten() < t_min)
+        p.remove_points(t_data < t_min, defer=True)
     if t_max is not None:
-        p.remove_points(scipy.asarray(p.X[:, 0]).flatten() > t_max)
+        p.remove_points(t_data > t_max, defer=True)
+    p.compact()
     p.convert_abscissa(abscissa)
     
     if remove_edge:
@@ -1493,6 +1960,11 @@ def neTCI(shot, abscissa='r/a', t_min=None, t_max=None, electrons=None,
     # Set these to None here to solve the fencepost problem:
     T = None
     mask = None
+    # All of the chords share the same time base, so they are gathered and
+    # stored together:
+    chords = []
+    ne_chords = []
+    good_chords = []
     for i, r in enumerate(R):
         N_NL = electrons.getNode(r'tci.results:nl_%02d' % (i + 1,))
         ne = N_NL.data()
@@ -1527,26 +1999,27 @@ def neTCI(shot, abscissa='r/a', t_min=None, t_max=None, electrons=None,
         
         good = ne >= flag_threshold
         
-        t_ne = t_ne[good]
-        
-        if len(t_ne) > 0:
-            ne = ne[good]
-            # not all channels are active, catch that when putting in the channel transforms and coords
-            X = scipy.ones((len(t_ne), len(quad_points), 2))
-            X = scipy.einsum('i,ijk->ijk', t_ne, X)
-            X[:, :, 1] = quad_points
-                       
-            p.transformed = scipy.append(
-                p.transformed,
-                Channel(
-                    X,
-                    ne / 1e20,
-                    err_y=0.1 * ne / 1e20,
-                    T=T[good, i, :],
-                    y_label='$nL_{%02d}$' % (i + 1,),
-                    y_units='$10^{20}$ m$^{-2}$'
-                )
-            )
+        # not all channels are active, catch that when putting in the channel transforms and coords
+        if good.any():
+            chords.append(i)
+            ne_chords.append(ne)
+            good_chords.append(good)
+            t_chords = t_ne
+    
+    if len(chords) > 0:
+        X = scipy.empty((len(chords), len(t_chords), len(quad_points), 2))
+        X[:, :, :, 0] = t_chords[None, :, None]
+        X[:, :, :, 1] = quad_points
+        ne = scipy.asarray(ne_chords) / 1e20
+        p.transformed = TransformedSet(
+            X,
+            ne,
+            err_y=0.1 * ne,
+            T=scipy.swapaxes(T[:, chords, :], 0, 1),
+            mask=scipy.asarray(good_chords),
+            y_labels=['$nL_{%02d}$' % (i + 1,) for i in chords],
+            y_units=['$10^{20}$ m$^{-2}$'] * len(chords)
+        )
     
     return p
 
@@ -1608,6 +2081,7 @@ def neTCI_old(shot, abscissa='RZ', t_min=None, t_max=None, electrons=None,
     weights *= (Z.max() - Z.min()) / (2 * (len(Z) - 1))
     
     mask = None
+    channels = []
     for i, r in zip(list(range(0, len(R))), R):
         N_NL = electrons.getNode(r'tci.results:nl_%02d' % (i + 1,))
         ne = N_NL.data()
@@ -1627,8 +2101,7 @@ def neTCI_old(shot, abscissa='RZ', t_min=None, t_max=None, electrons=None,
             X[:, :, 2] = Z
             T = scipy.tile(weights, (len(t_ne), 1))
             
-            p.transformed = scipy.append(
-                p.transformed,
+            channels.append(
                 Channel(
                     X,
                     ne / 1e20,
@@ -1638,6 +2111,7 @@ def neTCI_old(shot, abscissa='RZ', t_min=None, t_max=None, electrons=None,
                     y_units='$10^{20}$ m$^{-2}$'
                 )
             )
+    p.transformed = TransformedSet.from_channels(channels)
     
     p.shot = shot
     p.convert_abscissa(abscissa)
@@ -1711,12 +2185,14 @@ def neReflect(shot, abscissa='Rmid', t_min=None, t_max=None, electrons=None,
 
     p.add_data(X, ne, channels={1: channels}, err_y=0.1 * scipy.absolute(ne))
     
-    # Remove flagged points:
-    p.remove_points(p.y == 0)
+    # Flag the bad points, then remove them all with a single copy:
+    t_data = scipy.asarray(p.X[:, 0]).flatten()
+    p.remove_points(p.y == 0, defer=True)
     if t_min is not None:
-        p.remove_points(scipy.asarray(p.X[:, 0]).flatten() < t_min)
+        p.remove_points(t_data < t_min, defer=True)
     if t_max is not None:
-        p.remove_points(scipy.asarray(p.X[:, 0]).flatten() > t_max)
+        p.remove_points(t_data > t_max, defer=True)
+    p.compact()
 
     p.convert_abscissa(abscissa)
 
@@ -1774,10 +2250,11 @@ def ne(shot, include=['CTS', 'ETS'], TCI_quad_points=None, TCI_flag_threshold=No
         else:
             raise ValueError("Unknown profile '%s'." % (system,))
     
-    p = p_list.pop()
-    for p_other in p_list:
-        p.add_profile(p_other)
-
+    # The last profile is the base, as with absorbing the rest into it in turn:
+    p = BivariatePlasmaProfile.concat([p_list[-1]] + p_list[:-1])
+    # Identify the combination when keying a HyperparameterStore:
+    p.signal = 'ne'
+    p.systems = list(include)
     return p
 
 def neTS(shot, **kwargs):
@@ -1857,7 +2334,8 @@ def TeCTS(shot, abscissa='RZ', t_min=None, t_max=None, electrons=None,
     p.abscissa = 'RZ'
     
     p.add_data(X, Te, err_y=err_Te, channels={1: channels, 2: channels})
-    # Remove flagged points:
+    # Flag the bad points, then remove them all with a single copy:
+    t_data = scipy.asarray(p.X[:, 0]).flatten()
     p.remove_points(
         scipy.isnan(p.err_y) |
         scipy.isinf(p.err_y) |
@@ -1865,12 +2343,14 @@ def TeCTS(shot, abscissa='RZ', t_min=None, t_max=None, electrons=None,
         (p.err_y == 1.0) |
         ((p.y == 0.0) & remove_zeros) |
         scipy.isnan(p.y) |
-        scipy.isinf(p.y)
+        scipy.isinf(p.y),
+        defer=True
     )
     if t_min is not None:
-        p.remove_points(scipy.asarray(p.X[:, 0]).flatten() < t_min)
+        p.remove_points(t_data < t_min, defer=True)
     if t_max is not None:
-        p.remove_points(scipy.asarray(p.X[:, 0]).flatten() > t_max)
+        p.remove_points(t_data > t_max, defer=True)
+    p.compact()
     p.convert_abscissa(abscissa)
     
     if remove_edge:
@@ -1950,11 +2430,12 @@ def TeETS(shot, abscissa='RZ', t_min=None, t_max=None, electrons=None,
     p.abscissa = 'RZ'
     
     p.add_data(X, Te, err_y=err_Te, channels={1: channels, 2: channels})
-    # Remove flagged points:
+    # Flag the bad points, then remove them all with a single copy:
     try:
         pm = electrons.getNode(r'yag_edgets.data:pointmask').data().flatten()
     except:
         pm = scipy.ones_like(p.y)
+    t_data = scipy.asarray(p.X[:, 0]).flatten()
     p.remove_points(
         (pm == 0) |
         scipy.isnan(p.err_y) |
@@ -1965,13 +2446,15 @@ def TeETS(shot, abscissa='RZ', t_min=None, t_max=None, electrons=None,
         ((p.y == 0.0) & remove_zeros) |
         ((p.y == 0.0) & (p.err_y == 0.029999999329447746)) | # This seems to be an old way of flagging. Could be risky...
         scipy.isnan(p.y) |
-        scipy.isinf(p.y) 
+        scipy.isinf(p.y),
+        defer=True
     )
     
     if t_min is not None:
-        p.remove_points(scipy.asarray(p.X[:, 0]).flatten() < t_min)
+        p.remove_points(t_data < t_min, defer=True)
     if t_max is not None:
-        p.remove_points(scipy.asarray(p.X[:, 0]).flatten() > t_max)
+        p.remove_points(t_data > t_max, defer=True)
+    p.compact()
     p.convert_abscissa(abscissa)
     
     if remove_edge:
@@ -1980,7 +2463,7 @@ def TeETS(shot, abscissa='RZ', t_min=None, t_max=None, electrons=None,
     return p
 
 def TeFRCECE(shot, rate='s', cutoff=0.15, abscissa='Rmid', t_min=None, t_max=None,
-             electrons=None, efit_tree=None, remove_edge=False):
+             electrons=None, efit_tree=None, remove_edge=False, dtype=float):
     """Returns a profile representing electron temperature from the FRCECE system.
     
     Parameters
@@ -2007,6 +2490,11 @@ def TeFRCECE(shot, rate='s', cutoff=0.15, abscissa='Rmid', t_min=None, t_max=Non
     remove_edge : bool, optional
         If True, will remove points that are outside the LCFS. It will convert
         the abscissa to psinorm if necessary. Default is False (keep edge).
+    dtype : floating point dtype, optional
+        The type to store the data as. Use :py:class:`scipy.float32` to halve
+        the memory needed, which is significant for the fast data. The data
+        are promoted to double precision when the Gaussian process is built.
+        Default is float (double precision).
     """
     p = BivariatePlasmaProfile(
         X_dim=2,
@@ -2014,7 +2502,8 @@ def TeFRCECE(shot, rate='s', cutoff=0.15, abscissa='Rmid', t_min=None, t_max=Non
         y_units='keV',
         X_labels=['$t$', r'$R_{mid}$'],
         y_label=r'$T_e$, FRCECE (%s)' % (rate,),
-        weightable=False
+        weightable=False,
+        dtype=dtype
     )
 
     if electrons is None:
@@ -2056,13 +2545,15 @@ def TeFRCECE(shot, rate='s', cutoff=0.15, abscissa='Rmid', t_min=None, t_max=Non
     p.abscissa = 'Rmid'
     
     p.add_data(X, Te, channels={1: scipy.asarray(channels)}, err_y=0.1 * scipy.absolute(Te))
-    # Remove flagged points:
+    # Flag the bad points, then remove them all with a single copy:
     # I think these are cut off channels, but I am not sure...
-    p.remove_points(p.y < cutoff)
+    t_data = scipy.asarray(p.X[:, 0]).flatten()
+    p.remove_points(p.y < cutoff, defer=True)
     if t_min is not None:
-        p.remove_points(scipy.asarray(p.X[:, 0]).flatten() < t_min)
+        p.remove_points(t_data < t_min, defer=True)
     if t_max is not None:
-        p.remove_points(scipy.asarray(p.X[:, 0]).flatten() > t_max)
+        p.remove_points(t_data > t_max, defer=True)
+    p.compact()
     p.convert_abscissa(abscissa)
 
     if remove_edge:
@@ -2139,12 +2630,14 @@ def TeGPC2(shot, abscissa='Rmid', t_min=None, t_max=None, electrons=None,
 
     p.add_data(X, Te, channels={1: channels}, err_y=0.1 * scipy.absolute(Te))
     
-    # Remove flagged points:
-    p.remove_points(p.y <= 0)
+    # Flag the bad points, then remove them all with a single copy:
+    t_data = scipy.asarray(p.X[:, 0]).flatten()
+    p.remove_points(p.y <= 0, defer=True)
     if t_min is not None:
-        p.remove_points(scipy.asarray(p.X[:, 0]).flatten() < t_min)
+        p.remove_points(t_data < t_min, defer=True)
     if t_max is not None:
-        p.remove_points(scipy.asarray(p.X[:, 0]).flatten() > t_max)
+        p.remove_points(t_data > t_max, defer=True)
+    p.compact()
 
     p.convert_abscissa(abscissa)
 
@@ -2226,13 +2719,15 @@ def TeGPC(shot, cutoff=0.15, abscissa='Rmid', t_min=None, t_max=None, electrons=
     
     p.add_data(X, Te, channels={1: scipy.asarray(channels)}, err_y=0.1 * scipy.absolute(Te))
     
-    # Remove flagged points:
+    # Flag the bad points, then remove them all with a single copy:
     # I think these are cut off channels, but I am not sure...
-    p.remove_points(p.y < cutoff)
+    t_data = scipy.asarray(p.X[:, 0]).flatten()
+    p.remove_points(p.y < cutoff, defer=True)
     if t_min is not None:
-        p.remove_points(scipy.asarray(p.X[:, 0]).flatten() < t_min)
+        p.remove_points(t_data < t_min, defer=True)
     if t_max is not None:
-        p.remove_points(scipy.asarray(p.X[:, 0]).flatten() > t_max)
+        p.remove_points(t_data > t_max, defer=True)
+    p.compact()
 
     p.convert_abscissa(abscissa)
 
@@ -2242,7 +2737,8 @@ def TeGPC(shot, cutoff=0.15, abscissa='Rmid', t_min=None, t_max=None, electrons=
     return p
 
 def TeMic(shot, cutoff=0.15, abscissa='Rmid', t_min=None, t_max=None,
-          electrons=None, efit_tree=None, remove_edge=False, remove_zeros=True):
+          electrons=None, efit_tree=None, remove_edge=False, remove_zeros=True,
+          dtype=float):
     """Returns a profile representing electron temperature from the Michelson interferometer.
 
     Parameters
@@ -2264,6 +2760,10 @@ def TeMic(shot, cutoff=0.15, abscissa='Rmid', t_min=None, t_max=None,
     remove_edge : bool, optional
         If True, will remove points that are outside the LCFS. It will convert
         the abscissa to psinorm if necessary. Default is False (keep edge).
+    dtype : floating point dtype, optional
+        The type to store the data as. Use :py:class:`scipy.float32` to halve
+        the memory needed. The data are promoted to double precision when the
+        Gaussian process is built. Default is float (double precision).
     """
     p = BivariatePlasmaProfile(
         X_dim=2,
@@ -2271,7 +2771,8 @@ def TeMic(shot, cutoff=0.15, abscissa='Rmid', t_min=None, t_max=None,
         y_units='keV',
         X_labels=['$t$', r'$R_{mid}$'],
         y_label=r'$T_e$, Mic',
-        weightable=False
+        weightable=False,
+        dtype=dtype
     )
     
     if electrons is None:
@@ -2305,15 +2806,18 @@ def TeMic(shot, cutoff=0.15, abscissa='Rmid', t_min=None, t_max=None,
     p.abscissa = 'Rmid'
     
     p.add_data(X, Te, err_y=err_Te, channels={1: channels})
-    # Remove flagged points:
-    p.remove_points(scipy.isnan(p.err_y) | scipy.isinf(p.err_y))
-    p.remove_points(p.y < cutoff)
+    # Flag the bad points, then remove them all with a single copy:
+    t_data = scipy.asarray(p.X[:, 0]).flatten()
+    y = p.y
+    p.remove_points(scipy.isnan(p.err_y) | scipy.isinf(p.err_y), defer=True)
+    p.remove_points(y < cutoff, defer=True)
     if remove_zeros:
-        p.remove_points(p.y == 0.0)
+        p.remove_points(y == 0.0, defer=True)
     if t_min is not None:
-        p.remove_points(scipy.asarray(p.X[:, 0]).flatten() < t_min)
+        p.remove_points(t_data < t_min, defer=True)
     if t_max is not None:
-        p.remove_points(scipy.asarray(p.X[:, 0]).flatten() > t_max)
+        p.remove_points(t_data > t_max, defer=True)
+    p.compact()
     p.convert_abscissa(abscissa)
     
     if remove_edge:
@@ -2388,10 +2892,11 @@ def Te(shot, include=['CTS', 'ETS', 'FRCECE', 'GPC2', 'GPC', 'Mic'], FRCECE_rate
         else:
             raise ValueError("Unknown profile '%s'." % (system,))
     
-    p = p_list.pop()
-    for p_other in p_list:
-        p.add_profile(p_other)
-    
+    # The last profile is the base, as with absorbing the rest into it in turn:
+    p = BivariatePlasmaProfile.concat([p_list[-1]] + p_list[:-1])
+    # Identify the combination when keying a HyperparameterStore:
+    p.signal = 'Te'
+    p.systems = list(include)
     return p
 
 def TeTS(shot, **kwargs):
@@ -2476,11 +2981,13 @@ def emissAX(shot, system, abscissa='Rmid', t_min=None, t_max=None, tree=None,
     p.channels = scipy.tile(scipy.arange(0, len(p.y)), (X.shape[1], 1)).T
     p.channels[:, 1] = channels.ravel()
     
-    # Remove flagged points:
+    # Flag the bad points, then remove them all with a single copy:
+    t_data = scipy.asarray(p.X[:, 0]).flatten()
     if t_min is not None:
-        p.remove_points(scipy.asarray(p.X[:, 0]).flatten() < t_min)
+        p.remove_points(t_data < t_min, defer=True)
     if t_max is not None:
-        p.remove_points(scipy.asarray(p.X[:, 0]).flatten() > t_max)
+        p.remove_points(t_data > t_max, defer=True)
+    p.compact()
     
     p.convert_abscissa(abscissa)
     
@@ -2515,10 +3022,11 @@ def emiss(shot, include=['AXA', 'AXJ'], **kwargs):
         else:
             raise ValueError("Unknown profile '%s'." % (system,))
     
-    p = p_list.pop()
-    for p_other in p_list:
-        p.add_profile(p_other)
-    
+    # The last profile is the base, as with absorbing the rest into it in turn:
+    p = BivariatePlasmaProfile.concat([p_list[-1]] + p_list[:-1])
+    # Identify the combination when keying a HyperparameterStore:
+    p.signal = 'emiss'
+    p.systems = list(include)
     return p
 
 def read_plasma_csv(*args, **kwargs):
@@ -2547,21 +3055,56 @@ def read_plasma_csv(*args, **kwargs):
     entries in X_labels to be R and Z once surrounding dollar signs and spaces
     are removed.
     
-    Parameters are the same as :py:func:`read_csv`.
+    Points outside of the time window given by the keywords `t_min` and
+    `t_max` are discarded while the file is being parsed, and the window is
+    stored in the corresponding attributes.
+    
+    The remaining parameters are the same as :py:func:`read_csv`.
+    
+    Parameters
+    ----------
+    t_min : float, optional
+        The smallest time to include. Default is to include all times.
+    t_max : float, optional
+        The largest time to include. Default is to include all times.
     """
     # TODO: Does not support transformed quantities!
+    t_min = kwargs.pop('t_min', None)
+    t_max = kwargs.pop('t_max', None)
+    if t_min is not None or t_max is not None:
+        row_filter = kwargs.pop('row_filter', None)
+        def time_filter(X, y):
+            keep = scipy.ones(len(y), dtype=bool)
+            if t_min is not None:
+                keep &= X[:, 0] >= t_min
+            if t_max is not None:
+                keep &= X[:, 0] <= t_max
+            if row_filter is not None:
+                keep &= scipy.asarray(row_filter(X, y), dtype=bool)
+            return keep
+        kwargs['row_filter'] = time_filter
     p = read_csv(*args, **kwargs)
     p.__class__ = BivariatePlasmaProfile
     metadata = dict([l.split(None, 1) for l in p.metadata])
     if 'shot' in metadata:
         p.shot = int(metadata['shot'])
-        p.efit_tree = eqtools.CModEFITTree(p.shot)
+        with _tree_lock:
+            p.efit_tree = eqtools.CModEFITTree(p.shot)
     if 'times' in metadata:
         p.times = [float(t) for t in metadata['times'].split(',')]
     if 't_max' in metadata:
         p.t_max = float(metadata['t_max'])
     if 't_min' in metadata:
         p.t_min = float(metadata['t_min'])
+    if t_min is not None:
+        p.t_min = t_min if 't_min' not in metadata else max(p.t_min, t_min)
+    if t_max is not None:
+        p.t_max = t_max if 't_max' not in metadata else min(p.t_max, t_max)
+    if 'times' in metadata and (t_min is not None or t_max is not None):
+        p.times = [
+            t for t in p.times
+            if (t_min is None or t >= t_min) and (t_max is None or t <= t_max)
+        ]
     if 'coordinate' in metadata:
         p.abscissa = metadata['coordinate']
     else:
@@ -2597,15 +3140,35 @@ def read_plasma_NetCDF(*args, **kwargs):
     entries in X_labels to be R and Z once surrounding dollar signs and spaces
     are removed.
     
-    Parameters are the same as :py:func:`read_NetCDF`.
+    Only the points inside of the time window given by the keywords `t_min`
+    and `t_max` are read from the file, and the window is stored in the
+    corresponding attributes.
+    
+    The remaining parameters are the same as :py:func:`read_NetCDF`.
+    
+    Parameters
+    ----------
+    t_min : float, optional
+        The smallest time to include. Default is to include all times.
+    t_max : float, optional
+        The largest time to include. Default is to include all times.
     """
     # TODO: Does not support transformed quantities!
     metadata = kwargs.pop('metadata', [])
-    metadata = set(metadata + ['shot', 'times', 't_max', 't_min', 'coordinate'])
+    metadata = set(list(metadata) + ['shot', 'times', 't_max', 't_min', 'coordinate'])
+    t_min = kwargs.pop('t_min', None)
+    t_max = kwargs.pop('t_max', None)
+    if t_min is not None or t_max is not None:
+        kwargs['window'] = (t_min, t_max)
     p = read_NetCDF(*args, metadata=metadata, **kwargs)
     p.__class__ = BivariatePlasmaProfile
     if hasattr(p, 'shot'):
-        p.efit_tree = eqtools.CModEFITTree(p.shot)
+        with _tree_lock:
+            p.efit_tree = eqtools.CModEFITTree(p.shot)
+    if t_min is not None:
+        p.t_min = max(p.t_min, t_min) if hasattr(p, 't_min') else t_min
+    if t_max is not None:
+        p.t_max = min(p.t_max, t_max) if hasattr(p, 't_max') else t_max
     if hasattr(p, 'coordinate'):
         p.abscissa = p.coordinate
     else:
@@ -2619,3 +3182,92 @@ def read_plasma_NetCDF(*args, **kwargs):
                 p.abscissa = p.X_labels[-1].strip('$ ')
     
     return p
+
+def read_plasma_files(files, abscissa=None, num_threads=None, **kwargs):
+    """Returns a profile containing the data from several files.
+    
+    Each file is read with :py:func:`read_plasma_csv`,
+    :py:func:`read_plasma_NetCDF` or :py:func:`read_plasma_npz` according to
+    its extension, and the data are streamed into a single profile as
+    described in :py:func:`read_files`. The shot, EFIT tree and other metadata
+    are those of the first file, and the time window is widened to cover all
+    of the files.
+    
+    Parameters
+    ----------
+    files : str or list of str
+        Either a list of the paths of the files to read, or a glob pattern
+        matching them, in which case they are read in sorted order.
+    abscissa : str, optional
+        The abscissa to convert the data of every file to as it is read.
+        Default is to require all of the files to use the same abscissa.
+    num_threads : positive int, optional
+        If given, the files are read by a pool of this many threads. Only the
+        parsing of the files runs in parallel: the EFIT trees are opened and
+        the abscissa is converted by one thread at a time. Default is to read
+        them one at a time in the calling thread.
+    **kwargs : optional
+        All additional kwargs are passed to the reader for each file.
+    """
+    # Per-file metadata, keyed by file name since the reads may be threaded:
+    info = {}
+    
+    def reader(filename, **kwargs):
+        ext = os.path.splitext(filename)[1].lower()
+        if ext == '.csv':
+            p = read_plasma_csv(filename, **kwargs)
+        elif ext == '.npz':
+            p = read_plasma_npz(filename, **kwargs)
+        else:
+            p = read_plasma_NetCDF(filename, **kwargs)
+        if abscissa is not None:
+            with _tree_lock:
+                p.convert_abscissa(abscissa)
+        info[filename] = (
+            getattr(p, 'shot', None),
+            p.abscissa,
+            p.y_label,
+            getattr(p, 't_min', None),
+            getattr(p, 't_max', None)
+        )
+        return p
+    
+    p = read_files(files, reader=reader, num_threads=num_threads, **kwargs)
+    
+    shots = set([v[0] for v in info.values() if v[0] is not None])
+    if len(shots) > 1:
+        warnings.warn("Merging data from %d different shots: %s"
+                      % (len(shots), ', '.join([str(s) for s in sorted(shots)])))
+    for filename, v in info.items():
+        if v[1] != p.abscissa:
+            raise ValueError("Abscissa %s of file %s does not match abscissa %s "
+                             "of file %s!" % (v[1], filename, p.abscissa, p.sources[0]))
+    # Split off the diagnostic description when merging profiles:
+    if len(set([v[2] for v in info.values()])) > 1:
+        p.y_label = p.y_label.split(', ')[0]
+    t_mins = [v[3] for v in info.values() if v[3] is not None]
+    if t_mins:
+        p.t_min = min(t_mins)
+    t_maxs = [v[4] for v in info.values() if v[4] is not None]
+    if t_maxs:
+        p.t_max = max(t_maxs)
+    
+    return p
+
+def read_plasma_npz(*args, **kwargs):
+    """Returns a profile containing the data from a .npz file.
+    
+    The file should have been written with :py:meth:`Profile.write_npz`, which
+    stores the shot, time window, abscissa and all other metadata along with
+    the data and transformed quantities, so these are restored exactly. The
+    EFIT tree is remade from the shot number.
+    
+    Parameters are the same as :py:func:`read_npz`.
+    """
+    p = read_npz(*args, **kwargs)
+    p.__class__ = BivariatePlasmaProfile
+    if hasattr(p, 'shot'):
+        with _tree_lock:
+            p.efit_tree = eqtools.CModEFITTree(p.shot)
+    
+    return p
@@ -27,6 +27,13 @@ import scipy
 import scipy.stats
 import scipy.io
 import scipy.linalg
+import scipy.sparse
+import scipy.optimize
+try:
+    import scipy.stats.qmc
+except ImportError:
+    # Only available in scipy 1.7 and later, and only needed for Sobol starts:
+    pass
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 import gptools
@@ -36,6 +43,22 @@ import csv
 import warnings
 import re
 import copy
+import time
+import glob
+import io
+import itertools
+import collections
+import multiprocessing.pool
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Only available in Python 3.8 and later:
+    shared_memory = None
+import pickle
+import json
+import struct
+import zipfile
+import numpy.lib.format
 
 def average_points(X, y, err_X, err_y, T=None, ddof=1, robust=False,
                    y_method='sample', X_method='sample', weighted=False):
@@ -214,6 +237,161 @@ def average_points(X, y, err_X, err_y, T=None, ddof=1, robust=False,
     
     return (mean_X, mean_y, err_X, err_y, T)
 
+def average_groups(X, y, err_X, err_y, order, starts, ddof=1, robust=False,
+                   y_method='sample', X_method='sample', weighted=False):
+    """Average many groups of points at once.
+    
+    This gives the same result as calling :py:func:`average_points` on each
+    group in turn, but the points are only sorted once and the sums needed by
+    the (weighted) mean and variance of every group are formed with
+    :py:meth:`ufunc.reduceat`. The robust estimators are still evaluated one
+    group at a time, but on contiguous slices of the sorted data.
+    
+    Parameters
+    ----------
+    X : array, (`M`, `D`)
+        Abscissa values to average.
+    y : array, (`M`)
+        Data values to average.
+    err_X : array, same shape as `X`
+        Uncertainty in `X`.
+    err_y : array, same shape as `y`
+        Uncertainty in `y`.
+    order : array of int, (`M`,)
+        Indices which sort the points by group, as returned by
+        :py:func:`group_rows`.
+    starts : array of int, (`P`,)
+        The index into `order` of the first point in each group, as returned
+        by :py:func:`group_rows`.
+    
+    All other parameters are the same as :py:func:`average_points`.
+    
+    Returns
+    -------
+    mean_X : array, (`P`, `D`)
+        Mean of abscissa values.
+    mean_y : array, (`P`,)
+        Mean of data values.
+    err_X : array, same shape as `mean_X`
+        Uncertainty in abscissa values.
+    err_y : array, (`P`,)
+        Uncertainty in data values.
+    """
+    allowed_methods = ['sample', 'RMS', 'total', 'of mean', 'of mean sample']
+    if y_method not in allowed_methods:
+        raise ValueError("Unsupported y_method '%s'!" % (y_method,))
+    if X_method not in allowed_methods:
+        raise ValueError("Unsupported X_method '%s'!" % (X_method,))
+    
+    X = scipy.asarray(X, dtype=float)[order]
+    y = scipy.asarray(y, dtype=float)[order]
+    err_X = scipy.asarray(err_X, dtype=float)[order]
+    err_y = scipy.asarray(err_y, dtype=float)[order]
+    starts = scipy.asarray(starts, dtype=int)
+    n = scipy.diff(scipy.append(starts, len(y)))
+    
+    if len(starts) == 0:
+        return (
+            scipy.zeros((0, X.shape[1])),
+            scipy.zeros(0),
+            scipy.zeros((0, X.shape[1])),
+            scipy.zeros(0)
+        )
+    
+    if robust:
+        mean_X = scipy.zeros((len(starts), X.shape[1]))
+        mean_y = scipy.zeros(len(starts))
+        err_X_out = scipy.zeros_like(mean_X)
+        err_y_out = scipy.zeros_like(mean_y)
+        for i, (s, m) in enumerate(zip(starts, n)):
+            mean_X[i, :], mean_y[i], err_X_out[i, :], err_y_out[i], dum = average_points(
+                X[s:s + m, :],
+                y[s:s + m],
+                err_X[s:s + m, :],
+                err_y[s:s + m],
+                ddof=ddof,
+                robust=True,
+                y_method=y_method,
+                X_method=X_method,
+                weighted=weighted
+            )
+        return (mean_X, mean_y, err_X_out, err_y_out)
+    
+    # Index of the group each (sorted) point belongs to:
+    seg = scipy.repeat(scipy.arange(len(starts)), n)
+    
+    # Groups with invalid weights fall back to equal weights, just like
+    # average_points does:
+    if weighted:
+        with scipy.errstate(divide='ignore', invalid='ignore'):
+            w = 1.0 / err_y**2
+        bad = scipy.add.reduceat((~scipy.isfinite(w)).astype(int), starts) > 0
+        if bad.any():
+            warnings.warn("Invalid weight, setting weights equal!")
+            w[bad[seg]] = 1.0
+        is_weighted = ~bad
+    else:
+        w = scipy.ones_like(y)
+        is_weighted = scipy.zeros(len(starts), dtype=bool)
+    
+    W = scipy.add.reduceat(w, starts)
+    W2 = scipy.add.reduceat(w**2, starts)
+    wc = w[:, None]
+    
+    with scipy.errstate(divide='ignore', invalid='ignore'):
+        # The unweighted variance always uses the Bessel correction, which is
+        # what the weighted form reduces to with equal weights:
+        if ddof:
+            var_factor = W / (W**2 - W2)
+        else:
+            var_factor = scipy.where(is_weighted, 1.0 / W, 1.0 / (n - 1))
+        var_factor[scipy.isinf(var_factor)] = scipy.nan
+        
+        # Process y:
+        mean_y = scipy.add.reduceat(w * y, starts) / W
+        var_y = var_factor * scipy.add.reduceat(w * (y - mean_y[seg])**2, starts)
+        if y_method == 'sample':
+            err_y_out = scipy.sqrt(var_y)
+        elif y_method == 'RMS':
+            err_y_out = scipy.sqrt(scipy.add.reduceat(w * err_y**2, starts) / W)
+        elif y_method == 'total':
+            err_y_out = scipy.sqrt(var_y + scipy.add.reduceat(w * err_y**2, starts) / W)
+        elif y_method == 'of mean':
+            err_y_out = scipy.where(
+                is_weighted,
+                W**(-0.5),
+                scipy.sqrt(scipy.add.reduceat(err_y**2, starts)) / n
+            )
+        elif y_method == 'of mean sample':
+            err_y_out = scipy.sqrt(W2) * scipy.sqrt(var_y) / W
+        
+        # Similar picture for X:
+        mean_X = scipy.add.reduceat(wc * X, starts, axis=0) / W[:, None]
+        var_X = var_factor[:, None] * scipy.add.reduceat(
+            wc * (X - mean_X[seg, :])**2, starts, axis=0
+        )
+        if X_method == 'sample':
+            err_X_out = scipy.sqrt(var_X)
+        elif X_method == 'RMS':
+            err_X_out = scipy.sqrt(scipy.add.reduceat(wc * err_X**2, starts, axis=0) / W[:, None])
+        elif X_method == 'total':
+            err_X_out = scipy.sqrt(
+                var_X + scipy.add.reduceat(wc * err_X**2, starts, axis=0) / W[:, None]
+            )
+        elif X_method == 'of mean':
+            err_X_out = scipy.sqrt(
+                scipy.add.reduceat(wc**2 * err_X**2, starts, axis=0)
+            ) / W[:, None]
+        elif X_method == 'of mean sample':
+            err_X_out = (scipy.sqrt(W2) / W)[:, None] * scipy.sqrt(var_X)
+    
+    # If there is only one member, just carry its uncertainty forward:
+    single = (n == 1)
+    err_y_out[single] = err_y[starts[single]]
+    err_X_out[single, :] = err_X[starts[single], :]
+    
+    return (mean_X, mean_y, err_X_out, err_y_out)
+
 class Channel(object):
     """Class to store data from a single channel.
     
@@ -284,7 +462,18 @@ class Channel(object):
             if T.shape[1] != X.shape[1]:
                 raise ValueError("Second dimension of T must match second dimension of X!")
         else:
-            T = scipy.eye(len(y))
+            # Untransformed data only need a single unit weight per point,
+            # rather than a dense (M, M) identity matrix. An (M, M, D) X is
+            # read as the identity transform, which only uses the points on the
+            # diagonal:
+            diagonal = X.shape[1] == len(y) and X.shape[1] != 1
+            if X.shape[1] != 1 and not diagonal:
+                raise ValueError(
+                    "X must have one point per observation or be (len(y), "
+                    "len(y), D) when T is not given! Shape of X given is %s."
+                    % (X.shape,)
+                )
+            T = scipy.ones((len(y), 1))
         
         # Process uncertainty in X:
         try:
@@ -306,6 +495,11 @@ class Channel(object):
         if (err_X < 0).any():
             raise ValueError("All elements of err_X must be non-negative!")
         
+        if T.shape[1] != X.shape[1]:
+            idx = scipy.arange(len(y))
+            X = X[idx, idx][:, None, :]
+            err_X = err_X[idx, idx][:, None, :]
+        
         self.X = X
         self.y = y
         self.err_X = err_X
@@ -423,6 +617,654 @@ class Channel(object):
         
         return (bad_X, bad_err_X, bad_y, bad_err_y, bad_T)
 
+class TransformedSet(object):
+    """Collection of linearly transformed quantities stored as padded arrays.
+    
+    The channels (for instance, the chords of an interferometer) are stored
+    together as one (channel, observation, quadrature point) tensor so that
+    operations on all of them are carried out with single vectorized calls.
+    Channel `c` consists of the first ``num_obs[c]`` observations and the first
+    ``num_quad[c]`` quadrature points of each array. Missing quadrature points
+    repeat the last one with zero weight, so they never enter the transform.
+    
+    Indexing with an integer and iterating give :py:class:`Channel` instances
+    whose arrays are views into this container, so modifying their elements in
+    place is reflected here. Indexing with a slice, boolean mask or array of
+    indices gives a new :py:class:`TransformedSet`.
+    
+    Parameters
+    ----------
+    X : array, (`C`, `M`, `N`, `D`), optional
+        Abscissa values of the quadrature points. Default is None (no
+        channels).
+    y : array, (`C`, `M`), optional
+        Data values.
+    err_X : array, same shape as `X`, optional
+        Uncertainty in `X`. Default is 0.
+    err_y : array, same shape as `y`, optional
+        Uncertainty in `y`. Default is 0.
+    T : array, (`C`, `M`, `N`), optional
+        Weights of the quadrature points of each observation.
+    mask : array of bool, (`C`, `M`), optional
+        Which observations are present in each channel. Default is to use all
+        of them.
+    num_quad : array of int, (`C`,), optional
+        The number of quadrature points used by each channel. Default is to use
+        all `N` of them.
+    y_labels : list of str, (`C`,), optional
+        Label for the `y` data of each channel. Default is empty strings.
+    y_units : list of str, (`C`,), optional
+        Units of the `y` data of each channel. Default is empty strings.
+    """
+    _array_names = ('X', 'err_X', 'y', 'err_y', 'T', 'num_obs', 'num_quad')
+    
+    def __init__(self, X=None, y=None, err_X=0, err_y=0, T=None, mask=None,
+                 num_quad=None, y_labels=None, y_units=None):
+        if X is None:
+            X = scipy.zeros((0, 0, 0, 0))
+            y = scipy.zeros((0, 0))
+            T = scipy.zeros((0, 0, 0))
+        X = scipy.asarray(X, dtype=float)
+        if X.ndim != 4:
+            raise ValueError(
+                "X must have exactly 4 dimensions! Shape of X given is %s."
+                % (X.shape,)
+            )
+        y = scipy.asarray(y, dtype=float)
+        T = scipy.asarray(T, dtype=float)
+        if y.shape != X.shape[:2]:
+            raise ValueError(
+                "Shape of y must be (C, M)! Shape of X given is %s, shape of y "
+                "is %s." % (X.shape, y.shape)
+            )
+        if T.shape != X.shape[:3]:
+            raise ValueError(
+                "Shape of T must be (C, M, N)! Shape of X given is %s, shape of "
+                "T is %s." % (X.shape, T.shape)
+            )
+        err_X = scipy.asarray(err_X, dtype=float) * scipy.ones_like(X)
+        err_y = scipy.asarray(err_y, dtype=float) * scipy.ones_like(y)
+        if (err_y < 0).any():
+            raise ValueError("All elements of err_y must be non-negative!")
+        if (err_X < 0).any():
+            raise ValueError("All elements of err_X must be non-negative!")
+        
+        num_channels = X.shape[0]
+        if num_quad is None:
+            num_quad = X.shape[2] * scipy.ones(num_channels, dtype=int)
+        if y_labels is None:
+            y_labels = [''] * num_channels
+        if y_units is None:
+            y_units = [''] * num_channels
+        if len(y_labels) != num_channels or len(y_units) != num_channels:
+            raise ValueError("There must be one y_label and y_unit per channel!")
+        
+        self.X = X
+        self.y = y
+        self.err_X = err_X
+        self.err_y = err_y
+        self.T = T
+        self.num_obs = X.shape[1] * scipy.ones(num_channels, dtype=int)
+        self.num_quad = scipy.asarray(num_quad, dtype=int)
+        self.y_labels = list(y_labels)
+        self.y_units = list(y_units)
+        if mask is not None:
+            self._compact(scipy.asarray(mask, dtype=bool))
+    
+    @classmethod
+    def from_channels(cls, channels):
+        """Build a :py:class:`TransformedSet` from a sequence of :py:class:`Channel` instances.
+        
+        Parameters
+        ----------
+        channels : list of :py:class:`Channel`
+            The channels to store. All must have the same number of dimensions.
+        """
+        channels = list(channels)
+        if len(channels) == 0:
+            return cls()
+        num_dim = channels[0].X.shape[2]
+        M = max([len(ch.y) for ch in channels])
+        N = max([ch.X.shape[1] for ch in channels])
+        X = scipy.zeros((len(channels), M, N, num_dim))
+        err_X = scipy.zeros_like(X)
+        y = scipy.zeros((len(channels), M))
+        err_y = scipy.zeros_like(y)
+        T = scipy.zeros((len(channels), M, N))
+        mask = scipy.zeros((len(channels), M), dtype=bool)
+        for c, ch in enumerate(channels):
+            if ch.X.shape[2] != num_dim:
+                raise ValueError("All channels must have the same number of dimensions!")
+            m, n = ch.T.shape
+            X[c, :m] = _pad_quadrature(ch.X, N)
+            err_X[c, :m] = _pad_quadrature(ch.err_X, N)
+            y[c, :m] = ch.y
+            err_y[c, :m] = ch.err_y
+            T[c, :m, :n] = ch.T
+            mask[c, :m] = True
+        return cls(
+            X, y, err_X=err_X, err_y=err_y, T=T, mask=mask,
+            num_quad=[ch.X.shape[1] for ch in channels],
+            y_labels=[ch.y_label for ch in channels],
+            y_units=[ch.y_units for ch in channels]
+        )
+    
+    @classmethod
+    def concatenate(cls, sets):
+        """Join several :py:class:`TransformedSet` instances into one.
+        
+        Parameters
+        ----------
+        sets : list of :py:class:`TransformedSet`
+            The sets to join, in order. All non-empty sets must have the same
+            number of dimensions.
+        """
+        sets = [s for s in sets if len(s) > 0]
+        if len(sets) == 0:
+            return cls()
+        if len(set([s.X.shape[3] for s in sets])) > 1:
+            raise ValueError("All sets must have the same number of dimensions!")
+        M = max([s.X.shape[1] for s in sets])
+        N = max([s.X.shape[2] for s in sets])
+        
+        def pad(s, a, quad_val=None):
+            # Pad out the observation axis, then the quadrature axis:
+            widths = [(0, 0)] * a.ndim
+            widths[1] = (0, M - s.X.shape[1])
+            a = scipy.pad(a, widths, mode='constant')
+            if quad_val is None:
+                return a
+            elif quad_val == 'edge':
+                return _pad_quadrature(a, N, axis=2)
+            else:
+                widths[1] = (0, 0)
+                widths[2] = (0, N - s.X.shape[2])
+                return scipy.pad(a, widths, mode='constant')
+        
+        joined = cls()
+        joined.X = scipy.concatenate([pad(s, s.X, 'edge') for s in sets])
+        joined.err_X = scipy.concatenate([pad(s, s.err_X, 'edge') for s in sets])
+        joined.y = scipy.concatenate([pad(s, s.y) for s in sets])
+        joined.err_y = scipy.concatenate([pad(s, s.err_y) for s in sets])
+        joined.T = scipy.concatenate([pad(s, s.T, 0.0) for s in sets])
+        joined.num_obs = scipy.concatenate([s.num_obs for s in sets])
+        joined.num_quad = scipy.concatenate([s.num_quad for s in sets])
+        joined.y_labels = sum([s.y_labels for s in sets], [])
+        joined.y_units = sum([s.y_units for s in sets], [])
+        return joined
+    
+    def __len__(self):
+        return self.X.shape[0]
+    
+    def __iter__(self):
+        for c in range(0, len(self)):
+            yield self[c]
+    
+    def __getitem__(self, key):
+        if isinstance(key, (int, scipy.integer)):
+            if key < 0:
+                key += len(self)
+            m = self.num_obs[key]
+            n = self.num_quad[key]
+            return Channel(
+                self.X[key, :m, :n],
+                self.y[key, :m],
+                err_X=self.err_X[key, :m, :n],
+                err_y=self.err_y[key, :m],
+                T=self.T[key, :m, :n],
+                y_label=self.y_labels[key],
+                y_units=self.y_units[key]
+            )
+        subset = copy.copy(self)
+        subset._select(scipy.arange(len(self))[key])
+        return subset
+    
+    def view(self):
+        """Return a new set which shares the arrays of this one.
+        
+        The shared arrays are made read-only in both sets. Every method which
+        modifies them makes its own copy first, and :py:meth:`unshare` must be
+        called before modifying them elementwise.
+        """
+        for name in self._array_names:
+            a = getattr(self, name).view()
+            a.flags.writeable = False
+            setattr(self, name, a)
+        other = copy.copy(self)
+        other.y_labels = list(self.y_labels)
+        other.y_units = list(self.y_units)
+        return other
+    
+    def unshare(self):
+        """Copy any arrays which are shared with another set by :py:meth:`view`.
+        """
+        for name in self._array_names:
+            a = getattr(self, name)
+            if not a.flags.writeable:
+                setattr(self, name, a.copy())
+    
+    @property
+    def mask(self):
+        """Boolean array, (`C`, `M`), which is True for the observations that are present.
+        """
+        return scipy.arange(self.X.shape[1]) < self.num_obs[:, None]
+    
+    def _select(self, idx):
+        """Keep only the channels with indices `idx`.
+        """
+        self.X = self.X[idx]
+        self.err_X = self.err_X[idx]
+        self.y = self.y[idx]
+        self.err_y = self.err_y[idx]
+        self.T = self.T[idx]
+        self.num_obs = self.num_obs[idx]
+        self.num_quad = self.num_quad[idx]
+        self.y_labels = [self.y_labels[i] for i in idx]
+        self.y_units = [self.y_units[i] for i in idx]
+    
+    def _compact(self, mask):
+        """Keep only the observations flagged in `mask`, preserving their order.
+        """
+        # A stable sort moves the kept observations of every channel to the
+        # front at once:
+        order = (~mask).argsort(axis=1, kind='mergesort')
+        rows = scipy.arange(len(self))[:, None]
+        self.num_obs = mask.sum(axis=1)
+        M = self.num_obs.max() if len(self) > 0 else 0
+        order = order[:, :M]
+        self.X = self.X[rows, order]
+        self.err_X = self.err_X[rows, order]
+        self.y = self.y[rows, order]
+        self.err_y = self.err_y[rows, order]
+        self.T = self.T[rows, order]
+    
+    def remove_points(self, conditional):
+        """Remove the observations satisfying `conditional`.
+        
+        Parameters
+        ----------
+        conditional : array of bool, (`C`, `M`)
+            True wherever an observation should be removed. Entries past the end
+            of a channel are ignored.
+        
+        Returns
+        -------
+        bad : :py:class:`TransformedSet`
+            The removed observations, with the same channels as this set.
+        """
+        conditional = scipy.asarray(conditional, dtype=bool) & self.mask
+        bad = TransformedSet(
+            self.X, self.y, err_X=self.err_X, err_y=self.err_y, T=self.T,
+            mask=conditional, num_quad=self.num_quad, y_labels=self.y_labels,
+            y_units=self.y_units
+        )
+        self._compact(self.mask & ~conditional)
+        return bad
+    
+    def drop_axis(self, axis):
+        """Drops a selected axis from `X`.
+        
+        Parameters
+        ----------
+        axis : int
+            The index of the axis to drop.
+        """
+        if len(self) == 0:
+            return
+        self.X = scipy.delete(self.X, axis, axis=3)
+        self.err_X = scipy.delete(self.err_X, axis, axis=3)
+    
+    def keep_slices(self, axis, vals, tol=None, keep_mixed=False):
+        """Only keep the observations closest to given `vals` in each channel.
+        
+        Channels whose observations depend on more than one value of
+        `X[:, :, :, axis]` are dropped unless `keep_mixed` is True, in which
+        case they are kept unchanged.
+        
+        Parameters
+        ----------
+        axis : int
+            The column in `X` to check values on.
+        vals : float or 1-d array
+            The value(s) to keep the points that are nearest to.
+        tol : float or None
+            Tolerance on nearest values -- if the nearest value is farther than
+            this, it is not kept. If None, this is not applied.
+        keep_mixed : bool, optional
+            Set this flag to keep transformed quantities that depend on multiple
+            values of `X[:, :, :, axis]`. Default is False (drop mixed
+            quantities).
+        """
+        if len(self) == 0:
+            return
+        vals = scipy.atleast_1d(scipy.asarray(vals, dtype=float))
+        mask = self.mask
+        x = self.X[:, :, :, axis]
+        mixed = ((x != x[:, :, 0:1]).any(axis=2) & mask).any(axis=1)
+        
+        # Observations of the channels that are not mixed, in channel order:
+        single = mask & ~mixed[:, None]
+        n = single.sum(axis=1)
+        n = n[n > 0]
+        keep = mask.copy()
+        if len(n) > 0:
+            starts = scipy.concatenate(([0], n.cumsum()[:-1])).astype(int)
+            keep[single] = _nearest_in_groups(x[:, :, 0][single], starts, vals, tol=tol)
+        self._compact(keep)
+        if not keep_mixed:
+            self._select(scipy.where(~mixed)[0])
+    
+    def average_data(self, axis=0, **kwargs):
+        """Average the data in each channel along the given `axis`.
+        
+        Every channel with at least one observation is left with a single one.
+        
+        Parameters
+        ----------
+        axis : int, optional
+            Axis to average along. Default is 0.
+        **kwargs : optional keyword arguments
+            All additional kwargs are passed to :py:func:`average_groups`, or to
+            :py:func:`average_points` when using the robust estimators.
+        """
+        if len(self) == 0:
+            return
+        reduced_X = scipy.delete(self.X, axis, axis=3)
+        reduced_err_X = scipy.delete(self.err_X, axis, axis=3)
+        C, M, N, D = reduced_X.shape
+        present = self.num_obs > 0
+        X = scipy.zeros((C, 1, N, D))
+        err_X = scipy.zeros_like(X)
+        y = scipy.zeros((C, 1))
+        err_y = scipy.zeros_like(y)
+        T = scipy.zeros((C, 1, N))
+        if kwargs.get('robust', False):
+            for c in scipy.where(present)[0]:
+                m = self.num_obs[c]
+                X[c, 0], y[c, 0], err_X[c, 0], err_y[c, 0], T[c, 0] = average_points(
+                    reduced_X[c, :m],
+                    self.y[c, :m],
+                    reduced_err_X[c, :m],
+                    self.err_y[c, :m],
+                    T=self.T[c, :m],
+                    **kwargs
+                )
+        elif present.any():
+            # The weights are averaged with the same weights as the
+            # abscissa, so they can simply be carried along as extra columns:
+            mask = self.mask
+            K = mask.sum()
+            flat_X = scipy.hstack((reduced_X[mask].reshape((K, N * D)), self.T[mask]))
+            flat_err_X = scipy.hstack(
+                (reduced_err_X[mask].reshape((K, N * D)), scipy.zeros((K, N)))
+            )
+            n = self.num_obs[present]
+            starts = scipy.concatenate(([0], n.cumsum()[:-1])).astype(int)
+            mean_X, mean_y, mean_err_X, mean_err_y = average_groups(
+                flat_X,
+                self.y[mask],
+                flat_err_X,
+                self.err_y[mask],
+                scipy.arange(K),
+                starts,
+                **kwargs
+            )
+            X[present, 0] = mean_X[:, :N * D].reshape((-1, N, D))
+            err_X[present, 0] = mean_err_X[:, :N * D].reshape((-1, N, D))
+            T[present, 0] = mean_X[:, N * D:]
+            y[present, 0] = mean_y
+            err_y[present, 0] = mean_err_y
+        self.X = X
+        self.err_X = err_X
+        self.y = y
+        self.err_y = err_y
+        self.T = T
+        self.num_obs = present.astype(int)
+
+def _pad_quadrature(a, N, axis=1):
+    """Pad the quadrature axis of `a` out to length `N` by repeating the last point.
+    """
+    if a.shape[axis] == N or a.shape[axis] == 0:
+        return a
+    widths = [(0, 0)] * a.ndim
+    widths[axis] = (0, N - a.shape[axis])
+    return scipy.pad(a, widths, mode='edge')
+
+class _ColumnBuffer(object):
+    """Growable storage for one of the per-point arrays of a :py:class:`Profile`.
+    
+    The storage is over-allocated along the leading axis and the capacity is
+    doubled whenever an append would overflow it, so adding `N` points in many
+    small batches costs O(`N`) copying in total instead of re-stacking all of
+    the existing data on every call. Only the filled part is ever exposed, as a
+    contiguous view.
+    
+    Buffers created by :py:meth:`share` hold read-only views of the same
+    storage, which is copied by whichever of them is next appended to.
+    
+    Parameters
+    ----------
+    value : array-like or None, optional
+        The initial contents. This is stored without copying. Default is None
+        (no data).
+    """
+    def __init__(self, value=None):
+        self.set(value)
+    
+    def set(self, value):
+        """Replace the contents with `value`, which is stored without copying.
+        """
+        if value is None:
+            self._data = None
+            self._n = 0
+        else:
+            self._data = scipy.asarray(value)
+            self._n = len(self._data)
+    
+    def get(self):
+        """Return a view of the filled part of the buffer, or None if it is unset.
+        """
+        if self._data is None:
+            return None
+        return self._data[:self._n]
+    
+    def append(self, value):
+        """Append `value` along the leading axis, growing the capacity as needed.
+        """
+        value = scipy.asarray(value)
+        if self._data is None:
+            self._data = value.copy()
+            self._n = len(value)
+            return
+        if value.shape[1:] != self._data.shape[1:]:
+            raise ValueError(
+                "Cannot append data of shape %s to a buffer holding rows of "
+                "shape %s!" % (value.shape, self._data.shape[1:])
+            )
+        n_new = self._n + len(value)
+        dtype = scipy.result_type(self._data, value)
+        if (n_new > len(self._data) or dtype != self._data.dtype or
+                not self._data.flags.writeable):
+            capacity = max(n_new, 2 * len(self._data))
+            data = scipy.empty((capacity,) + self._data.shape[1:], dtype=dtype)
+            data[:self._n] = self._data[:self._n]
+            self._data = data
+        self._data[self._n:n_new] = value
+        self._n = n_new
+    
+    def share(self):
+        """Return a new buffer with the same contents, sharing this one's storage.
+        
+        Both buffers are left holding read-only views of the storage.
+        """
+        if self._data is not None:
+            self._data = self._data.view()
+            self._data.flags.writeable = False
+        other = _ColumnBuffer()
+        other._data = self._data
+        other._n = self._n
+        return other
+    
+    def __getstate__(self):
+        # Don't pickle the spare capacity:
+        return {'_data': self.get(), '_n': self._n}
+
+def _buffered_column(name, doc, invalidates=None, channels=False):
+    """Make a property exposing the :py:class:`_ColumnBuffer` stored in attribute `name`.
+    
+    If `invalidates` is given, that attribute is reset to None whenever the
+    property is assigned to. Any removals deferred with
+    :py:meth:`Profile.remove_points` are applied before the data are used.
+    Assigned values are converted to the storage type of the profile with
+    :py:meth:`Profile._as_storage`, with `channels` passed through.
+    """
+    def fget(self):
+        if self._removed is not None:
+            self.compact()
+        return getattr(self, name).get()
+    
+    def fset(self, value):
+        if self._removed is not None:
+            self.compact()
+        if value is not None:
+            value = self._as_storage(value, channels=channels)
+        getattr(self, name).set(value)
+        if invalidates is not None:
+            setattr(self, invalidates, None)
+    
+    return property(fget, fset, doc=doc)
+
+class _ChannelIndex(object):
+    """Compact integer encoding of the `channels` of a :py:class:`Profile`.
+    
+    Each column of `channels` is encoded as dense integer codes, assigned in
+    the order the channel values are first seen so that existing codes never
+    change. Columns are only encoded once they are first needed for a grouping.
+    The grouping of the points by the channels along all but one axis is
+    derived from these codes with a single integer sort, with the groups
+    ordered by their channel values, and is cached until the channels change.
+    The codes are updated incrementally when points are appended or removed and
+    when the channels are renumbered by :py:meth:`Profile.add_profile`, so the
+    grouping never has to be rebuilt from the raw channel rows.
+    
+    Parameters
+    ----------
+    num_dim : int
+        The number of columns in `channels`.
+    """
+    def __init__(self, num_dim):
+        # For each encoded column, the sorted unique values, the code of each
+        # of those values and the codes of the points:
+        self.sorted_vals = [None] * num_dim
+        self.sorted_codes = [None] * num_dim
+        self.codes = [None] * num_dim
+        self.groups = {}
+    
+    def _encode(self, k, col):
+        """Get the codes for the values `col` in column `k`, adding new values as needed.
+        """
+        vals = self.sorted_vals[k]
+        pos = scipy.searchsorted(vals, col)
+        found = scipy.zeros(len(col), dtype=bool)
+        in_range = pos < len(vals)
+        found[in_range] = vals[pos[in_range]] == col[in_range]
+        codes = scipy.zeros(len(col), dtype=int)
+        codes[found] = self.sorted_codes[k][pos[found]]
+        if not found.all():
+            new_vals, first, inv = scipy.unique(
+                col[~found], return_index=True, return_inverse=True
+            )
+            # Number the new values in the order they first appear:
+            new_codes = scipy.zeros(len(new_vals), dtype=int)
+            new_codes[first.argsort(kind='mergesort')] = (
+                len(vals) + scipy.arange(len(new_vals))
+            )
+            codes[~found] = new_codes[inv.ravel()]
+            ins = scipy.searchsorted(vals, new_vals)
+            self.sorted_vals[k] = scipy.insert(vals, ins, new_vals)
+            self.sorted_codes[k] = scipy.insert(self.sorted_codes[k], ins, new_codes)
+        return codes
+    
+    def append(self, channels):
+        """Encode and append the rows of `channels`.
+        """
+        channels = scipy.asarray(channels)
+        for k in range(0, len(self.codes)):
+            if self.codes[k] is not None:
+                self.codes[k].append(self._encode(k, channels[:, k]))
+        self.groups = {}
+    
+    def keep(self, idxs):
+        """Keep only the points selected by the index or boolean mask `idxs`.
+        """
+        for k in range(0, len(self.codes)):
+            if self.codes[k] is not None:
+                self.codes[k].set(self.codes[k].get()[idxs])
+        self.groups = {}
+    
+    def shift(self, delta):
+        """Account for adding `delta` to each column of the channels.
+        """
+        for k in range(0, len(self.codes)):
+            if self.codes[k] is not None:
+                self.sorted_vals[k] = self.sorted_vals[k] + delta[k]
+    
+    def group(self, channels, axis=None):
+        """Group the points by their channels along every axis except `axis`.
+        
+        Parameters
+        ----------
+        channels : array, (`M`, `D`)
+            The channels being indexed. Only used to encode columns which have
+            not been needed before.
+        axis : int or None, optional
+            The axis to ignore. Default is None (group by all axes).
+        
+        Returns
+        -------
+        order : :py:class:`Array` of int, (`M`,)
+            Indices which sort the points by group, keeping the points within
+            each group in their original order.
+        starts : :py:class:`Array` of int, (`P`,)
+            The index into `order` of the first member of each group.
+        """
+        if axis not in self.groups:
+            key = scipy.zeros(len(channels), dtype=int)
+            radix = 1
+            for k in range(0, len(self.codes)):
+                if k == axis:
+                    continue
+                if self.codes[k] is None:
+                    self.sorted_vals[k] = channels[:0, k]
+                    self.sorted_codes[k] = scipy.zeros(0, dtype=int)
+                    self.codes[k] = _ColumnBuffer(self._encode(k, channels[:, k]))
+                num_codes = len(self.sorted_vals[k])
+                # Re-densify the key before it could overflow:
+                if radix * num_codes >= 2**62:
+                    dum, key = scipy.unique(key, return_inverse=True)
+                    key = key.ravel()
+                    radix = key.max() + 1 if len(key) > 0 else 1
+                # Order by channel value, not by code:
+                rank = scipy.zeros(num_codes, dtype=int)
+                rank[self.sorted_codes[k]] = scipy.arange(num_codes)
+                key = key * num_codes + rank[self.codes[k].get()]
+                radix *= num_codes
+            order = key.argsort(kind='mergesort')
+            if len(order) > 0:
+                starts = scipy.concatenate(
+                    ([0], scipy.flatnonzero(scipy.diff(key[order])) + 1)
+                )
+            else:
+                starts = scipy.zeros(0, dtype=int)
+            self.groups[axis] = (order, starts)
+        return self.groups[axis]
+    
+    def __getstate__(self):
+        # The cached groupings are cheap to rebuild:
+        state = self.__dict__.copy()
+        state['groups'] = {}
+        return state
+
 class Profile(object):
     """Object to abstractly represent a profile.
     
@@ -448,6 +1290,12 @@ class Profile(object):
         Whether or not it is valid to use weighted estimators on the data, or if
         the error bars are too suspect for this to be valid. Default is True
         (allow use of weighted estimators).
+    dtype : floating point dtype, optional
+        The type to store `X`, `y`, `err_X` and `err_y` as. Using
+        :py:class:`scipy.float32` halves the memory needed for large raw
+        profiles, and also stores integer channel keys as 32 bit integers. The
+        data are always promoted to double precision to build the Gaussian
+        process in :py:meth:`create_gp`. Default is float (double precision).
     
     Attributes
     ----------
@@ -473,15 +1321,23 @@ class Profile(object):
         Descriptive label for the dependent variable.
     weightable : bool
         Whether or not weighted estimators can be used.
-    transformed : list of :py:class:`Channel`
+    dtype : :py:class:`scipy.dtype`
+        The type the data are stored as.
+    transformed : :py:class:`TransformedSet`
         The transformed quantities associated with the :py:class:`Profile` instance.
     gp : :py:class:`gptools.GaussianProcess` instance
         The Gaussian process with the local and transformed data included.
     """
+    # Attributes which write_npz does not store:
+    _unserialized_attributes = ('transformed', 'gp')
+    
     def __init__(self, X_dim=1, X_units=None, y_units='', X_labels=None, y_label='',
-                 weightable=True):
+                 weightable=True, dtype=float):
         self.X_dim = X_dim
         self.weightable = weightable
+        self.dtype = scipy.dtype(dtype)
+        if self.dtype.kind != 'f':
+            raise ValueError("dtype must be a floating point type!")
         if X_units is None:
             X_units = [''] * X_dim
         elif X_dim == 1:
@@ -502,15 +1358,137 @@ class Profile(object):
         self.X_labels = X_labels
         self.y_label = y_label
         
-        self.y = scipy.array([], dtype=float)
-        self.X = None
-        self.err_y = scipy.array([], dtype=float)
-        self.err_X = None
-        self.channels = None
+        self._y = _ColumnBuffer(scipy.array([], dtype=self.dtype))
+        self._X = _ColumnBuffer()
+        self._err_y = _ColumnBuffer(scipy.array([], dtype=self.dtype))
+        self._err_X = _ColumnBuffer()
+        self._channels = _ColumnBuffer()
+        # Built on demand by _get_channel_groups:
+        self._channel_index = None
+        # Points flagged by deferred calls to remove_points:
+        self._removed = None
         
-        self.transformed = scipy.array([], dtype=Channel)
+        self.transformed = TransformedSet()
         
         self.gp = None
+        # Set by create_gp when warm starting from a HyperparameterStore:
+        self._warm_start = None
+        self._MAP_bounds = None
+        # Built on demand by get_prediction_session:
+        self._prediction_session = None
+    
+    # The point data live in growable buffers so that repeated calls to
+    # add_data are not quadratic. Assigning to these attributes replaces the
+    # contents of the corresponding buffer.
+    y = _buffered_column('_y', "The dependent variables.")
+    X = _buffered_column('_X', "The independent variables.")
+    err_y = _buffered_column('_err_y', "The uncertainty in the dependent variables.")
+    err_X = _buffered_column('_err_X', "The uncertainty in the independent variables.")
+    # Note that modifying the channels in place (instead of assigning to
+    # them) will not be seen by the cached channel grouping.
+    channels = _buffered_column(
+        '_channels',
+        "The channel keys of each point.",
+        invalidates='_channel_index',
+        channels=True
+    )
+    
+    def __setstate__(self, state):
+        # Handle instances pickled before the point data were buffered:
+        for name in ('y', 'X', 'err_y', 'err_X', 'channels'):
+            if name in state:
+                state['_' + name] = _ColumnBuffer(state.pop(name))
+        state.setdefault('_channel_index', None)
+        state.setdefault('_removed', None)
+        state.setdefault('_warm_start', None)
+        state.setdefault('_MAP_bounds', None)
+        state.setdefault('_prediction_session', None)
+        state['dtype'] = scipy.dtype(state.get('dtype', float))
+        # Transformed quantities used to be an object array of Channel:
+        if not isinstance(state.get('transformed'), TransformedSet):
+            state['transformed'] = TransformedSet.from_channels(
+                state.get('transformed', [])
+            )
+        self.__dict__.update(state)
+    
+    def _as_storage(self, a, channels=False):
+        """Convert `a` to the type the data are stored as.
+        
+        Floating point data are converted to :py:attr:`dtype`. If `channels` is
+        True, `a` holds channel keys instead: when :py:attr:`dtype` is single
+        precision, integer keys are stored as 32 bit integers if they fit and
+        everything else is left alone. `a` is only copied if it must be
+        converted.
+        """
+        a = scipy.asarray(a)
+        if channels:
+            if (self.dtype.itemsize < 8 and a.dtype.kind in 'iu' and
+                    a.dtype.itemsize > 4 and
+                    (a.size == 0 or (a.min() >= -2**31 and a.max() < 2**31))):
+                return a.astype(scipy.int32)
+            return a
+        if a.dtype.kind == 'f' and a.dtype != self.dtype:
+            return a.astype(self.dtype)
+        return a
+    
+    def copy(self):
+        """Return a copy of this :py:class:`Profile` which shares its data arrays.
+        
+        This is much cheaper than :py:func:`copy.deepcopy`, since none of the
+        data are copied up front. The shared arrays are made read-only in both
+        profiles, and whichever profile next changes them makes its own copy:
+        this happens automatically in all of the methods which modify the data,
+        but elementwise assignment to the arrays must be preceded by assigning
+        a copy. Attached objects such as an EFIT tree are shared, lists of
+        labels and units are copied and the Gaussian process, if present, is
+        deep-copied.
+        
+        Returns
+        -------
+        p : :py:class:`Profile`
+            The copy, of the same class as this profile.
+        """
+        self.compact()
+        p = copy.copy(self)
+        for name in ('_y', '_X', '_err_y', '_err_X', '_channels'):
+            setattr(p, name, getattr(self, name).share())
+        p._channel_index = None
+        p.transformed = self.transformed.view()
+        for k, v in list(vars(p).items()):
+            if isinstance(v, list):
+                setattr(p, k, list(v))
+        if self.gp is not None:
+            p.gp = copy.deepcopy(self.gp)
+        return p
+    
+    def _get_channel_groups(self, axis=None):
+        """Get the grouping of the points by their channels, ignoring `axis`.
+        
+        The grouping is computed once from a compact integer encoding of
+        `channels` and reused until the channels change.
+        
+        Parameters
+        ----------
+        axis : int or None, optional
+            The axis of `channels` to ignore. Default is None (use all axes).
+        
+        Returns
+        -------
+        channels : :py:class:`Array`, (`P`, `X_dim` - 1) or (`P`, `X_dim`)
+            The unique rows of `channels` with `axis` removed.
+        order : :py:class:`Array` of int, (`M`,)
+            Indices which sort the points by channel, keeping the points within
+            each channel in their original order.
+        starts : :py:class:`Array` of int, (`P`,)
+            The index into `order` of the first point in each channel.
+        """
+        if self._channel_index is None:
+            self._channel_index = _ChannelIndex(self.channels.shape[1])
+        order, starts = self._channel_index.group(self.channels, axis)
+        channels = self.channels[order[starts], :]
+        if axis is not None:
+            channels = scipy.delete(channels, axis, axis=1)
+        return (channels, order, starts)
     
     def add_data(self, X, y, err_X=0, err_y=0, channels=None):
         """Add data to the training data set of the :py:class:`Profile` instance.
@@ -560,10 +1538,6 @@ class Profile(object):
         #from IPython import embed
         #embed()
 
-        # FS: some new error with nan's in err_y...
-        # Should be fine to set those nan's to 0:
-        err_y[scipy.isnan(err_y)] = 0.0
-        
         # Handle scalar error or verify shape of array error matches shape of y:
         try:
             iter(err_y)
@@ -577,6 +1551,10 @@ class Profile(object):
                     "Shape of err_y given is %s, shape of y given is %s."
                     % (err_y.shape, y.shape)
                 )
+        # FS: some new error with nan's in err_y...
+        # Should be fine to set those nan's to 0. This is done on a copy, since
+        # the input may be shared with another profile:
+        err_y = scipy.where(scipy.isnan(err_y), 0.0, err_y)
         if (err_y < 0).any():
             raise ValueError("All elements of err_y must be non-negative!")
         
@@ -631,20 +1609,14 @@ class Profile(object):
                 if channels.shape != (len(y), X.shape[1]):
                     raise ValueError("Shape of channels and X must be the same!")
         
-        if self.X is None:
-            self.X = X
-        else:
-            self.X = scipy.vstack((self.X, X))
-        if self.channels is None:
-            self.channels = channels
-        else:
-            self.channels = scipy.vstack((self.channels, channels))
-        if self.err_X is None:
-            self.err_X = err_X
-        else:
-            self.err_X = scipy.vstack((self.err_X, err_X))
-        self.y = scipy.append(self.y, y)
-        self.err_y = scipy.append(self.err_y, err_y)
+        self.compact()
+        self._X.append(self._as_storage(X))
+        self._channels.append(self._as_storage(channels, channels=True))
+        if self._channel_index is not None:
+            self._channel_index.append(channels)
+        self._err_X.append(self._as_storage(err_X))
+        self._y.append(self._as_storage(y))
+        self._err_y.append(self._as_storage(err_y))
         
         if self.gp is not None:
             self.gp.add_data(X, y, err_y=err_y)
@@ -669,15 +1641,86 @@ class Profile(object):
         if len(other.y) > 0:
             # Modify the channels of self.channels to avoid clashes:
             if other.channels is not None and self.channels is not None:
-                self.channels = (
-                    self.channels - self.channels.min(axis=0) +
-                    other.channels.max(axis=0) + 1
+                delta = other.channels.max(axis=0) + 1 - self.channels.min(axis=0)
+                self._channels.set(
+                    self._as_storage(self.channels + delta, channels=True)
                 )
+                if self._channel_index is not None:
+                    self._channel_index.shift(delta)
             self.add_data(other.X, other.y, err_X=other.err_X, err_y=other.err_y,
                           channels=other.channels)
         
         if len(other.transformed) > 0:
-            self.transformed = scipy.append(self.transformed, other.transformed)
+            self.transformed = TransformedSet.concatenate(
+                [self.transformed, other.transformed]
+            )
+    
+    @classmethod
+    def concat(cls, profiles):
+        """Merge several profiles into a new one in a single pass.
+        
+        The result is the same as absorbing each of ``profiles[1:]`` into
+        ``profiles[0]`` in turn with :py:meth:`add_profile`, but the units are
+        only checked once, the channel numbers of all of the profiles are
+        offset with a single cumulative sum and the data are only stacked once.
+        None of the profiles are modified: the result is a :py:meth:`copy` of
+        ``profiles[0]`` holding the merged data.
+        
+        Parameters
+        ----------
+        profiles : list of :py:class:`Profile`
+            The profiles to merge.
+        
+        Returns
+        -------
+        p : :py:class:`Profile`
+            The merged profile, of the same class as ``profiles[0]``.
+        """
+        profiles = list(profiles)
+        if len(profiles) == 0:
+            raise ValueError("Must provide at least one profile to merge!")
+        first = profiles[0]
+        for other in profiles[1:]:
+            if first.X_dim != other.X_dim:
+                raise ValueError(
+                    "When merging profiles, X_dim must be equal between the two "
+                    "profiles!"
+                )
+            if first.y_units != other.y_units:
+                raise ValueError("When merging profiles, the y_units must agree!")
+            if first.X_units != other.X_units:
+                raise ValueError("When merging profiles, the X_units must agree!")
+        
+        p = first.copy()
+        with_points = [q for q in profiles if len(q.y) > 0]
+        if len(with_points) > 0:
+            # Each merge shifts the channels accumulated so far to lie just
+            # above those of the profile being added, so the total offset of a
+            # profile is the sum of the shifts from every later merge:
+            ch = [q.channels for q in with_points]
+            ch_min = scipy.asarray([c.min(axis=0) for c in ch])
+            ch_max = scipy.asarray([c.max(axis=0) for c in ch])
+            delta = scipy.zeros_like(ch_max)
+            delta[1:] = ch_max[1:] + 1 - ch_min[:-1]
+            offsets = scipy.cumsum(delta[::-1], axis=0)[::-1] - delta
+            
+            p.X = scipy.concatenate([q.X for q in with_points])
+            p.y = scipy.concatenate([q.y for q in with_points])
+            p.err_X = scipy.concatenate([q.err_X for q in with_points])
+            p.err_y = scipy.concatenate([q.err_y for q in with_points])
+            p.channels = scipy.concatenate([c + o for c, o in zip(ch, offsets)])
+            
+            if p.gp is not None:
+                added = with_points[1:] if len(first.y) > 0 else with_points
+                if len(added) > 0:
+                    p.gp.add_data(
+                        scipy.concatenate([q.X for q in added]),
+                        scipy.concatenate([q.y for q in added]),
+                        err_y=scipy.concatenate([q.err_y for q in added])
+                    )
+        
+        p.transformed = TransformedSet.concatenate([q.transformed for q in profiles])
+        return p
     
     def drop_axis(self, axis):
         """Drops a selected axis from `X`.
@@ -697,9 +1740,7 @@ class Profile(object):
         self.X_labels.pop(axis)
         self.X_units.pop(axis)
         
-        for p in self.transformed:
-            p.X = scipy.delete(p.X, axis, axis=2)
-            p.err_X = scipy.delete(p.err_X, axis, axis=2)
+        self.transformed.drop_axis(axis)
     
     def keep_slices(self, axis, vals, tol=None, **kwargs):
         """Keeps only the nearest points to vals along the given axis for each channel.
@@ -714,48 +1755,29 @@ class Profile(object):
             Tolerance on nearest values -- if the nearest value is farther than
             this, it is not kept. If None, this is not applied.
         **kwargs : optional kwargs
-            All additional kwargs are passed to :py:meth:`~gptools.core.Channel.keep_slices`.
+            All additional kwargs are passed to :py:meth:`TransformedSet.keep_slices`.
         """
         try:
             iter(vals)
         except TypeError:
             vals = [vals]
         
+        vals = scipy.asarray(vals, dtype=float)
+        
         # Only handle single points if they are present...
         if self.X is not None:
-            new_X = []
-            new_y = []
-            new_err_X = []
-            new_err_y = []
-            new_channels = []
-            
-            reduced_channels = scipy.delete(self.channels, axis, axis=1)
-            channels = unique_rows(reduced_channels)
-            
-            for ch in channels:
-                channel_idxs = (reduced_channels == ch.flatten()).all(axis=1)
-                ch_axis_X = self.X[channel_idxs, axis].flatten()
-                
-                keep_idxs = get_nearest_idx(vals, ch_axis_X)
-                if tol is not None:
-                    keep_idxs = keep_idxs[
-                        scipy.absolute(ch_axis_X[keep_idxs] - vals) <= tol
-                    ]
-                keep_idxs = scipy.unique(keep_idxs)
-                
-                new_X.extend(self.X[channel_idxs, :][keep_idxs, :])
-                new_y.extend(self.y[channel_idxs][keep_idxs])
-                new_err_X.extend(self.err_X[channel_idxs, :][keep_idxs, :])
-                new_err_y.extend(self.err_y[channel_idxs][keep_idxs])
-                new_channels.extend(self.channels[channel_idxs, :][keep_idxs, :])
+            dum, order, starts = self._get_channel_groups(axis)
+            keep_mask = _nearest_in_groups(self.X[order, axis], starts, vals, tol=tol)
+            keep_idxs = order[keep_mask]
             
             # Raise a warning if there aren't any points to keep:
-            if new_X:
-                self.X = scipy.vstack(new_X)
-                self.y = scipy.asarray(new_y)
-                self.err_X = scipy.vstack(new_err_X)
-                self.err_y = scipy.asarray(new_err_y)
-                self.channels = scipy.vstack(new_channels)
+            if len(keep_idxs) > 0:
+                self.X = self.X[keep_idxs, :]
+                self.y = self.y[keep_idxs]
+                self.err_X = self.err_X[keep_idxs, :]
+                self.err_y = self.err_y[keep_idxs]
+                self._channels.set(self.channels[keep_idxs, :])
+                self._channel_index.keep(keep_idxs)
             else:
                 self.X = None
                 self.y = scipy.array([], dtype=float)
@@ -764,8 +1786,7 @@ class Profile(object):
                 self.channels = None
                 warnings.warn("No valid points!", RuntimeWarning)
         
-        mask = [p.keep_slices(axis, vals, tol=tol, **kwargs) for p in self.transformed]
-        self.transformed = self.transformed[scipy.asarray(mask, dtype=bool)]
+        self.transformed.keep_slices(axis, vals, tol=tol, **kwargs)
     
     def average_data(self, axis=0, **kwargs):
         """Computes the average of the profile over the desired axis.
@@ -786,39 +1807,25 @@ class Profile(object):
         kwargs['weighted'] = self.weightable and kwargs.get('weighted', False)
         # TODO: Add support for custom bins!
         if self.X is not None:
-            reduced_channels = scipy.delete(self.channels, axis, axis=1)
             reduced_X = scipy.delete(self.X, axis, axis=1)
             reduced_err_X = scipy.delete(self.err_X, axis, axis=1)
-            channels = unique_rows(reduced_channels)
-            X = scipy.zeros((len(channels), self.X_dim - 1))
-            y = scipy.zeros(len(channels))
-            err_X = scipy.zeros_like(X)
-            err_y = scipy.zeros_like(y)
-            for i, chan in zip(list(range(0, len(channels))), channels):
-                chan_mask = (
-                    reduced_channels == chan.flatten()
-                ).all(axis=1)
-            
-                X[i, :], y[i], err_X[i, :], err_y[i], dum = average_points(
-                    reduced_X[chan_mask, :],
-                    self.y[chan_mask],
-                    reduced_err_X[chan_mask, :],
-                    self.err_y[chan_mask],
-                    **kwargs
-                )
-            
-            self.X = X
-            self.y = y
-            self.err_X = err_X
-            self.err_y = err_y
+            channels, order, starts = self._get_channel_groups(axis)
+            self.X, self.y, self.err_X, self.err_y = average_groups(
+                reduced_X,
+                self.y,
+                reduced_err_X,
+                self.err_y,
+                order,
+                starts,
+                **kwargs
+            )
             self.channels = channels
         
         self.X_dim -= 1
         self.X_units.pop(axis)
         self.X_labels.pop(axis)
         
-        for p in self.transformed:
-            p.average_data(axis=axis, **kwargs)
+        self.transformed.average_data(axis=axis, **kwargs)
     
     def plot_data(self, ax=None, label_axes=True, **kwargs):
         """Plot the data stored in this Profile. Only works for X_dim = 1 or 2.
@@ -891,7 +1898,7 @@ class Profile(object):
             
             return ax
     
-    def remove_points(self, conditional):
+    def remove_points(self, conditional, defer=False):
         """Remove points where conditional is True.
         
         Note that this does NOT remove anything from the GP -- you either need
@@ -902,11 +1909,56 @@ class Profile(object):
         that represent linearly-transformed quantities -- you will need to
         operate directly on :py:attr:`transformed` to remove such points.
         
+        Several removals can be combined so that the data are only copied once
+        by passing `defer` = True: the points are then only flagged, and are
+        removed by the next call to :py:meth:`compact` or the next access to the
+        data, whichever comes first. Since accessing the data applies the
+        removal, all of the conditionals in such a chain must be computed
+        before the first deferred call.
+        
         Parameters
         ----------
         conditional : array-like of bool, (`M`,)
             Array of booleans corresponding to each entry in `y`. Where an
             entry is True, that value will be removed.
+        defer : bool, optional
+            Set this flag to only flag the points for removal. Default is False
+            (remove the points immediately).
+        
+        Returns
+        -------
+        X_bad : matrix
+            Input values of the bad points.
+        y_bad : array
+            Bad values.
+        err_X_bad : array
+            Uncertainties on the abcissa of the bad values.
+        err_y_bad : array
+            Uncertainties on the bad values.
+        
+        If `defer` is True, nothing is returned.
+        """
+        conditional = scipy.asarray(conditional, dtype=bool)
+        # Don't go through self.y, since that would apply earlier deferred
+        # removals and change the indexing:
+        y = self._y.get()
+        num_points = len(y) if y is not None else 0
+        if conditional.shape != (num_points,):
+            raise ValueError(
+                "Shape of conditional must be (%d,)! Shape of conditional given "
+                "is %s." % (num_points, conditional.shape)
+            )
+        if self._removed is None:
+            self._removed = conditional.copy()
+        else:
+            self._removed |= conditional
+        if not defer:
+            return self.compact()
+    
+    def compact(self):
+        """Remove all of the points flagged by deferred calls to :py:meth:`remove_points`.
+        
+        All of the flagged points are removed with a single copy of the data.
         
         Returns
         -------
@@ -918,7 +1970,14 @@ class Profile(object):
             Uncertainties on the abcissa of the bad values.
         err_y_bad : array
             Uncertainties on the bad values.
+        
+        If no points were flagged, nothing is returned.
         """
+        conditional = self._removed
+        if conditional is None:
+            return
+        # Clear the flags first, so the data can be accessed normally:
+        self._removed = None
         idxs = ~conditional
         
         y_bad = self.y[conditional]
@@ -930,7 +1989,9 @@ class Profile(object):
         self.X = self.X[idxs, :]
         self.err_y = self.err_y[idxs]
         self.err_X = self.err_X[idxs, :]
-        self.channels = self.channels[idxs, :]
+        self._channels.set(self.channels[idxs, :])
+        if self._channel_index is not None:
+            self._channel_index.keep(idxs)
         
         # Cause other methods to fail gracefully if this causes all pointlike
         # data to be removed:
@@ -989,7 +2050,7 @@ class Profile(object):
             Uncertainties on the abcissa of the bad values.
         err_y_bad : array
             Uncertainties on the bad values.
-        transformed_bad : array of :py:class:`Channel`
+        transformed_bad : :py:class:`TransformedSet`
             Transformed points that were removed.
         """
         if force_update or self.gp is None:
@@ -998,7 +2059,7 @@ class Profile(object):
                 self.find_gp_MAP_estimate(**MAP_kwargs)
         
         # Handle single points:
-        mean = self.gp.predict(
+        mean = self.get_prediction_session().predict(
             self.X,
             return_std=False,
             **predict_kwargs
@@ -1013,29 +2074,28 @@ class Profile(object):
         
         # Handle transformed points:
         if check_transformed:
-            bad_transformed = scipy.zeros_like(self.transformed, dtype=Channel)
-            for k, pt in zip(list(range(0, len(self.transformed))), self.transformed):
-                mean = self.gp.predict(
-                    scipy.vstack(pt.X),
+            # Every transformed quantity is checked with a single prediction:
+            pt = self.transformed
+            mask = pt.mask
+            bad_obs = scipy.zeros_like(mask)
+            if mask.any():
+                X_pt, T_pt = condense_transform([pt.X[mask]], [pt.T[mask]])
+                mean = self.get_prediction_session().predict(
+                    X_pt,
                     return_std=False,
-                    output_transform=scipy.linalg.block_diag(*pt.T),
+                    output_transform=T_pt,
                     **predict_kwargs
                 )
-                deltas = scipy.absolute(mean - pt.y) / pt.err_y
-                deltas[pt.err_y == 0] = 0
-                bad_idxs = (deltas >= thresh)
-            
-                bad_X, bad_err_X, bad_y, bad_err_y, bad_T = pt.remove_points(bad_idxs)
-                bad_transformed[k] = Channel(
-                    bad_X, bad_y, err_X=bad_err_X, err_y=bad_err_y, T=bad_T,
-                    y_label=pt.y_label, y_units=pt.y_units
-                )
+                deltas = scipy.absolute(mean - pt.y[mask]) / pt.err_y[mask]
+                deltas[pt.err_y[mask] == 0] = 0
+                bad_obs[mask] = (deltas >= thresh)
+            bad_transformed = pt.remove_points(bad_obs)
             
-                # TODO: Need to do something to return/re-merge the removed points!
+            # TODO: Need to do something to return/re-merge the removed points!
             
-                # TODO: Need to flag points that no longer have contents!
+            # TODO: Need to flag points that no longer have contents!
             
-                # TODO: Finish this!
+            # TODO: Finish this!
         
         
         # Re-create the GP now that the points have been removed:
@@ -1112,7 +2172,8 @@ class Profile(object):
             return self.remove_points(extreme_changes[sort_idx.argsort()])
     
     def create_gp(self, k=None, noise_k=None, upper_factor=5, lower_factor=5,
-                  x0_bounds=None, mask=None, k_kwargs={}, **kwargs):
+                  x0_bounds=None, mask=None, k_kwargs={}, warm_start=None,
+                  shrink_bounds=None, **kwargs):
         """Create a Gaussian process to handle the data.
         
         Parameters
@@ -1164,6 +2225,18 @@ class Profile(object):
         k_kwargs : dict, optional
             All entries are passed as kwargs to the constructor for the kernel
             if a kernel instance is not provided.
+        warm_start : :py:class:`HyperparameterStore`, optional
+            If given, the initial guesses for the hyperparameters are taken from
+            the nearest MAP estimate stored for the same signal, systems, kernel
+            and abscissa, and the MAP estimate found by
+            :py:meth:`find_gp_MAP_estimate` is recorded in it. With a good
+            warm start, ``find_gp_MAP_estimate(random_starts=0)`` is usually
+            enough. Default is None (no warm start).
+        shrink_bounds : float, optional
+            If given along with `warm_start`, the search for the MAP estimate is
+            restricted to the range of the nearest stored estimates, widened on
+            either side by this fraction of the width of the original bounds.
+            Default is None (search within the original bounds).
         **kwargs : optional kwargs
             All additional kwargs are passed to the constructor of
             :py:class:`gptools.GaussianProcess`.
@@ -1171,10 +2244,17 @@ class Profile(object):
         # TODO: Create more powerful way of specifying kernels!
         # TODO: Set ranges intelligently when using all transformed data!
         # Save some time by only building these arrays once:
-        # Note that using this form only gets the non-transformed values.
+        # Note that using this form only gets the non-transformed values. The
+        # Gaussian process is always built in double precision, whatever the
+        # data are stored as:
         y = self.y
         X = self.X
         err_y = self.err_y
+        if X is not None:
+            y = scipy.asarray(y, dtype=float)
+            X = scipy.asarray(X, dtype=float)
+            err_y = scipy.asarray(err_y, dtype=float)
+        kernel_name = 'SE' if k is None else (k if isinstance(k, str) else type(k).__name__)
         if mask is not None and X is not None:
             y = y[mask]
             X = X[mask, :]
@@ -1385,21 +2465,55 @@ class Profile(object):
         # TODO: I can probably just handle all of the beta-warps at once...
         elif isinstance(k, str):
             raise NotImplementedError("That kernel specification is not supported!")
-        self.gp = gptools.GaussianProcess(k, noise_k=noise_k, **kwargs)
-        if self.X is not None:
-            self.gp.add_data(X, y, err_y=err_y)
-        for p in self.transformed:
-            if len(p.y) > 0:
-                self.gp.add_data(
-                    scipy.vstack(p.X),
-                    p.y,
-                    err_y=p.err_y,
-                    T=scipy.linalg.block_diag(*p.T)
-                )
-        if len(self.transformed) > 0:
-            self.gp.condense_duplicates()
+        mask = self.transformed.mask
+        if mask.any():
+            # Add the single points and all of the transformed quantities at
+            # once, with duplicate quadrature points merged. gptools would
+            # expand T to a dense matrix, so a Gaussian process which keeps it
+            # sparse is used:
+            X_list = [self.transformed.X[mask]]
+            T_list = [self.transformed.T[mask]]
+            y_all = [self.transformed.y[mask]]
+            err_y_all = [self.transformed.err_y[mask]]
+            if self.X is not None:
+                X_list.insert(0, X[:, None, :])
+                T_list.insert(0, scipy.ones((len(y), 1)))
+                y_all.insert(0, y)
+                err_y_all.insert(0, err_y)
+            X_T, T = condense_transform(X_list, T_list)
+            self.gp = _SparseGaussianProcess(k, noise_k=noise_k, **kwargs)
+            self.gp.add_data(
+                X_T,
+                scipy.concatenate(y_all),
+                err_y=scipy.concatenate(err_y_all),
+                T=T
+            )
+        else:
+            self.gp = gptools.GaussianProcess(k, noise_k=noise_k, **kwargs)
+            if self.X is not None:
+                self.gp.add_data(X, y, err_y=err_y)
+        
+        self._warm_start = None
+        self._MAP_bounds = None
+        self._prediction_session = None
+        if warm_start is not None:
+            key = warm_start.make_key(self, kernel_name)
+            features = warm_start.get_features(self)
+            self._warm_start = (warm_start, key, features)
+            names = list(self.gp.free_param_names[:])
+            entries = warm_start.nearest(key, features, param_names=names)
+            if len(entries) > 0:
+                self.gp.free_params = entries[0]['params']
+                if shrink_bounds is not None:
+                    self._MAP_bounds = _shrink_bounds(
+                        scipy.asarray(self.gp.free_param_bounds, dtype=float),
+                        scipy.asarray([e['params'] for e in entries], dtype=float),
+                        shrink_bounds
+                    )
     
-    def find_gp_MAP_estimate(self, force_update=False, gp_kwargs={}, **kwargs):
+    def find_gp_MAP_estimate(self, force_update=False, gp_kwargs={}, executor=None,
+                             sampling=None, prune_after=None, prune_tol=10.0,
+                             **kwargs):
         """Find the MAP estimate for the hyperparameters of the Profile's Gaussian process.
         
         If this :py:class:`Profile` instance does not already have a Gaussian
@@ -1408,6 +2522,16 @@ class Profile(object):
         :py:class:`Profile` is otherwise mutated. This can be accomplished
         directly using the `force_update` keyword.
         
+        By default, the Gaussian process' :py:meth:`optimize_hyperparameters`
+        method is used. If any of `executor`, `sampling` or `prune_after` are
+        given, the random starts are instead run by profiletools: the starts
+        are spread across `executor`, each one optimizing its own copy of the
+        Gaussian process, and the time taken and the objective reached by each
+        start are reported in the ``starts`` attribute of the result. This is a
+        list with one dict per start, with keys 'x0' (the starting point), 'x'
+        (the end point), 'fun' (the negative log-posterior at `x`), 'success',
+        'time' (wall time in seconds) and 'pruned'.
+        
         Parameters
         ----------
         force_update : bool, optional
@@ -1418,13 +2542,76 @@ class Profile(object):
         gp_kwargs : dict, optional
             The entries of this dictionary are passed as kwargs to
             :py:meth:`create_gp` if it gets called. Default is {}.
+        executor : object with a :py:meth:`map` method, optional
+            The pool to run the starts on, for instance a
+            :py:class:`concurrent.futures.ThreadPoolExecutor`,
+            :py:class:`concurrent.futures.ProcessPoolExecutor` or
+            :py:class:`multiprocessing.pool.Pool`. Default is to run the starts
+            one after the other.
+        sampling : {'sobol', 'lhs', 'hyperprior'}, optional
+            How to pick the starting points: 'sobol' uses a scrambled Sobol
+            sequence (this needs :py:mod:`scipy.stats.qmc`) and 'lhs' uses a
+            Latin hypercube, both spanning the bounds of the hyperprior.
+            Hyperparameters with unbounded priors are drawn from the
+            hyperprior, as is everything with 'hyperprior'. Default is 'sobol',
+            or 'lhs' if :py:mod:`scipy.stats.qmc` is not available.
+        prune_after : positive int, optional
+            If given, each start is first only run for this many iterations of
+            the optimizer. Starts whose negative log-posterior is then worse
+            than the best by more than `prune_tol` are dropped, and only the
+            rest are run to convergence. Default is to run every start to
+            convergence.
+        prune_tol : float, optional
+            The tolerance in the log-posterior used when pruning starts.
+            Default is 10.0.
         **kwargs : optional parameters
             All other parameters are passed to the Gaussian process'
-            :py:meth:`optimize_hyperparameters` method.
+            :py:meth:`optimize_hyperparameters` method. When the starts are
+            run by profiletools, the `method`, `opt_kwargs`, `verbose`,
+            `random_starts`, `max_tries` and `num_proc` keywords are
+            supported, with the same meanings. If `num_proc` is given and no
+            `executor` is, the starts are run on a
+            :py:class:`multiprocessing.pool.Pool` with `num_proc` processes.
+        
+        When the Gaussian process was created with a `warm_start` store, the
+        starts are always run by profiletools and the hyperparameters taken
+        from the store are tried as the first start, in addition to the random
+        starts, so the warm start can only improve on a cold one.
         """
         if force_update or self.gp is None:
             self.create_gp(**gp_kwargs)
-        return self.gp.optimize_hyperparameters(**kwargs)
+        # Restrict the search when warm starting:
+        if self._MAP_bounds is not None:
+            opt_kwargs = dict(kwargs.get('opt_kwargs', None) or {})
+            opt_kwargs.setdefault('bounds', self._MAP_bounds)
+            kwargs['opt_kwargs'] = opt_kwargs
+        if (self._warm_start is None and executor is None and sampling is None
+                and prune_after is None):
+            res = self.gp.optimize_hyperparameters(**kwargs)
+        else:
+            num_proc = kwargs.pop('num_proc', None)
+            pool = None
+            if executor is None and num_proc is not None and num_proc > 1:
+                pool = multiprocessing.pool.Pool(processes=num_proc)
+                executor = pool
+            try:
+                res = _multistart_MAP(
+                    self.gp,
+                    executor=executor,
+                    sampling=sampling,
+                    prune_after=prune_after,
+                    prune_tol=prune_tol,
+                    include_current=self._warm_start is not None,
+                    **kwargs
+                )
+            finally:
+                if pool is not None:
+                    pool.close()
+        # Only remember hyperparameters the optimizer was happy with:
+        if self._warm_start is not None and res[0].success and scipy.isfinite(res[0].fun):
+            store, key, features = self._warm_start
+            store.record(key, features, self.gp)
+        return res
     
     def plot_gp(self, force_update=False, gp_kwargs={}, MAP_kwargs={}, **kwargs):
         """Plot the current state of the Profile's Gaussian process.
@@ -1515,42 +2702,1383 @@ class Profile(object):
             kwargs.pop('return_prediction', True)
             return self.gp.plot(X=X, n=n, return_prediction=True, **kwargs)
         else:
-            return self.gp.predict(X, n=n, **kwargs)
+            return self.get_prediction_session().predict(X, n=n, **kwargs)
+    
+    def get_prediction_session(self):
+        """Get the :py:class:`PredictionSession` for the current Gaussian process.
+        
+        The session is kept between calls, so that :py:meth:`smooth` and the
+        derived quantities computed from the fit share the factorization and
+        any predictions already made at the same points. A new session is
+        made whenever the Gaussian process is recreated.
+        """
+        if self._prediction_session is None or self._prediction_session.gp is not self.gp:
+            self._prediction_session = PredictionSession(self.gp)
+        return self._prediction_session
+    
+    def get_fit_predictor(self, force_update=False, gp_kwargs={}, MAP_kwargs={}):
+        """Get a lightweight :py:class:`FitPredictor` for the current fit.
+        
+        The predictor holds a copy of the Gaussian process with its Cholesky
+        factorization already computed, so it can make predictions (and be
+        saved with :py:meth:`FitPredictor.write`) without this profile.
+        
+        Parameters
+        ----------
+        force_update : bool, optional
+            If True, a new Gaussian process will be created and fit even if one
+            already exists. Default is False (use current Gaussian process if
+            it exists).
+        gp_kwargs : dict, optional
+            The entries of this dictionary are passed as kwargs to
+            :py:meth:`create_gp` if it gets called. Default is {}.
+        MAP_kwargs : dict, optional
+            The entries of this dictionary are passed as kwargs to
+            :py:meth:`find_gp_MAP_estimate` if it gets called. Default is {}.
+        """
+        if force_update or self.gp is None:
+            self.create_gp(**gp_kwargs)
+            self.find_gp_MAP_estimate(**MAP_kwargs)
+        return FitPredictor(self.gp, self.X_dim, self.X_units, self.y_units,
+                            self.X_labels, self.y_label)
+    
+    def write_npz(self, filename, compress=False):
+        """Writes this profile to a binary .npz file.
+        
+        Each of the data arrays, including `channels` and the arrays of
+        :py:attr:`transformed`, is stored as its own member of the archive, and
+        the labels, units and any other attributes which can be represented
+        as JSON (such as the shot and time window of a
+        :py:class:`BivariatePlasmaProfile`) are stored alongside them. Array
+        attributes are stored as arrays. The Gaussian process is not stored,
+        and any other attributes which cannot be represented are skipped with
+        a warning. Use :py:func:`read_npz` to read the file back.
+        
+        Parameters
+        ----------
+        filename : str
+            Path of the file to write. If the file exists, it will be
+            overwritten without warning. Note that :py:func:`scipy.savez` will
+            append ".npz" if it is not already present.
+        compress : bool, optional
+            If True, the members are compressed. Compressed files cannot be
+            memory mapped when they are read. Default is False.
+        """
+        arrays = {}
+        for name in ('y', 'X', 'err_y', 'err_X', 'channels'):
+            a = getattr(self, name)
+            if a is not None:
+                arrays[name] = a
+        for name in TransformedSet._array_names:
+            arrays['transformed_' + name] = getattr(self.transformed, name)
+        
+        attributes = {}
+        array_attributes = []
+        for k, v in vars(self).items():
+            if k.startswith('_') or k in self._unserialized_attributes:
+                continue
+            if isinstance(v, scipy.ndarray) and v.dtype != object:
+                arrays['attr_' + k] = v
+                array_attributes.append(k)
+                continue
+            try:
+                json.dumps(v, default=_to_json)
+            except (TypeError, ValueError):
+                warnings.warn("Attribute %s cannot be stored and is being "
+                              "skipped." % (k,), RuntimeWarning)
+            else:
+                attributes[k] = v
+        metadata = {
+            'class': type(self).__name__,
+            'attributes': attributes,
+            'array_attributes': array_attributes,
+            'transformed_y_labels': self.transformed.y_labels,
+            'transformed_y_units': self.transformed.y_units
+        }
+        arrays['__metadata__'] = scipy.array(json.dumps(metadata, default=_to_json))
+        
+        filename = os.path.expanduser(filename)
+        if compress:
+            scipy.savez_compressed(filename, **arrays)
+        else:
+            scipy.savez(filename, **arrays)
     
-    def write_csv(self, filename):
+    def write_csv(self, filename, transformed_filename=None, chunk_size=100000):
         """Writes this profile to a CSV file.
         
+        The transformed quantities, if there are any, are written to a second
+        CSV file in which each row is one quadrature point of one observation,
+        with columns giving the channel index, the observation index within
+        the channel, the abscissa values and their uncertainties, the weight
+        `T` of the point and the value and uncertainty of the observation. The
+        labels and units of the channels are written as metadata lines at the
+        start of that file. Use :py:func:`read_transformed_csv` to read it back.
+        
         Parameters
         ----------
         filename : str
             Path of the file to write. If the file exists, it will be
             overwritten without warning.
+        transformed_filename : str, optional
+            Path of the file to write the transformed quantities to. Default is
+            to insert "_transformed" before the extension of `filename`.
+        chunk_size : positive int, optional
+            Number of rows to format at a time. Default is 100000.
         """
-        # TODO: Add support for transformed quantities!
         # TODO: Add metadata (probably in CMod...)!
         # Could put metadata as a kwarg...
+        X_labels = [l + ' [' + u + ']' for l, u in zip(self.X_labels, self.X_units)]
+        err_X_labels = ['err_' + l for l in X_labels]
+        y_label = self.y_label + ' [' + self.y_units + ']'
+        
+        X = self.X
+        err_X = self.err_X
+        if X is None:
+            X = scipy.zeros((0, self.X_dim))
+            err_X = X
+        
+        filename = os.path.expanduser(filename)
+        with open(filename, 'w') as outfile:
+            write_csv_columns(
+                outfile,
+                X_labels + err_X_labels + [y_label, 'err_' + y_label],
+                [X, err_X, self.y, self.err_y],
+                chunk_size=chunk_size
+            )
+        
+        if len(self.transformed) == 0:
+            return
+        if transformed_filename is None:
+            root, ext = os.path.splitext(filename)
+            transformed_filename = root + '_transformed' + ext
+        t = self.transformed
+        # Flatten the present observations into rows of quadrature points:
+        mask = t.mask[:, :, None] & (
+            scipy.arange(t.X.shape[2]) < t.num_quad[:, None, None]
+        )
+        chan, obs, quad = scipy.nonzero(mask)
+        with open(os.path.expanduser(transformed_filename), 'w') as outfile:
+            # The labels are written as CSV rows so that they can contain
+            # commas:
+            outfile.write("metadata 3\n")
+            writer = csv.writer(outfile, lineterminator='\n')
+            writer.writerow(['y_labels'] + list(t.y_labels))
+            writer.writerow(['y_units'] + list(t.y_units))
+            write_csv_columns(
+                outfile,
+                ['channel', 'observation'] + X_labels + err_X_labels +
+                ['T', 'y', 'err_y'],
+                [
+                    chan,
+                    obs,
+                    t.X[chan, obs, quad],
+                    t.err_X[chan, obs, quad],
+                    t.T[chan, obs, quad],
+                    t.y[chan, obs],
+                    t.err_y[chan, obs]
+                ],
+                chunk_size=chunk_size
+            )
+    
+    def to_shared_memory(self):
+        """Copy the data arrays of this profile into a shared memory block.
+        
+        The returned :py:class:`SharedProfile` is a small, picklable handle
+        which can be passed to worker processes (for instance in the arguments
+        to :py:meth:`multiprocessing.pool.Pool.map`). Calling
+        :py:meth:`SharedProfile.attach` in the worker rebuilds the profile with
+        its arrays backed directly by the shared block, so a batch of fits to
+        the same data does not need a copy of the data for every process.
+        
+        The arrays of the rebuilt profiles are read-only: as with
+        :py:meth:`copy`, the methods which change the data make their own
+        copies first. The Gaussian process is not shared. All other
+        attributes are pickled into the handle, so any EFIT tree of a
+        :py:class:`~profiletools.CMod.BivariatePlasmaProfile` must first be
+        replaced with a snapshot using
+        :py:meth:`~profiletools.CMod.BivariatePlasmaProfile.snapshot_efit`.
+        
+        The process which created the block must call
+        :py:meth:`SharedProfile.unlink` (or use the handle as a context
+        manager) once all of the workers are done with it.
+        
+        Returns
+        -------
+        handle : :py:class:`SharedProfile`
+            The handle to the shared data.
+        """
+        return SharedProfile(self)
+
+def _multistart_MAP(gp, executor=None, sampling=None, prune_after=None,
+                    prune_tol=10.0, method='SLSQP', opt_kwargs={}, verbose=False,
+                    random_starts=None, max_tries=1, include_current=False):
+    """Find the MAP estimate of the hyperparameters of `gp` from several starts.
+    
+    See :py:meth:`Profile.find_gp_MAP_estimate` for a description of the
+    parameters. If `include_current` is True, the current free hyperparameters
+    of `gp` are tried as the first start, ahead of the `random_starts` random
+    ones. Leaves `gp` in the optimized state.
+    
+    Returns
+    -------
+    res_min : :py:class:`scipy.optimize.OptimizeResult`
+        The result of the best start, with the report on all of the starts in
+        its ``starts`` attribute.
+    num_complete : int
+        The number of starts which completed.
+    """
+    opt_kwargs = dict(opt_kwargs)
+    opt_kwargs.setdefault('method', method)
+    if 'bounds' in opt_kwargs:
+        sample_bounds = scipy.asarray(opt_kwargs['bounds'], dtype=float)
+    else:
+        sample_bounds = scipy.asarray(gp.free_param_bounds, dtype=float)
+        param_ranges = sample_bounds.copy()
+        # Replace unbounded variables with something big:
+        param_ranges[~scipy.isfinite(param_ranges[:, 0]), 0] = -1e16
+        param_ranges[~scipy.isfinite(param_ranges[:, 1]), 1] = 1e16
+        opt_kwargs['bounds'] = param_ranges
+    if gp.use_hyper_deriv:
+        opt_kwargs['jac'] = True
+    if random_starts is None:
+        random_starts = multiprocessing.cpu_count()
+    map_fun = map if executor is None else executor.map
+    current = scipy.atleast_2d(scipy.asarray(gp.free_params[:], dtype=float))
+    
+    for trial in range(0, max_tries):
+        if random_starts == 0:
+            # Only use the current state:
+            x0 = current
+        else:
+            x0 = _sample_starts(gp, random_starts, sampling, sample_bounds)
+            if include_current:
+                x0 = scipy.vstack((current, x0))
+        starts = [
+            {'x0': x, 'x': x, 'fun': scipy.inf, 'success': False, 'time': 0.0, 'pruned': False}
+            for x in x0
+        ]
+        active = list(range(0, len(starts)))
+        if prune_after is not None:
+            options = dict(opt_kwargs.get('options', {}))
+            options['maxiter'] = prune_after
+            stage_kwargs = dict(opt_kwargs, options=options)
+            for i, (res, t) in zip(active, map_fun(_MAPStart(gp, stage_kwargs), x0)):
+                starts[i]['time'] += t
+                if res is not None and scipy.isfinite(res.fun):
+                    starts[i].update(x=res.x, fun=res.fun)
+            best = min(st['fun'] for st in starts)
+            for st in starts:
+                st['pruned'] = not st['fun'] <= best + prune_tol
+            active = [i for i, st in enumerate(starts) if not st['pruned']]
+        results = {}
+        for i, (res, t) in zip(
+                active,
+                map_fun(_MAPStart(gp, opt_kwargs), [starts[i]['x'] for i in active])):
+            starts[i]['time'] += t
+            if res is not None:
+                starts[i].update(x=res.x, fun=res.fun, success=res.success)
+                results[i] = res
+        valid = [i for i in results if scipy.isfinite(results[i].fun)]
+        if len(valid) > 0:
+            break
+        if verbose:
+            warnings.warn(
+                "No solutions found on trial %d, retrying random starts." % (trial,),
+                RuntimeWarning
+            )
+    else:
+        raise ValueError(
+            "Optimizer failed to find a valid solution. Try changing the "
+            "parameter bounds, picking a new initial guess or increasing the "
+            "number of random starts."
+        )
+    
+    res_min = results[min(valid, key=lambda i: results[i].fun)]
+    gp.update_hyperparameters(res_min.x)
+    if verbose:
+        print("start\ttime [s]\t-ln(post)\tstatus")
+        for i, st in enumerate(starts):
+            status = 'pruned' if st['pruned'] else ('ok' if st['success'] else 'failed')
+            print("%d\t%.3g\t%.6g\t%s" % (i, st['time'], st['fun'], status))
+        print("Got %d completed starts, optimal result is:" % (len(results),))
+        print(res_min)
+    res_min.starts = starts
+    if not res_min.success:
+        warnings.warn(
+            "Optimizer %s reports failure, selected hyperparameters are "
+            "likely NOT optimal. Status: %d, Message: '%s'. Try adjusting "
+            "bounds, initial guesses or the number of random starts used."
+            % (opt_kwargs['method'], res_min.status, res_min.message),
+            RuntimeWarning
+        )
+    return (res_min, len(results))
+
+def _sample_starts(gp, num, sampling, bounds):
+    """Draw `num` starting points for the free hyperparameters of `gp`.
+    
+    Returns an array of shape (`num`, `num_free_params`). See
+    :py:meth:`Profile.find_gp_MAP_estimate` for the options for `sampling`.
+    The quasi-random points span `bounds`, an array of shape
+    (`num_free_params`, 2).
+    """
+    if sampling is None:
+        # Sobol sampling needs scipy 1.7 or later, so only insist on it when
+        # it is asked for:
+        sampling = 'sobol' if hasattr(scipy.stats, 'qmc') else 'lhs'
+    x0 = scipy.atleast_2d(gp.hyperprior.random_draw(size=num).T)[:, ~gp.fixed_params]
+    if sampling == 'hyperprior':
+        return x0
+    num_dim = len(bounds)
+    if sampling == 'lhs':
+        # One point in each of num strata along every dimension, with the
+        # strata shuffled independently:
+        strata = scipy.random.uniform(size=(num, num_dim)).argsort(axis=0)
+        u = (strata + scipy.random.uniform(size=(num, num_dim))) / num
+    elif sampling == 'sobol':
+        if not hasattr(scipy.stats, 'qmc'):
+            raise ValueError(
+                "Sobol sampling requires scipy.stats.qmc, use sampling='lhs' "
+                "instead!"
+            )
+        with warnings.catch_warnings():
+            # The balance properties only hold for powers of two, which is
+            # not worth restricting num to:
+            warnings.simplefilter('ignore')
+            u = scipy.stats.qmc.Sobol(num_dim, scramble=True).random(num)
+    else:
+        raise ValueError("Unknown sampling method '%s'!" % (sampling,))
+    bounded = (scipy.absolute(bounds) < 1e16).all(axis=1)
+    x0[:, bounded] = (
+        bounds[bounded, 0] + u[:, bounded] * (bounds[bounded, 1] - bounds[bounded, 0])
+    )
+    return x0
+
+class _MAPStart(object):
+    """Run a single start of the MAP estimate, as used by :py:func:`_multistart_MAP`.
+    
+    Each call optimizes its own copy of the hyperparameters, so that starts
+    can run in parallel threads. Returns the result of
+    :py:func:`scipy.optimize.minimize` (None if it failed) and the time taken.
+    
+    Parameters
+    ----------
+    gp : :py:class:`gptools.GaussianProcess`
+        The Gaussian process to optimize.
+    opt_kwargs : dict
+        Keywords to pass to :py:func:`scipy.optimize.minimize`.
+    """
+    def __init__(self, gp, opt_kwargs):
+        self.gp = gp
+        self.opt_kwargs = opt_kwargs
+    
+    def __call__(self, x0):
+        # The data are shared, only the state which the update changes is
+        # copied:
+        gp = copy.copy(self.gp)
+        gp.k = copy.deepcopy(gp.k)
+        gp.noise_k = copy.deepcopy(gp.noise_k)
+        if gp.mu is not None:
+            gp.mu = copy.deepcopy(gp.mu)
+        t_start = time.time()
+        try:
+            res = scipy.optimize.minimize(gp.update_hyperparameters, x0, **self.opt_kwargs)
+        except Exception:
+            if gp.verbose:
+                warnings.warn(
+                    "Minimizer failed, skipping start. State of params is: %s"
+                    % (x0,),
+                    RuntimeWarning
+                )
+            res = None
+        return res, time.time() - t_start
+
+def _shrink_bounds(bounds, params, frac):
+    """Restrict `bounds` to the range spanned by `params`, widened by `frac`.
+    
+    Parameters
+    ----------
+    bounds : array, (`num_params`, 2)
+        The original bounds. These may be infinite.
+    params : array, (`num_entries`, `num_params`)
+        The hyperparameters to span.
+    frac : float
+        Fraction of the width of the original bounds to widen the range by on
+        either side. Where the original bounds are infinite, the width of the
+        range itself (or the magnitude of the parameter, if all entries agree)
+        is used instead.
+    """
+    lo = params.min(axis=0)
+    hi = params.max(axis=0)
+    width = bounds[:, 1] - bounds[:, 0]
+    unbounded = ~scipy.isfinite(width)
+    width[unbounded] = scipy.maximum(
+        hi[unbounded] - lo[unbounded],
+        scipy.absolute(hi[unbounded])
+    )
+    new_bounds = scipy.column_stack((lo - frac * width, hi + frac * width))
+    new_bounds[:, 0] = scipy.maximum(new_bounds[:, 0], bounds[:, 0])
+    new_bounds[:, 1] = scipy.minimum(new_bounds[:, 1], bounds[:, 1])
+    return new_bounds
+
+class HyperparameterStore(object):
+    """Persistent library of MAP hyperparameters, used to warm start new fits.
+    
+    Each entry holds the free hyperparameters of one MAP estimate along with
+    a key identifying the kind of fit (the signal, the diagnostic systems, the
+    kernel and the abscissa) and a few features summarizing the data (the
+    typical magnitude of `y` and the range of each dimension of `X`). New fits
+    of the same kind are started from the entries whose features are nearest
+    to theirs. Pass an instance as the `warm_start` keyword of
+    :py:meth:`Profile.create_gp` to use it.
+    
+    The entries are kept in a file with one JSON object per line, which is
+    only ever appended to, so several processes may record into the same file.
+    
+    Parameters
+    ----------
+    filename : str, optional
+        Path of the file to keep the entries in. It is created when the first
+        entry is recorded. Default is None (only keep the entries in memory).
+    num_nearest : positive int, optional
+        The number of nearest entries to use when warm starting. The initial
+        guess comes from the nearest one, and the bounds are shrunk to span
+        all of them. Default is 5.
+    """
+    def __init__(self, filename=None, num_nearest=5):
+        self.filename = None if filename is None else os.path.expanduser(filename)
+        self.num_nearest = num_nearest
+        self.entries = []
+        self.reload()
+    
+    def reload(self):
+        """Read the entries from the file again, picking up those recorded by other processes.
+        """
+        self.entries = []
+        if self.filename is None or not os.path.isfile(self.filename):
+            return
+        with open(self.filename, 'r') as infile:
+            for line in infile:
+                line = line.strip()
+                if line:
+                    self.entries.append(json.loads(line))
+    
+    @staticmethod
+    def make_key(profile, kernel):
+        """Make the key identifying fits of the same kind as `profile` with `kernel`.
+        
+        The signal and systems are given by the `signal` and `systems`
+        attributes of `profile`, if present, falling back to its `y_label`. The
+        abscissa is given by its `abscissa` attribute, falling back to its
+        `X_labels`.
+        
+        Parameters
+        ----------
+        profile : :py:class:`Profile`
+            The profile to be fit.
+        kernel : str
+            The name of the kernel.
+        """
+        systems = getattr(profile, 'systems', None)
+        if systems is None:
+            systems = [profile.y_label]
+        return {
+            'signal': getattr(profile, 'signal', profile.y_label),
+            'systems': sorted(systems),
+            'kernel': kernel,
+            'abscissa': getattr(profile, 'abscissa', ','.join(profile.X_labels))
+        }
+    
+    @staticmethod
+    def get_features(profile):
+        """Get the features used to find the stored entries nearest to `profile`.
+        
+        These are the base-10 logarithm of the 95th percentile of the magnitude
+        of `y` and the minimum and maximum of each dimension of `X`, including
+        the transformed quantities.
+        """
+        # Profiles with only transformed quantities have no single points:
+        y = []
+        X = []
+        if profile.X is not None and profile.y is not None:
+            y.append(scipy.asarray(profile.y, dtype=float).ravel())
+            X.append(scipy.asarray(profile.X, dtype=float).reshape(-1, profile.X_dim))
+        mask = profile.transformed.mask
+        if mask.any():
+            y.append(profile.transformed.y[mask])
+            X.append(profile.transformed.X[mask].reshape(-1, profile.X_dim))
+        if sum(len(v) for v in y) == 0:
+            return [0.0] + [0.0] * (2 * profile.X_dim)
+        y = scipy.absolute(scipy.concatenate(y))
+        X = scipy.concatenate(X)
+        y_scale = scipy.percentile(y, 95)
+        return (
+            [float(scipy.log10(y_scale)) if y_scale > 0 else 0.0] +
+            [float(v) for v in X.min(axis=0)] +
+            [float(v) for v in X.max(axis=0)]
+        )
+    
+    def record(self, key, features, gp):
+        """Record the current hyperparameters of `gp` as an entry.
+        
+        Parameters
+        ----------
+        key : dict
+            The key from :py:meth:`make_key`.
+        features : list of float
+            The features from :py:meth:`get_features`.
+        gp : :py:class:`gptools.GaussianProcess`
+            The Gaussian process, in the state found by the MAP estimate.
+        """
+        entry = {
+            'key': key,
+            'features': list(features),
+            'params': [float(v) for v in gp.free_params[:]],
+            'param_names': list(gp.free_param_names[:]),
+            'll': float(gp.ll)
+        }
+        self.entries.append(entry)
+        if self.filename is not None:
+            with open(self.filename, 'a') as outfile:
+                outfile.write(json.dumps(entry, sort_keys=True) + '\n')
+    
+    def nearest(self, key, features, param_names=None):
+        """Find the stored entries nearest to `features` with the same `key`.
+        
+        Each feature is scaled by its spread among the matching entries, so
+        that the distance does not depend on the units of the data.
+        
+        Parameters
+        ----------
+        key : dict
+            The key from :py:meth:`make_key`.
+        features : list of float
+            The features from :py:meth:`get_features`.
+        param_names : list of str, optional
+            If given, only entries with these free hyperparameters are used.
+        
+        Returns
+        -------
+        entries : list of dict
+            Up to :py:attr:`num_nearest` entries, nearest first.
+        """
+        key = json.dumps(key, sort_keys=True)
+        entries = [
+            e for e in self.entries
+            if json.dumps(e['key'], sort_keys=True) == key and
+            len(e['features']) == len(features) and
+            (param_names is None or e['param_names'] == list(param_names))
+        ]
+        if len(entries) == 0:
+            return []
+        F = scipy.asarray([e['features'] for e in entries], dtype=float)
+        scale = F.std(axis=0)
+        scale[scale == 0] = 1.0
+        dist = (((F - scipy.asarray(features, dtype=float)) / scale)**2).sum(axis=1)
+        return [entries[i] for i in dist.argsort(kind='mergesort')[:self.num_nearest]]
+
+class PredictionSession(object):
+    """Cached predictions from a fitted Gaussian process.
+    
+    The Cholesky factorization of the training covariance and `alpha`
+    (:math:`K^{-1}y`) are computed once, and the posterior mean and covariance
+    at each distinct set of points and derivative orders requested is kept, so
+    asking for the value, the derivatives or any linear functional (such as a
+    volume average or a line integral) at points already seen only costs a few
+    matrix products. The covariance is only computed once it is asked for, so
+    predictions of just the mean cost the same as with gptools. If the
+    hyperparameters or data of the Gaussian process change, the cache is
+    cleared automatically.
+    
+    Use :py:meth:`Profile.get_prediction_session` to get the session for a
+    profile, which is also what :py:meth:`Profile.smooth` and the derived
+    quantities use.
+    
+    Parameters
+    ----------
+    gp : :py:class:`gptools.GaussianProcess`
+        The Gaussian process to make predictions with.
+    max_bytes : positive int, optional
+        The most memory the cached means and covariances may use. The least
+        recently used ones are dropped when this is exceeded, and a single
+        prediction larger than this is not cached at all. Default is 128 MiB.
+    
+    Attributes
+    ----------
+    hits : int
+        The number of predictions served from the cache.
+    misses : int
+        The number of predictions which had to be computed.
+    factorizations : int
+        The number of times the training covariance was factored.
+    """
+    # Keywords of gptools.GaussianProcess.predict which need it to do the work:
+    _uncached_keywords = ('use_MCMC', 'return_samples', 'full_MC', 'rejection_func',
+                          'return_mean_func')
+    
+    def __init__(self, gp, max_bytes=128 * 1024**2):
+        self.gp = gp
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.factorizations = 0
+        self._alpha = None
+        self._cache = collections.OrderedDict()
+        self._nbytes = 0
+    
+    @property
+    def nbytes(self):
+        """The memory used by the cached predictions.
+        """
+        return self._nbytes
+    
+    def clear(self):
+        """Drop all of the cached predictions.
+        """
+        self._cache.clear()
+        self._nbytes = 0
+    
+    def _check_factorization(self):
+        """Factor the training covariance if needed, clearing the cache if it changed.
+        """
+        self.gp.compute_K_L_alpha_ll()
+        # The factorization is only redone when the hyperparameters or data
+        # change, in which case alpha is a new array:
+        if self.gp.alpha is not self._alpha:
+            self._alpha = self.gp.alpha
+            self.factorizations += 1
+            self.clear()
+    
+    def _posterior(self, Xstar, n, noise, need_cov=True):
+        """Get the posterior mean and covariance at `Xstar` with derivative orders `n`.
+        
+        The covariance is None unless `need_cov` is True or it was already
+        cached.
+        """
+        self._check_factorization()
+        key = (Xstar.shape, Xstar.tobytes(), n.tobytes(), bool(noise))
+        entry = self._cache.pop(key, None)
+        if entry is not None:
+            self._nbytes -= entry[0].nbytes + (entry[1].nbytes if entry[1] is not None else 0)
+            if entry[1] is not None or not need_cov:
+                self.hits += 1
+                self._store(key, entry)
+                return entry
+        self.misses += 1
+        gp = self.gp
+        Kstar = gp.compute_Kij(gp.X, Xstar, gp.n, n)
+        if noise:
+            Kstar = Kstar + gp.compute_Kij(gp.X, Xstar, gp.n, n, noise=True)
+        if gp.T is not None:
+            Kstar = gp.T.dot(Kstar)
+        mean = Kstar.T.dot(gp.alpha).ravel()
+        if gp.mu is not None:
+            mean = mean + scipy.asarray(gp.mu(Xstar, n)).ravel()
+        if need_cov:
+            Kstarstar = gp.compute_Kij(Xstar, None, n, None)
+            if noise:
+                Kstarstar = Kstarstar + gp.compute_Kij(Xstar, None, n, None, noise=True)
+            v = scipy.linalg.solve_triangular(gp.L, Kstar, lower=True)
+            cov = Kstarstar - v.T.dot(v)
+        else:
+            cov = None
+        entry = (mean, cov)
+        self._store(key, entry)
+        return entry
+    
+    def _store(self, key, entry):
+        """Put `entry` in the cache as the most recently used, dropping old entries to stay under :py:attr:`max_bytes`.
+        """
+        nbytes = entry[0].nbytes + (entry[1].nbytes if entry[1] is not None else 0)
+        if nbytes > self.max_bytes:
+            return
+        self._cache[key] = entry
+        self._nbytes += nbytes
+        while self._nbytes > self.max_bytes:
+            dum, old = self._cache.popitem(last=False)
+            self._nbytes -= old[0].nbytes + (old[1].nbytes if old[1] is not None else 0)
+    
+    def predict(self, Xstar, n=0, noise=False, return_std=True, return_cov=False,
+                full_output=False, output_transform=None, **kwargs):
+        """Predict the mean and covariance at the inputs `Xstar`.
+        
+        This takes the same arguments and returns the same results as
+        :py:meth:`gptools.GaussianProcess.predict`. Predictions using MCMC or
+        random samples are passed straight through to it, uncached.
+        
+        Parameters
+        ----------
+        Xstar : array, (`M`, `D`)
+            `M` test input values of dimension `D`.
+        n : array, (`M`, `D`) or scalar, non-negative int, optional
+            Order of derivative to predict. Default is 0 (the value).
+        noise : bool, optional
+            Whether or not noise should be included in the covariance. Default
+            is False.
+        return_std : bool, optional
+            If True, the standard deviation is also returned. Default is True.
+        return_cov : bool, optional
+            If True, the covariance matrix is returned instead of the standard
+            deviation. Default is False.
+        full_output : bool, optional
+            If True, a dict with keys 'mean', 'std' and 'cov' is returned.
+            Default is False.
+        output_transform : array or sparse matrix, (`L`, `M`), optional
+            Matrix to apply to the predictions, giving `L` linear functionals
+            of them. A sparse matrix is only expanded if it has to be passed to
+            gptools. Default is None (no transform).
+        **kwargs : optional parameters
+            Any other keywords for :py:meth:`gptools.GaussianProcess.predict`.
+        """
+        if any(kwargs.get(k, False) for k in self._uncached_keywords):
+            if scipy.sparse.issparse(output_transform):
+                output_transform = output_transform.toarray()
+            return self.gp.predict(
+                Xstar,
+                n=n,
+                noise=noise,
+                return_std=return_std,
+                return_cov=return_cov,
+                full_output=full_output,
+                output_transform=output_transform,
+                **kwargs
+            )
+        Xstar = self._process_Xstar(Xstar)
+        try:
+            iter(n)
+        except TypeError:
+            n = n * scipy.ones(Xstar.shape, dtype=int)
+        else:
+            n = scipy.atleast_2d(scipy.asarray(n, dtype=int))
+            if self.gp.num_dim == 1 and n.shape[0] == 1:
+                n = n.T
+            if n.shape != Xstar.shape:
+                raise ValueError(
+                    "When using array-like n, shape must match shape of Xstar! "
+                    "Shape of n given is %s, shape of Xstar given is %s."
+                    % (n.shape, Xstar.shape)
+                )
+        if (n < 0).any():
+            raise ValueError("All elements of n must be non-negative integers!")
+        n = scipy.ascontiguousarray(n, dtype=int)
+        
+        need_cov = return_std or return_cov or full_output
+        mean, cov = self._posterior(scipy.ascontiguousarray(Xstar), n, noise, need_cov=need_cov)
+        if output_transform is not None:
+            if not scipy.sparse.issparse(output_transform):
+                output_transform = scipy.atleast_2d(scipy.asarray(output_transform, dtype=float))
+            if output_transform.shape[1] != Xstar.shape[0]:
+                raise ValueError(
+                    "output_transform must have the same number of columns "
+                    "the number of rows in Xstar! Shape of output_transform "
+                    "given is %s, shape of Xstar is %s."
+                    % (output_transform.shape, Xstar.shape,)
+                )
+            mean = output_transform.dot(mean)
+            if need_cov:
+                # cov is symmetric, so this works for a sparse transform too:
+                cov = output_transform.dot(output_transform.dot(cov).T)
+        else:
+            # Don't let callers modify the cached arrays:
+            mean = mean.copy()
+            if need_cov:
+                cov = cov.copy()
+        if full_output:
+            return {'mean': mean, 'std': scipy.sqrt(scipy.diagonal(cov)), 'cov': cov}
+        elif return_cov:
+            return (mean, cov)
+        elif return_std:
+            return (mean, scipy.sqrt(scipy.diagonal(cov)))
+        else:
+            return mean
+    
+    def _process_Xstar(self, Xstar):
+        """Check the test inputs `Xstar` and convert them to a (`M`, `D`) array.
+        """
+        Xstar = scipy.atleast_2d(scipy.asarray(Xstar, dtype=float))
+        # Handle 1d x case where array is passed in:
+        if self.gp.num_dim == 1 and Xstar.shape[0] == 1:
+            Xstar = Xstar.T
+        if Xstar.shape[1] != self.gp.num_dim:
+            raise ValueError(
+                "Second dimension of Xstar must be equal to the number of "
+                "dimensions of the Gaussian process! Shape of Xstar given is %s, "
+                "num_dim is %d." % (Xstar.shape, self.gp.num_dim)
+            )
+        return Xstar
+    
+    def predict_local(self, Xstar, orders=(0, 1), noise=False):
+        """Predict several derivatives at each point, with only the covariances between them at the same point.
+        
+        This gives the same means, variances and same-point covariances as
+        :py:meth:`predict` with the derivative orders stacked, but never forms
+        the covariance between different points, so the memory needed is
+        linear in the number of points. This is what is needed to propagate
+        errors into pointwise quantities like a/L on dense grids. The results
+        are not cached.
+        
+        Parameters
+        ----------
+        Xstar : array, (`M`, `D`)
+            `M` test input values of dimension `D`.
+        orders : list of non-negative int or array, (`D`,), optional
+            The `K` derivative orders to predict at each point. Default is
+            (0, 1) (the value and first derivative).
+        noise : bool, optional
+            Whether or not noise should be included in the covariance. Default
+            is False.
+        
+        Returns
+        -------
+        mean : array, (`K`, `M`)
+            The mean of each derivative at each point.
+        cov : array, (`K`, `K`, `M`)
+            The covariance between each pair of derivatives at each point.
+        """
+        self._check_factorization()
+        self.misses += 1
+        gp = self.gp
+        Xstar = self._process_Xstar(Xstar)
+        n = [
+            scipy.zeros(Xstar.shape, dtype=int) + scipy.asarray(o, dtype=int)
+            for o in orders
+        ]
+        mean = scipy.zeros((len(n), len(Xstar)))
+        cov = scipy.zeros((len(n), len(n), len(Xstar)))
+        v = []
+        for a, n_a in enumerate(n):
+            Kstar = gp.compute_Kij(gp.X, Xstar, gp.n, n_a)
+            if noise:
+                Kstar = Kstar + gp.compute_Kij(gp.X, Xstar, gp.n, n_a, noise=True)
+            if gp.T is not None:
+                Kstar = gp.T.dot(Kstar)
+            mean[a] = Kstar.T.dot(gp.alpha).ravel()
+            if gp.mu is not None:
+                mean[a] += scipy.asarray(gp.mu(Xstar, n_a)).ravel()
+            v.append(scipy.linalg.solve_triangular(gp.L, Kstar, lower=True))
+        for a, n_a in enumerate(n):
+            for b in range(a, len(n)):
+                # The prior covariance at the same point, evaluated pointwise:
+                prior = gp.k(Xstar, Xstar, n_a, n[b], symmetric=True)
+                if noise:
+                    prior = prior + gp.noise_k(Xstar, Xstar, n_a, n[b], symmetric=True)
+                cov[a, b] = prior - (v[a] * v[b]).sum(axis=0)
+                cov[b, a] = cov[a, b]
+        return (mean, cov)
+    
+    def predict_line_integrals(self, transformed, **kwargs):
+        """Predict the line integrals (or other transformed quantities) of a :py:class:`TransformedSet`.
+        
+        All of the observations are predicted with a single call to
+        :py:meth:`predict`, so repeating this for the same set is served
+        entirely from the cache.
+        
+        Parameters
+        ----------
+        transformed : :py:class:`TransformedSet`
+            The quantities to predict, for instance the chords of an
+            interferometer.
+        **kwargs : optional parameters
+            All other parameters are passed to :py:meth:`predict`.
+        
+        Returns
+        -------
+        The result of :py:meth:`predict` for the observations of each channel
+        in turn, in the order they are stored.
+        """
+        mask = transformed.mask
+        X, T = condense_transform([transformed.X[mask]], [transformed.T[mask]])
+        return self.predict(X, output_transform=T, **kwargs)
+    
+    def __getstate__(self):
+        # The cache can be rebuilt, don't store it:
+        state = self.__dict__.copy()
+        state['_alpha'] = None
+        state['_cache'] = collections.OrderedDict()
+        state['_nbytes'] = 0
+        return state
+
+class LinearFunctionals(object):
+    """A collection of named linear functionals of a fitted profile.
+    
+    Each functional is stored as a block of rows of a sparse transform acting
+    on the latent profile (or its derivatives) at a set of points. Any
+    combination of them is evaluated with a single prediction, so the joint
+    covariance between all of them is available and points shared between
+    functionals (such as the value and the volume average on the same grid)
+    are only predicted once.
+    
+    Parameters
+    ----------
+    X_dim : positive int, optional
+        The number of dimensions of the profile's abscissa. Default is 1.
+    
+    Examples
+    --------
+    Evaluate the profile, its gradient, the volume average and the peaking
+    core point in one go::
+        
+        lf = LinearFunctionals()
+        lf.add_value('val', X)
+        lf.add_derivative('grad', X)
+        lf.add_volume_average('vol_avg', p)
+        lf.add_peaking_core('core', p)
+        res = lf.evaluate(p)
+        res['mean_vol_avg'], res['std_vol_avg']
+    """
+    def __init__(self, X_dim=1):
+        self.X_dim = X_dim
+        self.names = []
+        self._blocks = {}
+    
+    def __contains__(self, name):
+        return name in self._blocks
+    
+    def __len__(self):
+        return len(self.names)
+    
+    @property
+    def num_rows(self):
+        """The total number of outputs of all of the functionals.
+        """
+        return sum(self._blocks[name][2].shape[0] for name in self.names)
+    
+    def add(self, name, X, T=None, n=0):
+        """Add a functional given its points and weights.
+        
+        Parameters
+        ----------
+        name : str
+            The name of the functional, used to label the results.
+        X : array, (`M`, `X_dim`)
+            The points the functional depends on.
+        T : array or sparse matrix, (`L`, `M`), optional
+            The weights of the `L` outputs of the functional on the (derivative
+            of the) profile at `X`. Default is None (the identity, giving the
+            profile at each point).
+        n : array, (`M`, `X_dim`) or non-negative int, optional
+            The order of derivative to take at each point. Default is 0 (the
+            value).
+        """
+        if name in self._blocks:
+            raise ValueError("Functional %s already exists!" % (name,))
+        X = scipy.asarray(X, dtype=float)
+        if X.ndim <= 1:
+            X = X.reshape((-1, self.X_dim))
+        if X.shape[1] != self.X_dim:
+            raise ValueError(
+                "Second dimension of X must be equal to X_dim! Shape of X given "
+                "is %s, X_dim is %d." % (X.shape, self.X_dim)
+            )
+        n = scipy.asarray(n, dtype=int)
+        if n.ndim == 0:
+            n = n * scipy.ones(X.shape, dtype=int)
+        else:
+            n = n.reshape(X.shape)
+        if T is None:
+            T = scipy.sparse.identity(len(X), format='csr')
+        else:
+            if not scipy.sparse.issparse(T):
+                T = scipy.atleast_2d(T)
+            T = scipy.sparse.csr_matrix(T)
+            if T.shape[1] != len(X):
+                raise ValueError(
+                    "T must have the same number of columns as there are rows "
+                    "in X! Shape of T given is %s, shape of X is %s."
+                    % (T.shape, X.shape)
+                )
+        self.names.append(name)
+        self._blocks[name] = (X, n, T)
+    
+    def add_value(self, name, X):
+        """Add the value of the profile at the points `X`.
+        """
+        self.add(name, X)
+    
+    def add_derivative(self, name, X, n=1):
+        """Add the derivative of order `n` of the profile at the points `X`.
+        """
+        self.add(name, X, n=n)
+    
+    def add_transformed(self, name, transformed):
+        """Add the observations of a :py:class:`Channel` or :py:class:`TransformedSet`, such as the chords of an interferometer.
+        
+        There is one output for each observation, in the order they are stored.
+        """
+        if isinstance(transformed, TransformedSet):
+            mask = transformed.mask
+            X, T = condense_transform([transformed.X[mask]], [transformed.T[mask]])
+        else:
+            X, T = condense_transform([transformed.X], [transformed.T])
+        self.add(name, X, T=T)
+    
+    def add_volume_average(self, name, profile, grid=None, npts=400):
+        """Add the volume average of the profile.
+        
+        `profile` must be a :py:class:`~profiletools.CMod.BivariatePlasmaProfile`,
+        see :py:meth:`~profiletools.CMod.BivariatePlasmaProfile.compute_volume_average`
+        for the meanings of `grid` and `npts`.
+        """
+        rho_grid, weights = profile._make_volume_averaging_matrix(rho_grid=grid, npts=npts)
+        self.add(name, rho_grid, T=weights)
+    
+    def add_peaking_core(self, name, profile):
+        """Add the value of the profile at the core point used for the peaking.
+        
+        `profile` must be a :py:class:`~profiletools.CMod.BivariatePlasmaProfile`,
+        see :py:meth:`~profiletools.CMod.BivariatePlasmaProfile.compute_peaking`.
+        """
+        self.add(name, [profile.get_peaking_core_location()])
+    
+    def assemble(self, names=None, X=None, n=0):
+        """Assemble the functionals into a single transform.
+        
+        Parameters
+        ----------
+        names : list of str, optional
+            The functionals to include, in order. Default is all of them in the
+            order they were added.
+        X : array, (`K`, `X_dim`), optional
+            Other points to predict the profile (or its derivatives) at. Their
+            outputs are the first `K` rows of `T`, ahead of the functionals,
+            and they are merged with the functionals' points. Default is None
+            (only the functionals).
+        n : array, (`K`, `X_dim`) or non-negative int, optional
+            The order of derivative to take at each of the points in `X`.
+            Default is 0 (the value).
+        
+        Returns
+        -------
+        X : array, (`U`, `X_dim`)
+            The unique points needed.
+        n : array, (`U`, `X_dim`)
+            The derivative orders at each point.
+        T : :py:class:`scipy.sparse.csr_matrix`, (`L`, `U`)
+            The transform giving all of the outputs.
+        slices : dict
+            The rows of `T` belonging to each functional, counted from after
+            the rows for `X`.
+        """
+        if names is None:
+            names = self.names
+        if len(names) == 0:
+            raise ValueError("No functionals to assemble!")
+        blocks = [self._blocks[name] for name in names]
+        slices = {}
+        start = 0
+        for name, b in zip(names, blocks):
+            slices[name] = slice(start, start + b[2].shape[0])
+            start += b[2].shape[0]
+        if X is not None:
+            X = scipy.asarray(X, dtype=float).reshape((-1, self.X_dim))
+            n = scipy.asarray(n, dtype=int)
+            if n.ndim == 0:
+                n = n * scipy.ones(X.shape, dtype=int)
+            else:
+                n = n.reshape(X.shape)
+            blocks = [(X, n, scipy.sparse.identity(len(X), format='csr'))] + blocks
+        X = scipy.vstack([b[0] for b in blocks])
+        n = scipy.vstack([b[1] for b in blocks])
+        T = scipy.sparse.block_diag([b[2] for b in blocks], format='csr')
+        
+        # Merge points which are shared between functionals:
+        unique, order, starts = group_rows(scipy.hstack((X, n)))
+        cols = scipy.empty(len(X), dtype=int)
+        cols[order] = scipy.repeat(
+            scipy.arange(len(unique)),
+            scipy.diff(scipy.append(starts, len(X)))
+        )
+        merge = scipy.sparse.csr_matrix(
+            (scipy.ones(len(X)), (scipy.arange(len(X)), cols)),
+            shape=(len(X), len(unique))
+        )
+        T = T.dot(merge).tocsr()
+        return (unique[:, :self.X_dim], unique[:, self.X_dim:].astype(int), T, slices)
+    
+    def evaluate(self, profile, names=None, **predict_kwargs):
+        """Evaluate the functionals with a single prediction.
+        
+        Parameters
+        ----------
+        profile : :py:class:`Profile` or :py:class:`FitPredictor`
+            The fitted profile. Its :py:class:`PredictionSession` is used.
+        names : list of str, optional
+            The functionals to evaluate, in order. Default is all of them in
+            the order they were added.
+        **predict_kwargs : optional parameters
+            All other parameters are passed to :py:meth:`PredictionSession.predict`.
+        
+        Returns
+        -------
+        res : dict
+            For each functional `name` there are keys 'mean_`name`',
+            'std_`name`' and 'cov_`name`' (and 'samp_`name`' if samples are
+            returned). The joint covariance of all of the outputs is in
+            'cov_functionals', see :py:meth:`cross_cov`.
+        """
+        X, n, T, slices = self.assemble(names=names)
+        predict_kwargs['full_output'] = True
+        out = profile.get_prediction_session().predict(
+            X,
+            n=n,
+            output_transform=T,
+            **predict_kwargs
+        )
+        return self._unpack(out, slices)
+    
+    def _unpack(self, out, slices, start=0):
+        """Split the full output of a prediction into the named functionals.
+        
+        The outputs of the functionals are the rows of `out` from `start` on.
+        """
+        stop = start + sum(sl.stop - sl.start for sl in slices.values())
+        cov = out['cov'][start:stop, start:stop]
+        res = {'cov_functionals': cov, 'slices_functionals': slices}
+        for name, sl in slices.items():
+            rows = slice(start + sl.start, start + sl.stop)
+            res['mean_' + name] = out['mean'][rows]
+            res['std_' + name] = out['std'][rows]
+            res['cov_' + name] = cov[sl, sl]
+            if 'samp' in out:
+                res['samp_' + name] = out['samp'][rows]
+        return res
+    
+    @staticmethod
+    def cross_cov(res, name1, name2):
+        """Get the covariance between the outputs of two functionals.
+        
+        Parameters
+        ----------
+        res : dict
+            The result of :py:meth:`evaluate` (or of
+            :py:meth:`~profiletools.CMod.BivariatePlasmaProfile.compute_a_over_L`
+            with `functionals` given).
+        name1, name2 : str
+            The functionals to get the covariance between.
+        """
+        slices = res['slices_functionals']
+        return res['cov_functionals'][slices[name1], slices[name2]]
+
+class FitPredictor(object):
+    """Lightweight object which makes predictions from a finished fit.
+    
+    This holds only the Gaussian process (the kernel with its hyperparameters,
+    the training data and the Cholesky factorization of the covariance
+    matrix) and the labels and units of the profile it was fit to. The
+    covariance matrices themselves are not kept, since they are not needed for
+    predictions. It can be written to a file with :py:meth:`write` and read
+    back with :py:func:`read_fit_predictor` to evaluate the fit again without
+    recreating it. Use :py:meth:`Profile.get_fit_predictor` to make one.
+    
+    Parameters
+    ----------
+    gp : :py:class:`gptools.GaussianProcess`
+        The Gaussian process to make predictions with. It is copied.
+    X_dim : positive int
+        The number of dimensions of the independent variable.
+    X_units : list of str, (`X_dim`,)
+        The units for each of the independent variables.
+    y_units : str
+        The units for the dependent variable.
+    X_labels : list of str, (`X_dim`,)
+        Descriptive labels for each of the independent variables.
+    y_label : str
+        Descriptive label for the dependent variable.
+    """
+    def __init__(self, gp, X_dim, X_units, y_units, X_labels, y_label):
+        gp.compute_K_L_alpha_ll()
+        gp = copy.copy(gp)
+        gp.K = None
+        gp.noise_K = None
+        self.gp = copy.deepcopy(gp)
+        self.X_dim = X_dim
+        self.X_units = list(X_units)
+        self.y_units = y_units
+        self.X_labels = list(X_labels)
+        self.y_label = y_label
+    
+    def smooth(self, X, n=0, plot=False, **kwargs):
+        """Evaluate the fit at the given points.
+        
+        Parameters
+        ----------
+        X : array-like (`N`, `X_dim`)
+            Points to evaluate the fit at.
+        n : non-negative int, optional
+            The order of derivative to evaluate at. Default is 0 (return value).
+            See the documentation on :py:meth:`gptools.GaussianProcess.predict`.
+        plot : bool, optional
+            If True, :py:meth:`gptools.GaussianProcess.plot` is called to
+            produce a plot of the smoothed curve. Otherwise,
+            :py:meth:`gptools.GaussianProcess.predict` is called directly.
+        **kwargs : optional parameters
+            All other parameters are passed to the Gaussian process'
+            :py:meth:`plot` or :py:meth:`predict` method according to the
+            state of the `plot` keyword.
+        """
+        if plot:
+            kwargs.pop('return_prediction', True)
+            return self.gp.plot(X=X, n=n, return_prediction=True, **kwargs)
+        else:
+            return self.get_prediction_session().predict(X, n=n, **kwargs)
+    
+    def get_prediction_session(self):
+        """Get the :py:class:`PredictionSession` for this predictor.
+        """
+        # Predictors written before sessions were added don't have one:
+        if getattr(self, '_prediction_session', None) is None:
+            self._prediction_session = PredictionSession(self.gp)
+        return self._prediction_session
+    
+    def write(self, filename):
+        """Write this predictor to a file.
+        
+        Parameters
+        ----------
+        filename : str
+            Path of the file to write. If the file exists, it will be
+            overwritten without warning.
+        """
+        with open(os.path.expanduser(filename), 'wb') as outfile:
+            pickle.dump(self, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+
+def read_fit_predictor(filename):
+    """Read a :py:class:`FitPredictor` written with :py:meth:`FitPredictor.write`.
+    
+    Parameters
+    ----------
+    filename : str
+        Path of the file to read.
+    """
+    with open(os.path.expanduser(filename), 'rb') as infile:
+        return pickle.load(infile)
+
+class SharedProfile(object):
+    """Picklable handle to a :py:class:`Profile` whose arrays are in shared memory.
+    
+    All of the point data (`X`, `y`, `err_X`, `err_y` and `channels`) and the
+    arrays of the transformed quantities are packed into one named block of
+    shared memory. The handle itself only holds the name of the block, the
+    layout of the arrays within it and the rest of the state of the profile,
+    so it is cheap to pickle. Use :py:meth:`Profile.to_shared_memory` to make
+    one.
+    
+    Parameters
+    ----------
+    profile : :py:class:`Profile`
+        The profile to share. Its data are copied into the block.
+    
+    Attributes
+    ----------
+    name : str
+        The name of the shared memory block.
+    size : int
+        The size of the block in bytes.
+    """
+    # Offsets of the arrays within the block are rounded up to this many
+    # bytes so that every array is aligned:
+    _alignment = 64
+    
+    def __init__(self, profile):
+        if shared_memory is None:
+            raise ValueError(
+                "Sharing profiles requires multiprocessing.shared_memory, "
+                "which is only available in Python 3.8 and later!"
+            )
+        profile.compact()
+        state = profile.__dict__.copy()
+        state['gp'] = None
+        # These hold the factorization or other copies of the fit, which
+        # should not be sent with the handle:
+        state['_prediction_session'] = None
+        state['_warm_start'] = None
+        state['_MAP_bounds'] = None
+        # The channel index has per-point arrays, it is rebuilt on demand:
+        state['_channel_index'] = None
+        arrays = {}
+        for name in ('_y', '_X', '_err_y', '_err_X', '_channels'):
+            arrays[name] = state[name].get()
+            state[name] = None
+        transformed = copy.copy(profile.transformed)
+        for name in TransformedSet._array_names:
+            arrays['transformed.' + name] = getattr(transformed, name)
+            setattr(transformed, name, None)
+        state['transformed'] = transformed
+        
+        self._layout = []
+        size = 0
+        for name, a in arrays.items():
+            if a is None or a.dtype.hasobject:
+                # Object arrays can't be put in shared memory, so pickle them:
+                self._layout.append((name, a, None, None, None))
+                continue
+            self._layout.append((name, None, size, a.shape, a.dtype.str))
+            size += -(-a.nbytes // self._alignment) * self._alignment
+        
+        # Zero-size blocks are not allowed:
+        self._shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.name = self._shm.name
+        self.size = self._shm.size
+        for name, a, offset, shape, dtype in self._layout:
+            if offset is not None:
+                scipy.ndarray(shape, dtype=dtype, buffer=self._shm.buf, offset=offset)[...] = arrays[name]
+        self._state = pickle.dumps(
+            (type(profile), state),
+            protocol=pickle.HIGHEST_PROTOCOL
+        )
+    
+    def attach(self):
+        """Rebuild the profile, with its arrays backed by the shared block.
         
-        # Only build these arrays once to save a bit of time:
-        # Note that this form does not write any of the transformed quantities!
-        X = self.X
-        err_X = self.err_X
-        y = self.y
-        err_y = self.err_y
+        The block stays open as long as the returned profile exists.
         
-        filename = os.path.expanduser(filename)
-        with open(filename, 'wb') as outfile:
-            writer = csv.writer(outfile)
-            X_labels = [l + ' [' + u + ']' for l, u in zip(self.X_labels, self.X_units)]
-            err_X_labels = ['err_' + l for l in X_labels]
-            writer.writerow(self.X_labels + err_X_labels +
-                            [self.y_label + ' [' + self.y_units + ']'] +
-                            ['err_' + self.y_label])
-            for k in range(0, len(self.y)):
-                writer.writerow(
-                    [x for x in X[k, :]] + [x for x in err_X[k, :]] + [y[k], err_y[k]]
-                )
+        Returns
+        -------
+        p : :py:class:`Profile`
+            The profile, of the same class as the one which was shared.
+        """
+        if self._shm is None:
+            self._shm = shared_memory.SharedMemory(name=self.name)
+        cls, state = pickle.loads(self._state)
+        transformed = state['transformed']
+        for name, a, offset, shape, dtype in self._layout:
+            if offset is not None:
+                a = scipy.ndarray(shape, dtype=dtype, buffer=self._shm.buf, offset=offset)
+                a.flags.writeable = False
+            if name.startswith('transformed.'):
+                setattr(transformed, name[len('transformed.'):], a)
+            else:
+                state[name] = _ColumnBuffer(a)
+        # Keep the block open for as long as the profile uses it:
+        state['_shared_memory'] = self._shm
+        p = cls.__new__(cls)
+        p.__setstate__(state)
+        return p
+    
+    def unlink(self):
+        """Free the shared block.
+        
+        This should be called once, by the process which created the block,
+        after all of the workers are done with it. Profiles which are already
+        attached remain valid until they are deleted.
+        """
+        if self._shm is None:
+            self._shm = shared_memory.SharedMemory(name=self.name)
+        self._shm.unlink()
+    
+    def __enter__(self):
+        return self
     
-def read_csv(filename, X_names=None, y_name=None, metadata_lines=None):
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.unlink()
+    
+    def __getstate__(self):
+        # Each process opens the block for itself:
+        state = self.__dict__.copy()
+        state['_shm'] = None
+        return state
+
+def read_csv(filename, X_names=None, y_name=None, metadata_lines=None,
+             row_filter=None, chunk_size=100000):
     """Reads a CSV file into a :py:class:`Profile`.
     
     If names are not provided for the columns holding the `X` and `y` values and
@@ -1565,6 +4093,11 @@ def read_csv(filename, X_names=None, y_name=None, metadata_lines=None):
     :py:class:`Profile` created. This is most useful when using
     :py:class:`BivariatePlasmaProfile` as you can store the shot and time window.
     
+    The body of the file is parsed in chunks of `chunk_size` rows, each of
+    which is converted to floats in a single call. Only the columns named by
+    `X_names` and `y_name` and their uncertainties are kept, so these can be
+    used to read a subset of the columns of a file.
+    
     Parameters
     ----------
     X_names : list of str, optional
@@ -1581,6 +4114,14 @@ def read_csv(filename, X_names=None, y_name=None, metadata_lines=None):
         Number of lines of metadata to read from the beginning of the file.
         These are read into the :py:attr:`metadata` attribute of the profile
         created.
+    row_filter : callable, optional
+        Function which is called as `row_filter(X, y)` on each chunk of rows as
+        it is parsed, with `X` of shape (`M`, `X_dim`) and `y` of shape (`M`,),
+        and returns a boolean array of shape (`M`,) which is True for the rows
+        to keep. For instance, ``lambda X, y: X[:, 0] <= 1.0`` keeps only the
+        points with time at most 1.0. Default is to keep all rows.
+    chunk_size : positive int, optional
+        Number of rows to parse at a time. Default is 100000.
     """
     if X_names and not y_name:
         raise ValueError("If supplying an ordered list of names for the X "
@@ -1590,12 +4131,8 @@ def read_csv(filename, X_names=None, y_name=None, metadata_lines=None):
         raise ValueError("If supplying a name for the y column you must also "
                          "supply an ordered list of names for the X columns.")
     filename = os.path.expanduser(filename)
-    X = []
-    y = []
-    err_X = []
-    err_y = []
     metadata = []
-    with open(filename, 'rb') as infile:
+    with open(filename, 'r') as infile:
         # Capture metadata, if present:
         if metadata_lines is None:
             first_line = infile.readline()
@@ -1609,51 +4146,179 @@ def read_csv(filename, X_names=None, y_name=None, metadata_lines=None):
             infile.seek(0)
         for k in range(0, metadata_lines):
             metadata.append(infile.readline())
+        names = [name.strip() for name in next(csv.reader([infile.readline()]))]
         if not (X_names and y_name):
-            X_names = infile.readline().split(',')
-            X_names = [name for name in X_names if not name.startswith('err_')]
+            X_names = [name for name in names if not name.startswith('err_')]
             y_name = X_names.pop(-1)
-            infile.seek(0)
-            # Need to skip the metadata again:
-            for k in range(0, metadata_lines):
-                infile.readline()
-        rdr = csv.DictReader(infile)
-        for row in rdr:
-            X.append([row[l] for l in X_names])
-            err_X_row = []
-            for l in X_names:
-                try:
-                    err_X_row.append(row['err_' + l])
-                except KeyError:
-                    err_X_row.append(0)
-            err_X.append(err_X_row)
-            y.append(row[y_name])
-            try:
-                err_y.append(row['err_' + y_name])
-            except KeyError:
-                err_y.append(0)
         
-        y_label, y_units = parse_column_name(y_name)
-        X_labels = []
-        X_units = []
-        for X_name in X_names:
-            n, u = parse_column_name(X_name)
-            X_labels.append(n)
-            X_units.append(n)
+        # Column indices of X, err_X, y and err_y, with None for missing errors:
+        try:
+            cols = [names.index(l) for l in X_names]
+            err_cols = [
+                names.index('err_' + l) if 'err_' + l in names else None
+                for l in X_names
+            ]
+            cols.append(names.index(y_name))
+        except ValueError as e:
+            raise ValueError("Column not found in CSV file: %s" % (e,))
+        err_cols.append(
+            names.index('err_' + y_name) if 'err_' + y_name in names else None
+        )
+        X_dim = len(X_names)
         
-        X_dim = len(X_labels)
-        if X_dim == 1:
-            X_labels = X_labels[0]
-            X_units = X_units[0]
+        data = _ColumnBuffer()
+        err = _ColumnBuffer()
+        while True:
+            lines = list(itertools.islice(infile, chunk_size))
+            if not lines:
+                break
+            block = _parse_csv_block(lines, len(names))
+            vals = block[:, cols]
+            errs = scipy.zeros_like(vals)
+            for k, c in enumerate(err_cols):
+                if c is not None:
+                    errs[:, k] = block[:, c]
+            if row_filter is not None:
+                keep = scipy.asarray(row_filter(vals[:, :X_dim], vals[:, X_dim]), dtype=bool)
+                vals = vals[keep]
+                errs = errs[keep]
+            data.append(vals)
+            err.append(errs)
+    
+    y_label, y_units = parse_column_name(y_name)
+    X_labels = []
+    X_units = []
+    for X_name in X_names:
+        n, u = parse_column_name(X_name)
+        X_labels.append(n)
+        X_units.append(u)
+    if X_dim == 1:
+        X_labels = X_labels[0]
+        X_units = X_units[0]
     
     p = Profile(X_dim=X_dim, X_units=X_units, y_units=y_units,
                 X_labels=X_labels, y_label=y_label)
-    p.add_data(X, y, err_X=err_X, err_y=err_y)
+    data = data.get()
+    if data is not None and len(data) > 0:
+        err = err.get()
+        p.add_data(data[:, :X_dim], data[:, X_dim], err_X=err[:, :X_dim],
+                   err_y=err[:, X_dim])
     p.metadata = metadata
     
     return p
 
-def read_NetCDF(filename, X_names, y_name, metadata=[]):
+def read_transformed_csv(filename):
+    """Reads the transformed quantities written by :py:meth:`Profile.write_csv`.
+    
+    Parameters
+    ----------
+    filename : str
+        Path of the file to read.
+    
+    Returns
+    -------
+    transformed : :py:class:`TransformedSet`
+        The channels in the file. Observations which had been removed when
+        the file was written are not included.
+    """
+    with open(os.path.expanduser(filename), 'r') as infile:
+        first_line = infile.readline()
+        if not first_line.startswith("metadata"):
+            raise ValueError("%s is not a file of transformed quantities!" % (filename,))
+        metadata = {}
+        # The count includes the "metadata" line itself, as for read_csv:
+        for k in range(1, int(first_line.split(None, 1)[1])):
+            row = next(csv.reader([infile.readline()]))
+            metadata[row[0]] = row[1:]
+        names = next(csv.reader([infile.readline()]))
+        lines = infile.readlines()
+    y_labels = metadata['y_labels']
+    y_units = metadata['y_units']
+    num_channels = len(y_labels)
+    # Columns are channel, observation, X, err_X, T, y, err_y:
+    num_dim = (len(names) - 5) // 2
+    if lines:
+        block = _parse_csv_block(lines, len(names))
+    else:
+        block = scipy.zeros((0, len(names)))
+    chan = block[:, 0].astype(int)
+    obs = block[:, 1].astype(int)
+    
+    # The rows are sorted by channel and observation, with the quadrature
+    # points of each observation in order:
+    new_obs = scipy.ones(len(block), dtype=bool)
+    new_obs[1:] = (chan[1:] != chan[:-1]) | (obs[1:] != obs[:-1])
+    starts = scipy.flatnonzero(new_obs)
+    obs_num = scipy.cumsum(new_obs) - 1
+    quad = scipy.arange(len(block)) - starts[obs_num]
+    # Renumber the observations of each channel from zero:
+    obs_chan = chan[starts]
+    obs_idx = scipy.arange(len(starts)) - scipy.searchsorted(obs_chan, obs_chan)
+    num_quad = scipy.zeros(num_channels, dtype=int)
+    scipy.maximum.at(num_quad, chan, quad + 1)
+    num_obs = scipy.zeros(num_channels, dtype=int)
+    scipy.maximum.at(num_obs, obs_chan, obs_idx + 1)
+    M = num_obs.max() if num_channels > 0 else 0
+    N = num_quad.max() if num_channels > 0 else 0
+    
+    X = scipy.zeros((num_channels, M, N, num_dim))
+    err_X = scipy.zeros_like(X)
+    T = scipy.zeros((num_channels, M, N))
+    y = scipy.zeros((num_channels, M))
+    err_y = scipy.zeros_like(y)
+    mask = scipy.zeros((num_channels, M), dtype=bool)
+    X[chan, obs_idx[obs_num], quad] = block[:, 2:2 + num_dim]
+    err_X[chan, obs_idx[obs_num], quad] = block[:, 2 + num_dim:2 + 2 * num_dim]
+    T[chan, obs_idx[obs_num], quad] = block[:, -3]
+    y[obs_chan, obs_idx] = block[starts, -2]
+    err_y[obs_chan, obs_idx] = block[starts, -1]
+    mask[obs_chan, obs_idx] = True
+    # Missing quadrature points repeat the last one, as in _pad_quadrature:
+    q = scipy.minimum(scipy.arange(N), scipy.maximum(num_quad[:, None] - 1, 0))
+    c = scipy.arange(num_channels)[:, None]
+    X = X[c, :, q].transpose(0, 2, 1, 3)
+    err_X = err_X[c, :, q].transpose(0, 2, 1, 3)
+    return TransformedSet(
+        X, y, err_X=err_X, err_y=err_y, T=T, mask=mask, num_quad=num_quad,
+        y_labels=y_labels, y_units=y_units
+    )
+
+def _parse_csv_block(lines, num_cols):
+    """Parse a list of lines of purely numeric CSV data into a float array.
+    
+    If every line has exactly `num_cols` fields and there is no quoting, all of
+    the lines are converted in a single call. Otherwise the block is parsed
+    row by row with :py:mod:`csv`, skipping blank lines and putting NaN in
+    empty fields.
+    """
+    text = ''.join(lines)
+    if ('"' not in text and
+            all(l.count(',') == num_cols - 1 and l.strip() for l in lines)):
+        text = text.rstrip().replace('\n', ',')
+        # Depending on the version of numpy, malformed data either give a
+        # warning and a truncated result or raise an error:
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', DeprecationWarning)
+                block = scipy.fromstring(text, sep=',')
+        except ValueError:
+            block = None
+        if block is not None and block.size == len(lines) * num_cols:
+            return block.reshape((len(lines), num_cols))
+    rows = []
+    for row in csv.reader(lines):
+        if not row:
+            continue
+        if len(row) != num_cols:
+            raise ValueError("Rows of the CSV file must have %d columns, found %d."
+                             % (num_cols, len(row)))
+        rows.append([float(v) if v.strip() else scipy.nan for v in row])
+    if not rows:
+        return scipy.zeros((0, num_cols))
+    return scipy.asarray(rows, dtype=float)
+
+def read_NetCDF(filename, X_names, y_name, metadata=[], window=None,
+                channels=None, stride=1):
     """Reads a NetCDF file into a :py:class:`Profile`.
     
     The file must contain arrays of equal length for each of the independent and
@@ -1668,6 +4333,17 @@ def read_NetCDF(filename, X_names, y_name, metadata=[]):
     :py:class:`BivariatePlasmaProfile` as you can store the shot and time window.
     Be careful that you do not overwrite attributes needed by the class, however!
     
+    Instead of one entry per point, the dependent variable can also be stored
+    as a two-dimensional (time, channel) array, in which case each of the other
+    variables must be defined on one or both of these NetCDF dimensions and is
+    broadcast against it. The points of each channel are then grouped together
+    in `channels` along all but the first dimension of `X`.
+    
+    The file is memory mapped, and the window, channel subset and stride are
+    applied to the leading ("time") dimension of the first variable in
+    `X_names` before any of the other variables are read, so only the
+    requested part of each of them is copied from the file.
+    
     Parameters
     ----------
     X_names : list of str
@@ -1679,15 +4355,78 @@ def read_NetCDF(filename, X_names, y_name, metadata=[]):
     metadata : list of str, optional
         List of attribute names to read into the corresponding attributes of the
         :py:class:`Profile` created.
+    window : tuple of 2 float, optional
+        The (lower, upper) bounds of the values of the first variable in
+        `X_names` to read. Either bound can be None. Default is to read all
+        values.
+    channels : array-like of int, optional
+        The indices of the channels to read when the dependent variable is
+        stored as a (time, channel) array. Default is to read all channels.
+    stride : positive int, optional
+        Only read every `stride`-th entry of the leading dimension which falls
+        in `window`. Default is 1 (read all of them).
     """
     with scipy.io.netcdf.netcdf_file(os.path.expanduser(filename), mode='r') as infile:
+        vy = infile.variables[y_name]
+        dims = vy.dimensions
+        if len(dims) not in (1, 2):
+            raise ValueError("The dependent variable must have one or two "
+                             "dimensions!")
+        
+        # Find the indices to read along each dimension, only reading the
+        # first variable in X_names in full:
+        vt = infile.variables[X_names[0]]
+        idx = {}
+        t = scipy.array(vt[(slice(None),) + (0,) * (len(vt.dimensions) - 1)])
+        keep = scipy.ones(len(t), dtype=bool)
+        if window is not None:
+            if window[0] is not None:
+                keep &= t >= window[0]
+            if window[1] is not None:
+                keep &= t <= window[1]
+        idx[vt.dimensions[0]] = scipy.flatnonzero(keep)[::stride]
+        if channels is not None:
+            if len(dims) != 2:
+                raise ValueError("Can only select channels when the dependent "
+                                 "variable is stored as a (time, channel) array!")
+            idx[dims[1]] = scipy.asarray(channels, dtype=int)
+        
+        def read(v):
+            """Read the selected part of `v` and broadcast it to the shape of `y`.
+            """
+            if not set(v.dimensions) <= set(dims):
+                raise ValueError("Variable dimensions %s are not a subset of %s!"
+                                 % (v.dimensions, dims))
+            a = v[:]
+            for k, d in enumerate(v.dimensions):
+                if d in idx:
+                    a = a.take(idx[d], axis=k)
+            # Explicitly convert, since I've been having strange segfaults here:
+            a = scipy.array(a, dtype=float)
+            present = [d for d in dims if d in v.dimensions]
+            a = a.transpose([v.dimensions.index(d) for d in present])
+            return a.reshape(
+                [a.shape[present.index(d)] if d in present else 1 for d in dims]
+            )
+        
+        y = read(vy)
+        y_label, u = parse_column_name(y_name)
+        try:
+            y_units = vy.units
+        except AttributeError:
+            y_units = u
+        try:
+            err_y = read(infile.variables['err_' + y_name])
+        except KeyError:
+            err_y = 0
+        err_y = scipy.broadcast_to(err_y, y.shape)
         X = []
         err_X = []
         X_labels = []
         X_units = []
         for l in X_names:
             vXl = infile.variables[l]
-            X.append(vXl[:])
+            X.append(scipy.broadcast_to(read(vXl), y.shape).ravel())
             n, u = parse_column_name(l)
             X_labels.append(n)
             try:
@@ -1695,30 +4434,37 @@ def read_NetCDF(filename, X_names, y_name, metadata=[]):
             except AttributeError:
                 X_units.append(u)
             try:
-                err_X.append(infile.variables['err_' + l])
+                err_X.append(
+                    scipy.broadcast_to(
+                        read(infile.variables['err_' + l]),
+                        y.shape
+                    ).ravel()
+                )
             except KeyError:
-                err_X.append(scipy.zeros_like(X[0]))
-        X = scipy.hstack(X)
-        err_X = scipy.hstack(err_X)
-        vy = infile.variables[y_name]
-        # Explicitly convert, since I've been having strange segfaults here:
-        y = scipy.array(vy[:])
-        y_label, u = parse_column_name(y_name)
-        try:
-            y_units = vy.units
-        except AttributeError:
-            y_units = u
-        try:
-            err_y = scipy.array(infile.variables['err_' + y_name][:])
-        except KeyError:
-            err_y = 0
+                err_X.append(scipy.zeros_like(X[-1]))
+        X = scipy.column_stack(X)
+        err_X = scipy.column_stack(err_X)
+        num_channels = vy.shape[-1]
+        # The file cannot be closed cleanly while the memory mapped variables
+        # are still referenced:
+        del vt, vy, vXl
+        if len(dims) == 2:
+            # Each channel is one column of y, whose original index is kept:
+            chan = scipy.arange(num_channels)
+            if channels is not None:
+                chan = chan[idx[dims[1]]]
+            chan = scipy.broadcast_to(chan, y.shape).ravel()
+            chan_dict = dict([(k, chan) for k in range(1, len(X_names))])
+        else:
+            chan_dict = None
         X_dim = len(X_labels)
         if X_dim == 1:
             X_labels = X_labels[0]
             X_units = X_units[0]
         p = Profile(X_dim=X_dim, X_units=X_units, y_units=y_units,
                     X_labels=X_labels, y_label=y_label)
-        p.add_data(X, y, err_X=err_X, err_y=err_y)
+        p.add_data(X, y.ravel(), err_X=err_X, err_y=err_y.ravel(),
+                   channels=chan_dict)
         for m in metadata:
             try:
                 if hasattr(p, m):
@@ -1726,12 +4472,432 @@ def read_NetCDF(filename, X_names, y_name, metadata=[]):
                                   "Existing value is being overwritten. This may "
                                   "lead to undesirable behavior." % (m,),
                                   RuntimeWarning)
-                setattr(p, m, infile.m)
+                setattr(p, m, getattr(infile, m))
             except AttributeError:
                 warnings.warn("Could not find metadata attribute %s in NetCDF file %s." % 
                               (m, filename,), RuntimeWarning)
     return p
 
+def read_npz(filename, mmap=True):
+    """Reads a .npz file written with :py:meth:`Profile.write_npz` into a :py:class:`Profile`.
+    
+    By default the data arrays are memory mapped straight out of the file, so
+    that opening even a very large profile is nearly instantaneous and the
+    data are only read from disk as they are used. The mapped arrays are
+    read-only: the methods of :py:class:`Profile` which change the data make
+    their own copies first, as they do with the arrays shared by
+    :py:meth:`Profile.copy`.
+    
+    Parameters
+    ----------
+    filename : str
+        Path of the file to read.
+    mmap : bool, optional
+        If True, memory map the data arrays instead of reading them into
+        memory. This is only possible for members which were not compressed,
+        the rest are read in full. Default is True.
+    """
+    filename = os.path.expanduser(filename)
+    arrays = {}
+    with zipfile.ZipFile(filename) as zf:
+        for info in zf.infolist():
+            name = info.filename
+            if name.endswith('.npy'):
+                name = name[:-4]
+            a = None
+            if mmap and info.compress_type == zipfile.ZIP_STORED:
+                a = _memmap_npz_member(filename, info)
+            if a is None:
+                with zf.open(info) as f:
+                    a = numpy.lib.format.read_array(f, allow_pickle=False)
+            arrays[name] = a
+    metadata = json.loads(str(arrays.pop('__metadata__')[()]))
+    
+    state = dict(metadata['attributes'])
+    for k in metadata['array_attributes']:
+        state[k] = arrays['attr_' + k]
+    for name in ('y', 'X', 'err_y', 'err_X', 'channels'):
+        state[name] = arrays.get(name, None)
+    transformed = TransformedSet()
+    for name in TransformedSet._array_names:
+        setattr(transformed, name, arrays['transformed_' + name])
+    transformed.y_labels = metadata['transformed_y_labels']
+    transformed.y_units = metadata['transformed_y_units']
+    state['transformed'] = transformed
+    state['gp'] = None
+    
+    p = Profile.__new__(Profile)
+    p.__setstate__(state)
+    return p
+
+def _memmap_npz_member(filename, info):
+    """Memory map the uncompressed member `info` of the .npz file `filename`.
+    
+    Returns None if the member cannot be mapped, in which case it must be read
+    in full.
+    """
+    with open(filename, 'rb') as f:
+        # Skip the zip local file header, whose name and extra field lengths
+        # may differ from those in the central directory:
+        f.seek(info.header_offset + 26)
+        name_len, extra_len = struct.unpack('<HH', f.read(4))
+        f.seek(name_len + extra_len, 1)
+        version = numpy.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = numpy.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = numpy.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    # Empty arrays cannot be mapped, and object arrays must be unpickled:
+    if dtype.hasobject or scipy.prod(shape) == 0:
+        return None
+    return scipy.memmap(
+        filename,
+        dtype=dtype,
+        mode='r',
+        offset=offset,
+        shape=shape,
+        order='F' if fortran_order else 'C'
+    )
+
+def _to_json(o):
+    """Convert numpy scalars and arrays to objects :py:mod:`json` can encode.
+    """
+    if isinstance(o, (scipy.generic, scipy.ndarray)) and o.dtype != object:
+        return o.tolist()
+    if isinstance(o, scipy.dtype):
+        return o.str
+    raise TypeError("Object of type %s is not JSON serializable." % (type(o),))
+
+def write_csv_columns(outfile, names, columns, chunk_size=100000):
+    """Write a header row and columns of numbers to an open CSV file.
+    
+    The rows are formatted `chunk_size` at a time with a single string
+    formatting operation per chunk, which is much faster than writing them one
+    at a time with :py:mod:`csv`. The numbers are written the same way
+    :py:mod:`csv` writes floats.
+    
+    Parameters
+    ----------
+    outfile : file
+        The file to write to, opened in text mode.
+    names : list of str
+        The column names to write in the header row.
+    columns : list of array
+        The data to write. Each entry is either an array of shape (`M`,) or an
+        array of shape (`M`, `K`) holding `K` consecutive columns.
+    chunk_size : positive int, optional
+        Number of rows to format at a time. Default is 100000.
+    """
+    columns = [scipy.asarray(c) for c in columns]
+    # Integer columns are written without a decimal point:
+    fmts = []
+    for c in columns:
+        fmt = '%d' if c.dtype.kind in 'biu' else '%r'
+        fmts.extend([fmt] * (c.shape[1] if c.ndim == 2 else 1))
+    if len(fmts) != len(names):
+        raise ValueError("Number of names (%d) does not match number of "
+                         "columns (%d)!" % (len(names), len(fmts)))
+    row_fmt = ','.join(fmts) + '\n'
+    
+    csv.writer(outfile, lineterminator='\n').writerow(names)
+    num_rows = len(columns[0]) if columns else 0
+    for k in range(0, num_rows, chunk_size):
+        block = scipy.column_stack([c[k:k + chunk_size] for c in columns])
+        block = block.astype(float)
+        outfile.write((row_fmt * len(block)) % tuple(block.ravel().tolist()))
+
+def read_files(files, reader=None, num_threads=None, **kwargs):
+    """Reads several files into a single :py:class:`Profile`.
+    
+    The files are read one at a time (or by a pool of threads, in order) and
+    the data of each are appended to the profile read from the first file as
+    soon as they are available, so the per-file data do not all have to be
+    held in memory at once. The units of each file are checked against those
+    of the first one.
+    
+    The channels of the points from file `i` are tagged with the source: they
+    are given by ``channels * len(files) + i``, where `channels` are those the
+    file was read with, so points from different files never share a channel
+    and the file a point came from is given by ``channels % len(files)``. The
+    names of the files are stored in the :py:attr:`sources` attribute of the
+    profile created. The transformed quantities of all of the files are
+    merged.
+    
+    Parameters
+    ----------
+    files : str or list of str
+        Either a list of the paths of the files to read, or a glob pattern
+        matching them, in which case they are read in sorted order.
+    reader : callable, optional
+        The function to read each file with, called as ``reader(filename,
+        **kwargs)``. Default is to pick :py:func:`read_csv`,
+        :py:func:`read_NetCDF` or :py:func:`read_npz` based on the extension of
+        each file.
+    num_threads : positive int, optional
+        If given, the files are read by a pool of this many threads, so
+        `reader` must be thread-safe. Default is to read them one at a time in
+        the calling thread.
+    **kwargs : optional
+        All additional kwargs are passed to `reader`.
+    """
+    if isinstance(files, str):
+        files = sorted(glob.glob(os.path.expanduser(files)))
+    files = list(files)
+    if len(files) == 0:
+        raise ValueError("No files to read!")
+    if reader is None:
+        reader = _read_any
+    
+    def read(filename):
+        return reader(filename, **kwargs)
+    
+    if num_threads is None:
+        profiles = (read(filename) for filename in files)
+        pool = None
+    else:
+        pool = multiprocessing.pool.ThreadPool(num_threads)
+        profiles = pool.imap(read, files)
+    try:
+        num_files = len(files)
+        transformed = []
+        for i, q in enumerate(profiles):
+            if i == 0:
+                p = q
+                if len(p.y) > 0:
+                    p.channels = p.channels * num_files
+            else:
+                if p.X_dim != q.X_dim:
+                    raise ValueError("X_dim of file %s does not match that of "
+                                     "file %s!" % (files[i], files[0]))
+                if p.y_units != q.y_units:
+                    raise ValueError("y_units of file %s do not match those of "
+                                     "file %s!" % (files[i], files[0]))
+                if p.X_units != q.X_units:
+                    raise ValueError("X_units of file %s do not match those of "
+                                     "file %s!" % (files[i], files[0]))
+                if len(q.y) > 0:
+                    p.add_data(q.X, q.y, err_X=q.err_X, err_y=q.err_y,
+                               channels=q.channels * num_files + i)
+            transformed.append(q.transformed)
+    finally:
+        if pool is not None:
+            pool.terminate()
+    p.transformed = TransformedSet.concatenate(transformed)
+    p.sources = files
+    
+    return p
+
+def _read_any(filename, **kwargs):
+    """Read `filename` with the reader appropriate for its extension.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == '.csv':
+        return read_csv(filename, **kwargs)
+    elif ext == '.npz':
+        return read_npz(filename, **kwargs)
+    elif ext in ('.nc', '.cdf', '.netcdf'):
+        return read_NetCDF(filename, **kwargs)
+    else:
+        raise ValueError("Unrecognized file extension '%s'!" % (ext,))
+
+class FitResultsWriter(object):
+    """Appends the results of many fits to a single columnar dataset.
+    
+    The fits are buffered in memory and written in batches of `batch_size` as
+    row groups of an uncompressed .npz (zip) file, holding one array per
+    column. Each row group is added to the end of the file, so the data which
+    are already there are never rewritten, and a file can be appended to
+    again by opening a new writer on it. Use :py:func:`read_fit_results` to
+    read the columns back, concatenated over all of the row groups.
+    
+    The dataset has two tables. The "fits" table has one row per fit, with the
+    columns in :py:attr:`fit_columns` (missing values are NaN or -1 for the
+    shot) plus `fit_id`, `abscissa`, `start` and `num_points`. The "points"
+    table has one row per point of the abscissa grid of each fit, with the
+    columns in :py:attr:`point_columns` plus the `fit_id` of the fit. The
+    points of fit `k` are rows ``start[k]:start[k] + num_points[k]`` of the
+    points table.
+    
+    Parameters
+    ----------
+    filename : str
+        Path of the file to write. If the file exists, the fits are appended
+        to it.
+    batch_size : positive int, optional
+        Number of fits to write in each row group. Default is 100.
+    """
+    fit_columns = ('shot', 't_min', 't_max', 'vol_avg', 'err_vol_avg',
+                   'peaking', 'err_peaking')
+    point_columns = ('X', 'mean_val', 'std_val', 'mean_grad', 'std_grad',
+                     'mean_a_L', 'std_a_L')
+    
+    def __init__(self, filename, batch_size=100):
+        self.filename = os.path.expanduser(filename)
+        self.batch_size = batch_size
+        self._pending = []
+        # Continue the numbering of the row groups, fits and points:
+        self._num_groups = 0
+        self._num_fits = 0
+        self._num_points = 0
+        if os.path.exists(self.filename):
+            fits, points = read_fit_results(
+                self.filename,
+                fit_columns=['num_points'],
+                point_columns=[]
+            )
+            self._num_groups = fits.pop('num_groups')
+            self._num_fits = len(fits['num_points'])
+            self._num_points = int(fits['num_points'].sum())
+    
+    def append(self, X, mean_val, std_val, abscissa='', **kwargs):
+        """Add the results of one fit.
+        
+        The fit is written once `batch_size` fits have been appended, or when
+        :py:meth:`flush` or :py:meth:`close` is called.
+        
+        Parameters
+        ----------
+        X : array, (`N`,)
+            The abscissa grid the fit was evaluated on.
+        mean_val : array, (`N`,)
+            The mean of the fit.
+        std_val : array, (`N`,)
+            The standard deviation of the fit.
+        abscissa : str, optional
+            The name of the abscissa `X` is given in terms of. Default is an
+            empty string.
+        **kwargs : optional
+            The values of any of the other columns in :py:attr:`fit_columns`
+            and :py:attr:`point_columns`.
+        """
+        fit = {'abscissa': str(abscissa)}
+        X = scipy.atleast_1d(scipy.asarray(X, dtype=float))
+        points = {'X': X, 'mean_val': mean_val, 'std_val': std_val}
+        for k, v in kwargs.items():
+            if k in self.fit_columns:
+                fit[k] = v
+            elif k in self.point_columns:
+                points[k] = v
+            else:
+                raise ValueError("Unknown column %s!" % (k,))
+        for k, v in points.items():
+            v = scipy.atleast_1d(scipy.asarray(v, dtype=float))
+            if v.shape != X.shape:
+                raise ValueError("Shape of %s must match shape of X!" % (k,))
+            points[k] = v
+        self._pending.append((fit, points))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+    
+    def flush(self):
+        """Write any buffered fits to the file as a new row group.
+        """
+        if not self._pending:
+            return
+        num_points = scipy.asarray([len(pt['X']) for f, pt in self._pending], dtype=int)
+        fit_id = self._num_fits + scipy.arange(len(self._pending))
+        start = self._num_points + scipy.cumsum(num_points) - num_points
+        fits = {
+            'fit_id': fit_id,
+            'start': start,
+            'num_points': num_points,
+            'abscissa': scipy.array([f['abscissa'] for f, pt in self._pending])
+        }
+        for k in self.fit_columns:
+            missing = -1 if k == 'shot' else scipy.nan
+            fits[k] = scipy.asarray(
+                [f.get(k, missing) for f, pt in self._pending],
+                dtype=int if k == 'shot' else float
+            )
+        points = {'fit_id': scipy.repeat(fit_id, num_points)}
+        for k in self.point_columns:
+            points[k] = scipy.concatenate([
+                pt[k] if k in pt else scipy.nan * scipy.ones_like(pt['X'])
+                for f, pt in self._pending
+            ])
+        
+        group = '%05d' % (self._num_groups,)
+        with zipfile.ZipFile(self.filename, mode='a', allowZip64=True) as zf:
+            for table, columns in (('fits', fits), ('points', points)):
+                for k, v in columns.items():
+                    buf = io.BytesIO()
+                    numpy.lib.format.write_array(buf, v, allow_pickle=False)
+                    zf.writestr('%s/%s/%s.npy' % (table, group, k), buf.getvalue())
+        
+        self._num_groups += 1
+        self._num_fits += len(self._pending)
+        self._num_points += int(num_points.sum())
+        self._pending = []
+    
+    def close(self):
+        """Write any buffered fits. The writer should not be used afterwards.
+        """
+        self.flush()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def read_fit_results(filename, fit_columns=None, point_columns=None, mmap=True):
+    """Read columns of a dataset written with :py:class:`FitResultsWriter`.
+    
+    Only the requested columns are read, and each of them is concatenated
+    over all of the row groups in the file.
+    
+    Parameters
+    ----------
+    filename : str
+        Path of the file to read.
+    fit_columns : list of str, optional
+        The columns of the "fits" table to read. Default is all of them.
+    point_columns : list of str, optional
+        The columns of the "points" table to read. Default is all of them.
+    mmap : bool, optional
+        If True, the row groups are memory mapped before they are
+        concatenated, so only the requested columns are read from the file.
+        Default is True.
+    
+    Returns
+    -------
+    fits : dict
+        The columns of the fits table, with the number of row groups in the
+        file under the key "num_groups".
+    points : dict
+        The columns of the points table.
+    """
+    filename = os.path.expanduser(filename)
+    groups = {'fits': {}, 'points': {}}
+    wanted = {'fits': fit_columns, 'points': point_columns}
+    num_groups = 0
+    with zipfile.ZipFile(filename) as zf:
+        # Members are stored in the order the row groups were written:
+        for info in zf.infolist():
+            table, group, name = info.filename.split('/')
+            name = name[:-4]
+            num_groups = max(num_groups, int(group) + 1)
+            if wanted[table] is not None and name not in wanted[table]:
+                continue
+            a = None
+            if mmap and info.compress_type == zipfile.ZIP_STORED:
+                a = _memmap_npz_member(filename, info)
+            if a is None:
+                with zf.open(info) as f:
+                    a = numpy.lib.format.read_array(f, allow_pickle=False)
+            groups[table].setdefault(name, []).append(a)
+    fits, points = [
+        dict([(k, scipy.concatenate(v)) for k, v in groups[table].items()])
+        for table in ('fits', 'points')
+    ]
+    for table, columns in (('fits', fits), ('points', points)):
+        for k in (wanted[table] or []):
+            if k not in columns:
+                raise ValueError("Column %s not found in table %s!" % (k, table))
+    fits['num_groups'] = num_groups
+    return (fits, points)
+
 def parse_column_name(name):
     """Parse a column header `name` into label and units.
     """
@@ -1827,9 +4993,272 @@ def unique_rows(arr):
         idx = scipy.asarray(srt_idx)[transition_idxs]
     return arr[idx]
 
+def group_rows(arr):
+    """Find the groups of identical rows in `arr`.
+    
+    The groups are returned in the same order as the rows returned by
+    :py:func:`unique_rows`, and are described by a single stable sort of the
+    rows so that the members of each group are contiguous.
+    
+    Parameters
+    ----------
+    arr : :py:class:`Array`, (`m`, `n`). The array to find the groups of.
+    
+    Returns
+    -------
+    unique : :py:class:`Array`, (`p`, `n`) where `p` <= `m`
+        The array `arr` with duplicate rows removed.
+    order : :py:class:`Array` of int, (`m`,)
+        Indices which sort the rows of `arr` by group.
+    starts : :py:class:`Array` of int, (`p`,)
+        The index into `order` of the first member of each group.
+    """
+    b = scipy.ascontiguousarray(arr).view(
+        scipy.dtype((scipy.void, arr.dtype.itemsize * arr.shape[1]))
+    ).ravel()
+    dum, idx, inv = scipy.unique(b, return_index=True, return_inverse=True)
+    inv = inv.ravel()
+    order = inv.argsort(kind='mergesort')
+    counts = scipy.bincount(inv, minlength=len(idx))
+    starts = scipy.concatenate(([0], counts.cumsum()[:-1])).astype(int)
+    return (arr[idx], order, starts[:len(idx)])
+
+def condense_transform(X, T):
+    """Assemble linearly transformed observations into a sparse transform.
+    
+    The result is equivalent to stacking the quadrature points in `X`, forming
+    ``scipy.linalg.block_diag(*T)`` for each channel, then merging duplicate
+    quadrature points and dropping the ones which have zero weight. The dense
+    (`M`, `M` * `N`) intermediate is never formed, so the cost is linear in the
+    number of quadrature points.
+    
+    Parameters
+    ----------
+    X : list of :py:class:`Array`, (`M_i`, `N_i`, `D`)
+        The quadrature points of each channel, as in :py:attr:`Channel.X`.
+    T : list of :py:class:`Array`, (`M_i`, `N_i`)
+        The weights of each channel, as in :py:attr:`Channel.T`.
+    
+    Returns
+    -------
+    X : :py:class:`Array`, (`U`, `D`)
+        The unique quadrature points with nonzero weight.
+    T : :py:class:`scipy.sparse.csr_matrix`, (`M`, `U`)
+        The transform from the latent variables at `X` to the observations of
+        all of the channels, in order.
+    """
+    X = [scipy.asarray(x, dtype=float) for x in X]
+    T = [scipy.asarray(t, dtype=float) for t in T]
+    num_dim = X[0].shape[2]
+    num_obs = [t.shape[0] for t in T]
+    offsets = scipy.concatenate(([0], scipy.cumsum(num_obs)[:-1])).astype(int)
+    rows = scipy.concatenate(
+        [o + scipy.repeat(scipy.arange(t.shape[0]), t.shape[1]) for o, t in zip(offsets, T)]
+    )
+    weights = scipy.concatenate([t.ravel() for t in T])
+    X = scipy.vstack([x.reshape((-1, num_dim)) for x in X])
+    
+    nonzero = weights != 0.0
+    rows = rows[nonzero]
+    weights = weights[nonzero]
+    X = X[nonzero, :]
+    
+    if len(X) == 0:
+        return (X, scipy.sparse.csr_matrix((sum(num_obs), 0)))
+    unique, order, starts = group_rows(X)
+    cols = scipy.empty(len(X), dtype=int)
+    cols[order] = scipy.repeat(
+        scipy.arange(len(unique)),
+        scipy.diff(scipy.append(starts, len(X)))
+    )
+    # Duplicate entries are summed on conversion:
+    T = scipy.sparse.csr_matrix(
+        (weights, (rows, cols)),
+        shape=(sum(num_obs), len(unique))
+    )
+    return (unique, T)
+
+class _SparseTransform(object):
+    """Sparse transform for a :py:class:`gptools.GaussianProcess`.
+    
+    The likelihood and predictions of gptools only need ``T.dot(A)`` and
+    ``A.dot(T.T)`` for dense `A`, so this provides those without ever expanding
+    `T` to a dense matrix. The methods of gptools which modify `T` are
+    replaced by :py:class:`_SparseGaussianProcess`.
+    
+    Parameters
+    ----------
+    matrix : sparse matrix, (`M`, `N`)
+        The transform.
+    """
+    ndim = 2
+    
+    def __init__(self, matrix):
+        self.matrix = scipy.sparse.csr_matrix(matrix)
+    
+    @property
+    def shape(self):
+        return self.matrix.shape
+    
+    @property
+    def T(self):
+        return _SparseTransform(self.matrix.T)
+    
+    def dot(self, a):
+        return scipy.asarray(self.matrix.dot(a)).view(_TransformProduct)
+    
+    def toarray(self):
+        return self.matrix.toarray()
+
+class _TransformProduct(scipy.ndarray):
+    """Result of :py:meth:`_SparseTransform.dot`, which can be right-multiplied by a :py:class:`_SparseTransform`.
+    """
+    def dot(self, b, out=None):
+        a = self.view(scipy.ndarray)
+        if isinstance(b, _SparseTransform):
+            # a B = (B^T a^T)^T, with the sparse matrix on the left:
+            return scipy.asarray(b.matrix.T.dot(a.T)).T
+        return a.dot(b, out=out)
+
+class _SparseGaussianProcess(gptools.GaussianProcess):
+    """:py:class:`gptools.GaussianProcess` which keeps its transform `T` sparse.
+    
+    :py:meth:`Profile.create_gp` uses this when there are transformed
+    quantities. `T` is a :py:class:`_SparseTransform`, and the methods of
+    gptools which would expand it to a dense matrix are replaced with ones
+    which take and return the same things but keep it sparse.
+    """
+    def _set_transform(self, T):
+        """Store the sparse matrix `T` as the transform.
+        """
+        self.T = _SparseTransform(T)
+        self.K_up_to_date = False
+    
+    def _get_transform(self):
+        """Get the transform as a sparse matrix, with the identity if there is none.
+        """
+        if self.T is None:
+            return scipy.sparse.identity(len(self.y), format='csr')
+        return self.T.matrix
+    
+    def add_data(self, X, y, err_y=0, n=0, T=None):
+        """Add data to the training data set of the GaussianProcess instance.
+        
+        Takes the same arguments as
+        :py:meth:`gptools.GaussianProcess.add_data`, and `T` can also be a
+        sparse matrix.
+        """
+        num_y = len(self.y)
+        num_X = 0 if self.X is None else len(self.X)
+        T_old = None if num_y == 0 else self._get_transform()
+        if T is None:
+            # Let gptools check and append the data as if there were no
+            # transform, then extend it with an identity block:
+            self.T = None
+            gptools.GaussianProcess.add_data(self, X, y, err_y=err_y, n=n)
+            T = scipy.sparse.identity(len(self.y) - num_y, format='csr')
+        else:
+            T = scipy.sparse.csr_matrix(T)
+            y = scipy.atleast_1d(scipy.asarray(y, dtype=float))
+            err_y = scipy.asarray(err_y, dtype=float) * scipy.ones_like(y)
+            X = scipy.asarray(X, dtype=float).reshape((-1, self.num_dim))
+            n = scipy.asarray(n, dtype=int) * scipy.ones(X.shape, dtype=int)
+            if y.ndim != 1:
+                raise ValueError(
+                    "Training targets y must have only one dimension with "
+                    "length greater than one! Shape of y given is %s" % (y.shape,)
+                )
+            if T.shape != (len(y), len(X)):
+                raise ValueError(
+                    "T must have as many rows are there are elements in y and "
+                    "as many columns as there are rows in X! Shape of T given "
+                    "is %s, shape of y is %s and shape of X is %s."
+                    % (T.shape, y.shape, X.shape)
+                )
+            if (err_y < 0).any():
+                raise ValueError("All elements of err_y must be non-negative!")
+            if (n < 0).any():
+                raise ValueError("All elements of n must be non-negative integers!")
+            self.X = X if self.X is None else scipy.vstack((self.X, X))
+            self.n = n if self.n is None else scipy.vstack((self.n, n))
+            self.y = scipy.append(self.y, y)
+            self.err_y = scipy.append(self.err_y, err_y)
+        if T_old is None:
+            self._set_transform(T)
+        else:
+            self._set_transform(scipy.sparse.block_diag((T_old, T), format='csr'))
+    
+    def condense_duplicates(self):
+        """Condense duplicate points using the transformation matrix.
+        
+        Does the same as :py:meth:`gptools.GaussianProcess.condense_duplicates`:
+        duplicate rows of [`X`, `n`] are merged and the quadrature points with
+        no weight are removed.
+        """
+        num_dim = self.X.shape[1]
+        unique, order, starts = group_rows(scipy.hstack((self.X, self.n)))
+        cols = scipy.empty(len(self.X), dtype=int)
+        cols[order] = scipy.repeat(
+            scipy.arange(len(unique)),
+            scipy.diff(scipy.append(starts, len(self.X)))
+        )
+        merge = scipy.sparse.csr_matrix(
+            (scipy.ones(len(self.X)), (scipy.arange(len(self.X)), cols)),
+            shape=(len(self.X), len(unique))
+        )
+        T = self._get_transform().dot(merge).tocsc()
+        T.eliminate_zeros()
+        good_cols = scipy.diff(T.indptr) > 0
+        self.X = unique[good_cols, :num_dim]
+        self.n = unique[good_cols, num_dim:].astype(int)
+        self._set_transform(T[:, good_cols])
+    
+    def remove_outliers(self, thresh=3, **predict_kwargs):
+        """Remove outliers from the GP with very simplistic outlier detection.
+        
+        Takes the same arguments and returns the same values as
+        :py:meth:`gptools.GaussianProcess.remove_outliers`, with `T_bad` a
+        dense array. The quadrature points which are no longer used by any of
+        the remaining observations are removed.
+        """
+        mean = self.predict(
+            self.X, n=self.n, noise=False, return_std=False, **predict_kwargs
+        )
+        T = self._get_transform()
+        mean = T.dot(mean)
+        deltas = scipy.absolute(mean - self.y) / self.err_y
+        deltas[self.err_y == 0] = 0
+        bad_idxs = (deltas >= thresh)
+        good_idxs = ~bad_idxs
+        
+        # Pull out the old values so they can be returned:
+        y_bad = self.y[bad_idxs]
+        err_y_bad = self.err_y[bad_idxs]
+        T_bad = T[bad_idxs, :].tocsc()
+        bad_cols = scipy.diff(T_bad.indptr) > 0
+        T_bad = T_bad[:, bad_cols].toarray()
+        X_bad = self.X[bad_cols, :]
+        n_bad = self.n[bad_cols, :]
+        
+        # Delete the offending points:
+        T = T[good_idxs, :].tocsc()
+        T.eliminate_zeros()
+        good_cols = scipy.diff(T.indptr) > 0
+        self.X = self.X[good_cols, :]
+        self.n = self.n[good_cols, :]
+        self.y = self.y[good_idxs]
+        self.err_y = self.err_y[good_idxs]
+        self._set_transform(T[:, good_cols])
+        
+        return (X_bad, y_bad, err_y_bad, n_bad, bad_idxs, T_bad)
+
 def get_nearest_idx(v, a):
     """Returns the array of indices of the nearest value in `a` corresponding to each value in `v`.
     
+    Uses a single sort of `a` and a binary search for each value in `v`, so the
+    cost is O((`M` + `N`) log `M`). If several entries of `a` are equally near
+    a value in `v`, the one which occurs first in `a` is used.
+    
     Parameters
     ----------
     v : Array
@@ -1844,9 +5273,88 @@ def get_nearest_idx(v, a):
     # Gracefully handle single-value versus array inputs, returning in the
     # corresponding type.
     try:
-        return scipy.array([(scipy.absolute(a - val)).argmin() for val in v])
+        iter(v)
     except TypeError:
-        return (scipy.absolute(a - v)).argmin()
+        return get_nearest_idx([v], a)[0]
+    v = scipy.asarray(v, dtype=float)
+    a = scipy.asarray(a).ravel()
+    if len(a) == 0:
+        raise ValueError("Cannot find nearest values in an empty array!")
+    
+    # A stable sort puts the earliest of any run of equal values first:
+    srt = a.argsort(kind='mergesort')
+    a_srt = a[srt]
+    # The first entry >= each value, and the first entry of the run of equal
+    # values just below it:
+    right = scipy.searchsorted(a_srt, v, side='left')
+    left = scipy.searchsorted(a_srt, a_srt[scipy.maximum(right - 1, 0)], side='left')
+    right = scipy.minimum(right, len(a) - 1)
+    
+    d_left = scipy.absolute(a_srt[left] - v)
+    d_right = scipy.absolute(a_srt[right] - v)
+    idx_left = srt[left]
+    idx_right = srt[right]
+    use_right = (d_right < d_left) | ((d_right == d_left) & (idx_right < idx_left))
+    return scipy.where(use_right, idx_right, idx_left)
+
+def _nearest_in_groups(x, starts, vals, tol=None):
+    """Flag the point nearest to each of `vals` within each group of `x`.
+    
+    This is equivalent to calling :py:func:`get_nearest_idx` on every group in
+    turn, but replacing the values by their integer rank lets a single stable
+    sort by (group, value) be searched exactly for every group at once.
+    
+    Parameters
+    ----------
+    x : :py:class:`Array`, (`M`,)
+        The values to search, with each group contiguous and non-empty.
+    starts : :py:class:`Array` of int, (`P`,)
+        The index of the first member of each group.
+    vals : :py:class:`Array`, (`V`,)
+        The values to find the nearest points to.
+    tol : float or None, optional
+        If the nearest point is farther than this from the value, it is not
+        flagged. Default is None (always flag the nearest point).
+    
+    Returns
+    -------
+    keep : :py:class:`Array` of bool, (`M`,)
+        True for every point which is nearest to one of `vals` in its group.
+    """
+    n = scipy.diff(scipy.append(starts, len(x)))
+    u_x, rank = scipy.unique(x, return_inverse=True)
+    stride = len(u_x) + 1
+    key = scipy.repeat(scipy.arange(len(starts)), n) * stride + rank.ravel()
+    srt = key.argsort(kind='mergesort')
+    key_srt = key[srt]
+    
+    # One query per (group, value) pair:
+    q_group = scipy.repeat(scipy.arange(len(starts)), len(vals))
+    q_vals = scipy.tile(vals, len(starts))
+    q_key = q_group * stride + scipy.tile(
+        scipy.searchsorted(u_x, vals, side='left'), len(starts)
+    )
+    lo = starts[q_group]
+    hi = lo + n[q_group] - 1
+    
+    # Same tie-breaking as get_nearest_idx, within each group:
+    right = scipy.searchsorted(key_srt, q_key, side='left')
+    left = scipy.searchsorted(
+        key_srt, key_srt[scipy.maximum(right - 1, lo)], side='left'
+    )
+    right = scipy.minimum(right, hi)
+    left = srt[left]
+    right = srt[right]
+    d_left = scipy.absolute(x[left] - q_vals)
+    d_right = scipy.absolute(x[right] - q_vals)
+    use_right = (d_right < d_left) | ((d_right == d_left) & (right < left))
+    nearest = scipy.where(use_right, right, left)
+    if tol is not None:
+        nearest = nearest[scipy.absolute(x[nearest] - q_vals) <= tol]
+    
+    keep = scipy.zeros(len(x), dtype=bool)
+    keep[nearest] = True
+    return keep
 
 class RejectionFunc(object):
     """Rejection function for use with `full_MC` mode of :py:func:`GaussianProcess.predict`.
@@ -2013,43 +5521,88 @@ def robust_std(y, axis=None):
     return (scipy.stats.scoreatpercentile(y, 75.0, axis=axis) -
             scipy.stats.scoreatpercentile(y, 25.0, axis=axis)) / IQR_TO_STD
 
-def scoreatpercentilew(x, p, weights):
+def scoreatpercentilew(x, p, weights, axis=None):
     """Computes the weighted score at the given percentile.
     
-    Does not work on small data sets!
+    All of the slices along `axis` are handled with a single sort, so this is
+    efficient for finding the percentiles of many columns at once.
     
     Parameters
     ----------
     x : array
-        Array of data to apply to. Only works properly on 1d data!
+        Array of data to apply to.
     p : float or array of float
         Percentile(s) to find.
-    weights : array, same shape as `x`
-        The weights to apply to the values in `x`.
+    weights : array
+        The weights to apply to the values in `x`. Either broadcastable with
+        `x` or a 1d array with one weight per entry along `axis`.
+    axis : int, optional
+        The axis to find the percentiles along. Default is None (apply to
+        flattened array).
+    
+    Returns
+    -------
+    score : array, (`len(p)`,) + shape of `x` with `axis` removed
+        The weighted score at each percentile. Note that this is an array even
+        for a scalar `p`.
     """
-    # TODO: Vectorize this!
-    x = scipy.asarray(x)
-    weights = scipy.asarray(weights)
-    
-    srt = x.argsort()
-    x = x[srt]
-    w = weights[srt]
-    
-    Sn = w.cumsum()
-    pn = 100.0 / Sn[-1] * (Sn - w / 2.0)
-    k = scipy.digitize(scipy.atleast_1d(p), pn) - 1
-    return x[k] + (p - pn[k]) / (pn[k + 1] - pn[k]) * (x[k + 1] - x[k])
-    # TODO: This returns an array for a scalar input!
+    x = scipy.asarray(x, dtype=float)
+    weights = scipy.asarray(weights, dtype=float)
+    p = scipy.atleast_1d(scipy.asarray(p, dtype=float))
+    
+    if axis is None:
+        weights = scipy.broadcast_to(weights, x.shape).ravel()
+        x = x.ravel()
+        axis = 0
+    axis = axis % x.ndim
+    
+    # Put the axis of interest last, and the rest into a single row index:
+    if weights.ndim == 1 and len(weights) == x.shape[axis]:
+        shape = [1] * x.ndim
+        shape[axis] = len(weights)
+        weights = weights.reshape(shape)
+    weights = scipy.moveaxis(scipy.broadcast_to(weights, x.shape), axis, -1)
+    x = scipy.moveaxis(x, axis, -1)
+    out_shape = (len(p),) + x.shape[:-1]
+    M = x.shape[-1]
+    x = scipy.ascontiguousarray(x.reshape((-1, M)))
+    weights = weights.reshape((-1, M))
+    
+    if M == 1:
+        return scipy.tile(x[:, 0], (len(p), 1)).reshape(out_shape)
+    
+    rows = scipy.arange(x.shape[0])[:, None]
+    srt = x.argsort(axis=1)
+    x = x[rows, srt]
+    w = weights[rows, srt]
+    
+    Sn = w.cumsum(axis=1)
+    pn = 100.0 / Sn[:, -1:] * (Sn - w / 2.0)
+    # Each row of pn is sorted and lies in [0, 100], so offsetting the rows
+    # lets a single searchsorted digitize p against all of them at once:
+    offset = 200.0 * scipy.arange(x.shape[0])
+    k = (
+        scipy.searchsorted((pn + offset[:, None]).ravel(), p[:, None] + offset, side='right') -
+        M * scipy.arange(x.shape[0]) - 1
+    )
+    k = scipy.clip(k, 0, M - 2)
+    
+    rows = rows.T
+    pk = pn[rows, k]
+    xk = x[rows, k]
+    score = xk + (p[:, None] - pk) / (pn[rows, k + 1] - pk) * (x[rows, k + 1] - xk)
+    # Don't extrapolate past the end points:
+    score = scipy.where(p[:, None] <= pn[:, 0], x[:, 0], score)
+    score = scipy.where(p[:, None] >= pn[:, -1], x[:, -1], score)
+    return score.reshape(out_shape)
 
 def medianw(x, weights=None, axis=None):
     """Computes the weighted median of the given data.
     
-    Does not work on small data sets!
-    
     Parameters
     ----------
     x : array
-        Array of data to apply to. Only works properly on 1d, 2d and 3d data.
+        Array of data to apply to.
     weights : array, optional
         Weights to apply to the values in `x`. Default is to use an unweighted
         estimator.
@@ -2057,35 +5610,18 @@ def medianw(x, weights=None, axis=None):
         The axis to take the median along. Default is None (apply to flattened
         array).
     """
-    # TODO: This could be done a whole lot better!
     if weights is None:
         return scipy.median(x, axis=axis)
     else:
-        if axis is None and x.ndim == 1:
-            return scoreatpercentilew(x, 50, weights)[0]
-        elif axis == 0 and x.ndim == 3:
-            out = scipy.zeros_like(x[0])
-            for i in range(0, out.shape[0]):
-                for j in range(0, out.shape[1]):
-                    out[i, j] = scoreatpercentilew(x[:, i, j], 50, weights)
-            return out
-        elif axis == 0 and x.ndim == 2:
-            out = scipy.zeros(x.shape[1])
-            for i in range(0, len(out)):
-                out[i] = scoreatpercentilew(x[:, i], 50, weights)
-            return out
-        else:
-            raise NotImplementedError("That shape/axis is not supported!")
+        return scoreatpercentilew(x, 50, weights, axis=axis)[0]
 
 def robust_stdw(x, weights=None, axis=None):
     """Computes the weighted robust standard deviation from the weighted IQR.
     
-    Does not work on small data sets!
-    
     Parameters
     ----------
     x : array
-        Array of data to apply to. Only works properly on 1d, 2d and 3d data.
+        Array of data to apply to.
     weights : array, optional
         Weights to apply to the values in `x`. Default is to use an unweighted
         estimator.
@@ -2093,29 +5629,8 @@ def robust_stdw(x, weights=None, axis=None):
         The axis to take the robust standard deviation along. Default is None
         (apply to flattened array).
     """
-    # TODO: This could be done a whole lot better!
     if weights is None:
         return robust_std(x, axis=axis)
     else:
-        if axis is None and x.ndim == 1:
-            lq, uq = scoreatpercentilew(x, [25, 75], weights)
-            return (uq - lq) / IQR_TO_STD
-        elif axis == 0 and x.ndim == 3:
-            lq = scipy.zeros_like(x[0])
-            uq = scipy.zeros_like(x[0])
-            for i in range(0, lq.shape[0]):
-                for j in range(0, lq.shape[1]):
-                    lqij, uqij = scoreatpercentilew(x[:, i, j], [25, 75], weights)
-                    lq[i, j] = lqij
-                    uq[i, j] = uqij
-            return (uq - lq) / IQR_TO_STD
-        elif axis == 0 and x.ndim == 2:
-            lq = scipy.atleast_1d(scipy.zeros(x.shape[1]))
-            uq = scipy.atleast_1d(scipy.zeros(x.shape[1]))
-            for i in range(0, len(lq)):
-                lqi, uqi = scoreatpercentilew(x[:, i], [25, 75], weights)
-                lq[i] = lqi
-                uq[i] = uqi
-            return (uq - lq) / IQR_TO_STD
-        else:
-            raise NotImplementedError("That shape/axis is not supported!")
+        lq, uq = scoreatpercentilew(x, [25, 75], weights, axis=axis)
+        return (uq - lq) / IQR_TO_STD
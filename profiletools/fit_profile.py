@@ -584,7 +584,9 @@ parser.add_argument('-i', '--input-filename',
                          "the actual file.")
 parser.add_argument('-o', '--output-filename',
                     help="Filename/path to write a NetCDF or CSV file to"
-                         "containing the results of the fit. If not specified, "
+                         "containing the results of the fit. If the extension "
+                         "is .npz, the results are appended to a columnar "
+                         "dataset of many fits instead. If not specified, "
                          "you will be prompted for a filename upon completing "
                          "the fit.")
 parser.add_argument('-x', '--abscissa-name',
@@ -692,7 +694,6 @@ import numpy.linalg
 import itertools
 import getpass
 import inspect
-import csv
 import pickle as pickle
 
 # What key to use for keyboard shortcuts: command on Mac, control otherwise:
@@ -2070,6 +2071,11 @@ class FitWindow(tk.Tk):
         
         self.flagged_plt = None
         
+        # One writer per fit results dataset for the whole session, so that
+        # the file is only scanned once:
+        self.results_writers = {}
+        self.protocol("WM_DELETE_WINDOW", self.exit)
+        
         self.bind("<%s-d>" % (COMMAND_KEY,), self.set_tab)
         self.bind("<%s-k>" % (COMMAND_KEY,), self.set_tab)
         self.bind("<%s-f>" % (COMMAND_KEY,), self.set_tab)
@@ -2323,9 +2329,12 @@ class FitWindow(tk.Tk):
                     "No valid points in time points. No bounding applied."
                 )
         
-        # Keep a deepcopy so we don't mutate the master data that have been
-        # pulled from the tree.
-        self.p = copy.deepcopy(self.master_p)
+        # Keep a copy so we don't mutate the master data that have been
+        # pulled from the tree. The profiles share their data with the master
+        # copies until they are modified.
+        self.p = collections.OrderedDict(
+            [(k, p.copy() if p != [] else p) for k, p in self.master_p.items()]
+        )
         
         for k, p in self.p.items():
             # Data that haven't been loaded are stored as an empty list.
@@ -2341,23 +2350,17 @@ class FitWindow(tk.Tk):
                         if t_min is not None:
                             if p.X is not None:
                                 p.remove_points(p.X[:, 0] < t_min)
-                            for pt in p.transformed:
-                                good_idxs = (pt.X[:, :, 0] >= t_min).all(axis=1)
-                                pt.X = pt.X[good_idxs]
-                                pt.err_X = pt.err_X[good_idxs]
-                                pt.y = pt.y[good_idxs]
-                                pt.err_y = pt.err_y[good_idxs]
-                                pt.T = pt.T[good_idxs]
+                            if len(p.transformed) > 0:
+                                p.transformed.remove_points(
+                                    (p.transformed.X[:, :, :, 0] < t_min).any(axis=2)
+                                )
                         if t_max is not None:
                             if p.X is not None:
                                 p.remove_points(p.X[:, 0] > t_max)
-                            for pt in p.transformed:
-                                good_idxs = (pt.X[:, :, 0] <= t_max).all(axis=1)
-                                pt.X = pt.X[good_idxs]
-                                pt.err_X = pt.err_X[good_idxs]
-                                pt.y = pt.y[good_idxs]
-                                pt.err_y = pt.err_y[good_idxs]
-                                pt.T = pt.T[good_idxs]
+                            if len(p.transformed) > 0:
+                                p.transformed.remove_points(
+                                    (p.transformed.X[:, :, :, 0] > t_max).any(axis=2)
+                                )
                     else:
                         if times:
                             p.keep_times(times)
@@ -2402,9 +2405,7 @@ class FitWindow(tk.Tk):
         if len(p_list) == 0:
             self.control_frame.status_frame.add_line("No profiles to combine!")
         else:
-            self.combined_p = copy.deepcopy(p_list.pop(0))
-            for p_other in p_list:
-                self.combined_p.add_profile(p_other)
+            self.combined_p = type(p_list[0]).concat(p_list)
             
             # Remove extreme change points, keeping track of the bad indices.
             if self.control_frame.outlier_frame.extreme_state.get():
@@ -2763,46 +2764,29 @@ class FitWindow(tk.Tk):
         try:
             compute_vol_avg = self.control_frame.eval_frame.vol_avg_state.get()
             compute_peaking = self.control_frame.eval_frame.peaking_state.get()
+            # Everything derived from the fit is evaluated as linear
+            # functionals in a single prediction. The value comes first so that
+            # the rejection function sees it in the right place:
+            functionals = profiletools.LinearFunctionals()
+            if not compute_a_L:
+                functionals.add_value('val', X)
             if compute_vol_avg or compute_peaking:
-                dum, weights = self.combined_p._make_volume_averaging_matrix(rho_grid=X)
-                if compute_a_L:
-                    weights = scipy.hstack((weights, scipy.zeros_like(weights)))
-                    output_transform = scipy.vstack((weights, scipy.eye(2 * len(X))))
-                else:
-                    output_transform = scipy.vstack((weights, scipy.eye(len(X))))
-                # This will put the volume average as the first element.
-                if compute_peaking:
-                    if 'psinorm' in self.combined_p.abscissa:
-                        if self.combined_p.abscissa.startswith('sqrt'):
-                            core_loc = scipy.sqrt(0.2)
-                        else:
-                            core_loc = 0.2
-                    else:
-                        times = self.combined_p._get_efit_times_to_average()
-                        
-                        core_loc = self.combined_p.efit_tree.psinorm2rho(
-                            self.combined_p.abscissa,
-                            0.2,
-                            times,
-                            each_t=True
-                        )
-                        core_loc = scipy.stats.nanmean(core_loc.ravel())
-                    X = scipy.insert(X, 0, core_loc)
-                    output_transform = scipy.insert(output_transform, 0, 0, axis=1)
-                    core_select = scipy.zeros(output_transform.shape[1])
-                    core_select[0] = 1
-                    output_transform = scipy.insert(output_transform, 1, core_select, axis=0)
-                    # This will put w(psinorm=0.2) as the second element and the
-                    # volume average as the first element.
-            else:
-                output_transform = None
-            
+                functionals.add_volume_average('vol_avg', self.combined_p, grid=X)
             if compute_peaking:
-                special_vals = 2
-            elif compute_vol_avg:
-                special_vals = 1
-            else:
-                special_vals = 0
+                functionals.add_peaking_core('core', self.combined_p)
+            
+            TCI_names = []
+            if (self.control_frame.data_source_frame.signal_coordinate_frame.signal_var.get() == 'ne' and
+                    self.control_frame.eval_frame.TCI_state.get()):
+                # TODO: Make this load TCI chords if not present!
+                if 'TCI' not in self.p:
+                    self.control_frame.status_frame.add_line(
+                        "Must have loaded TCI first! TCI integrals will not be computed."
+                    )
+                else:
+                    for k, pt in enumerate(self.p['TCI'].transformed):
+                        TCI_names.append('TCI_%d' % (k,))
+                        functionals.add_transformed(TCI_names[-1], pt)
             
             if compute_a_L:
                 res = self.combined_p.compute_a_over_L(
@@ -2815,9 +2799,7 @@ class FitWindow(tk.Tk):
                     num_samples=num_samples,
                     burn=burn,
                     thin=thin,
-                    output_transform=output_transform,
-                    special_vals=special_vals,
-                    special_X_vals=int(compute_peaking)
+                    functionals=functionals if len(functionals) > 0 else None
                 )
                 # Print summary of fit:
                 self.control_frame.status_frame.add_line(
@@ -2831,24 +2813,18 @@ class FitWindow(tk.Tk):
                     )
                 )
             else:
-                res = self.combined_p.smooth(
-                    X,
-                    n=0,
+                res = functionals.evaluate(
+                    self.combined_p,
                     use_MCMC=use_MCMC,
                     sampler=self.sampler,
-                    full_output=True,
                     full_MC=full_MC,
                     rejection_func=rejection_func,
                     num_samples=num_samples,
                     burn=burn,
-                    thin=thin,
-                    output_transform=output_transform
+                    thin=thin
                 )
-                # Repackage the results to match the form returned by MCMC:
-                res['special_mean'] = res['mean'][:special_vals]
-                res['special_cov'] = res['cov'][:special_vals, :special_vals]
-                res['mean_val'] = res.pop('mean')[special_vals:]
-                res['std_val'] = res.pop('std')[special_vals:]
+                if 'samp_val' in res:
+                    res['samp'] = res['samp_val']
                 
                 # Print summary of fit:
                 self.control_frame.status_frame.add_line(
@@ -2856,48 +2832,27 @@ class FitWindow(tk.Tk):
                     (100 * scipy.median(scipy.absolute(res['std_val'] / res['mean_val'])),)
                 )
             
-            if (self.control_frame.data_source_frame.signal_coordinate_frame.signal_var.get() == 'ne' and
-                    self.control_frame.eval_frame.TCI_state.get()):
-                # TODO: Make this load TCI chords if not present!
-                # TODO: This breaks with full Monte Carlo!
-                if 'TCI' not in self.p:
-                    self.control_frame.status_frame.add_line(
-                        "Must have loaded TCI first! TCI integrals will not be computed."
-                    )
-                else:
-                    p_TCI = self.p['TCI']
-                    self.control_frame.status_frame.add_line(
-                        "Computing TCI line integrals..."
-                    )
-                    for pt in p_TCI.transformed:
-                        self.control_frame.status_frame.add_line(pt.y_label)
-                        res_nl = self.combined_p.smooth(
-                            scipy.vstack(pt.X),
-                            use_MCMC=use_MCMC,
-                            sampler=self.sampler,
-                            full_output=True,
-                            full_MC=full_MC,
-                            rejection_func=rejection_func,
-                            num_samples=num_samples,
-                            burn=burn,
-                            thin=thin,
-                            output_transform=scipy.linalg.block_diag(*pt.T)
+            if TCI_names:
+                self.control_frame.status_frame.add_line(
+                    "TCI line integrals:"
+                )
+                for name, pt in zip(TCI_names, self.p['TCI'].transformed):
+                    self.control_frame.status_frame.add_line(pt.y_label)
+                    if pt.y_units:
+                        y_units = pt.y_units.translate(None, '\\${}')
+                        self.control_frame.status_frame.add_line(
+                            u"  measured: (%6.4g\u00B1%6.4g) %s\n"
+                            u"  fit:      (%6.4g\u00B1%6.4g) %s"
+                            % (pt.y[0], pt.err_y[0], y_units,
+                               res['mean_' + name][0], res['std_' + name][0], y_units)
+                        )
+                    else:
+                        self.control_frame.status_frame.add_line(
+                            u"  measured: %6.4g\u00B1%6.4g\n"
+                            u"  fit:      %6.4g\u00B1%6.4g"
+                            % (pt.y[0], pt.err_y[0],
+                               res['mean_' + name][0], res['std_' + name][0])
                         )
-                        if pt.y_units:
-                            y_units = pt.y_units.translate(None, '\\${}')
-                            self.control_frame.status_frame.add_line(
-                                u"  measured: (%6.4g\u00B1%6.4g) %s\n"
-                                u"  fit:      (%6.4g\u00B1%6.4g) %s"
-                                % (pt.y[0], pt.err_y[0], y_units,
-                                   res_nl['mean'][0], res_nl['std'][0], y_units)
-                            )
-                        else:
-                            self.control_frame.status_frame.add_line(
-                                u"  measured: %6.4g\u00B1%6.4g\n"
-                                u"  fit:      %6.4g\u00B1%6.4g"
-                                % (pt.y[0], pt.err_y[0],
-                                   res_nl['mean'][0], res_nl['std'][0])
-                            )
         
         except numpy.linalg.LinAlgError as e:
             self.control_frame.status_frame.add_line(
@@ -2915,8 +2870,8 @@ class FitWindow(tk.Tk):
         self.std_vol_avg = None
         
         if compute_vol_avg or compute_peaking:
-            self.mean_vol_avg = res['special_mean'][0]
-            self.std_vol_avg = scipy.sqrt(res['special_cov'][0, 0])
+            self.mean_vol_avg = res['mean_vol_avg'][0]
+            self.std_vol_avg = res['std_vol_avg'][0]
             if compute_vol_avg:
                 if self.combined_p.y_units:
                     self.control_frame.status_frame.add_line(
@@ -2930,9 +2885,9 @@ class FitWindow(tk.Tk):
                         % (self.mean_vol_avg, self.std_vol_avg,)
                     )
             if compute_peaking:
-                mean_w2 = res['special_mean'][1]
-                std_w2 = scipy.sqrt(res['special_cov'][1, 1])
-                cov_w2_vol_avg = res['special_cov'][0, 1]
+                mean_w2 = res['mean_core'][0]
+                std_w2 = res['std_core'][0]
+                cov_w2_vol_avg = functionals.cross_cov(res, 'vol_avg', 'core')[0, 0]
                 self.mean_peaking = mean_w2 / self.mean_vol_avg
                 self.std_peaking = scipy.sqrt(
                     std_w2 / self.mean_vol_avg**2 +
@@ -2943,8 +2898,6 @@ class FitWindow(tk.Tk):
                     u"Peaking is %g\u00b1%g"
                     % (self.mean_peaking, self.std_peaking,)
                 )
-                # Delete the extra points so they don't confuse the plot/file output:
-                X = X[1:]
         
         if full_MC:
             self.control_frame.status_frame.add_line(
@@ -3298,7 +3251,7 @@ class FitWindow(tk.Tk):
                     if self.combined_p.y_units
                     else self.combined_p.y_label
                 )
-                with open(os.path.expanduser(path), 'wb') as outfile:
+                with open(os.path.expanduser(path), 'w') as outfile:
                     # Write metadata:
                     metadata = history
                     try:
@@ -3333,25 +3286,55 @@ class FitWindow(tk.Tk):
                         "metadata %d\n" % (len(metadata.splitlines()) + 1,) + metadata
                     )
                     
-                    writer = csv.writer(outfile)
                     if 'mean_a_L' in self.res:
-                        writer.writerow(
+                        profiletools.write_csv_columns(
+                            outfile,
                             [X_name,
                              y_name, 'err_' + y_name,
                              'D' + self.combined_p.y_label, 'err_D' + self.combined_p.y_label,
-                             'a_L' + self.combined_p.y_label, 'err_a_L' + self.combined_p.y_label]
-                        )
-                        writer.writerows(
-                            list(zip(
-                                self.X,
-                                self.res['mean_val'], self.res['std_val'],
-                                self.res['mean_grad'], self.res['std_grad'],
-                                self.res['mean_a_L'], self.res['std_a_L']
-                            ))
+                             'a_L' + self.combined_p.y_label, 'err_a_L' + self.combined_p.y_label],
+                            [self.X,
+                             self.res['mean_val'], self.res['std_val'],
+                             self.res['mean_grad'], self.res['std_grad'],
+                             self.res['mean_a_L'], self.res['std_a_L']]
                         )
                     else:
-                        writer.writerow([X_name, y_name, 'err_' + y_name])
-                        writer.writerows(list(zip(self.X, self.res['mean_val'], self.res['std_val'])))
+                        profiletools.write_csv_columns(
+                            outfile,
+                            [X_name, y_name, 'err_' + y_name],
+                            [self.X, self.res['mean_val'], self.res['std_val']]
+                        )
+            elif ext.lower() == '.npz':
+                # Append output to columnar fit results dataset:
+                self.control_frame.status_frame.add_line(
+                    "Appending results to fit results dataset %s..." % os.path.basename(path)
+                )
+                fit = {
+                    'mean_val': self.res['mean_val'],
+                    'std_val': self.res['std_val']
+                }
+                if 'mean_a_L' in self.res:
+                    for k in ('mean_grad', 'std_grad', 'mean_a_L', 'std_a_L'):
+                        fit[k] = self.res[k]
+                for k in ('shot', 't_min', 't_max'):
+                    if hasattr(self.combined_p, k):
+                        fit[k] = getattr(self.combined_p, k)
+                if self.mean_vol_avg is not None:
+                    fit['vol_avg'] = self.mean_vol_avg
+                    fit['err_vol_avg'] = self.std_vol_avg
+                if self.mean_peaking is not None:
+                    fit['peaking'] = self.mean_peaking
+                    fit['err_peaking'] = self.std_peaking
+                if path not in self.results_writers:
+                    self.results_writers[path] = profiletools.FitResultsWriter(path)
+                self.results_writers[path].append(
+                    self.X,
+                    abscissa=getattr(self.combined_p, 'abscissa', ''),
+                    **fit
+                )
+                # Write it straight away, so it isn't lost if the session
+                # doesn't end with exit:
+                self.results_writers[path].flush()
             elif ext.lower() == '.pkl':
                 # Write output to dictionary in pickle file:
                 self.control_frame.status_frame.add_line(
@@ -3477,6 +3460,10 @@ class FitWindow(tk.Tk):
     def exit(self):
         """Quit the program, cleaning up as needed.
         """
+        # Write any fits which are still buffered:
+        for writer in self.results_writers.values():
+            writer.close()
+        self.results_writers = {}
         self.destroy()
 
 class MCMCResultsFrame(tk.Frame):
@@ -0,0 +1,40 @@
+"""Check the weighted percentiles against a direct per-column computation.
+"""
+
+from __future__ import division
+from builtins import range
+
+import scipy
+import profiletools
+
+def scoreatpercentilew_column(x, p, weights):
+    """Weighted percentiles `p` of the 1d array `x`, interpolating between the sorted points.
+    """
+    srt = x.argsort()
+    x = x[srt]
+    w = weights[srt]
+    Sn = w.cumsum()
+    pn = 100.0 / Sn[-1] * (Sn - w / 2.0)
+    return scipy.interp(p, pn, x)
+
+def test_matches_per_column():
+    scipy.random.seed(0)
+    x = scipy.random.uniform(size=(37, 5))
+    w = scipy.random.uniform(size=37) + 0.1
+    p = [10, 25, 50, 75, 90]
+    expected = scipy.array([scoreatpercentilew_column(x[:, i], p, w) for i in range(0, 5)]).T
+    assert scipy.allclose(profiletools.scoreatpercentilew(x, p, w, axis=0), expected)
+
+def test_percentiles_outside_of_points():
+    # The first point carries most of the weight, so the lower quartile falls
+    # below the percentile pn[0] of the first point:
+    x = scipy.array([0.1, 0.4, 0.45, 0.5, 0.55, 0.6, 0.65, 2.0])
+    w = scipy.array([100.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0])
+    score = profiletools.scoreatpercentilew(x, [0.0, 1.0, 25, 75, 99.0, 100.0], w)
+    assert (score >= x.min()).all() and (score <= x.max()).all()
+    assert score[0] == x.min() and score[2] == x.min() and score[-1] == x.max()
+    assert scipy.allclose(score, scoreatpercentilew_column(x, [0.0, 1.0, 25, 75, 99.0, 100.0], w))
+    assert scipy.allclose(
+        profiletools.robust_stdw(x, w),
+        (score[3] - score[2]) / profiletools.IQR_TO_STD
+    )
@@ -0,0 +1,70 @@
+"""Check that the gptools API works on the Gaussian process of a profile with transformed quantities.
+"""
+
+from __future__ import division
+from builtins import range
+
+import scipy
+import gptools
+import profiletools
+
+def make_profile():
+    """Make a profile with local points, two of them outliers, and line-integrated channels.
+    """
+    scipy.random.seed(0)
+    p = profiletools.Profile(X_dim=1)
+    X = scipy.linspace(0, 1, 50)
+    y = scipy.exp(-X**2 / 0.3) + 0.02 * scipy.random.standard_normal(50)
+    y[[10, 30]] += 1.0
+    p.add_data(X, y, err_y=0.02)
+    channels = []
+    for c in range(0, 3):
+        X_c = scipy.zeros((4, 10, 1))
+        X_c[:, :, 0] = scipy.linspace(0, 1 - 0.1 * c, 10)
+        y_c = 0.5 * scipy.ones(4)
+        y_c[1] = 5.0
+        channels.append(
+            profiletools.Channel(X_c, y_c, err_y=0.05, T=scipy.ones((4, 10)) / 10.0)
+        )
+    p.transformed = profiletools.TransformedSet.from_channels(channels)
+    p.create_gp(
+        k=gptools.SquaredExponentialKernel(
+            num_dim=1,
+            initial_params=[1.0, 0.5],
+            param_bounds=[(0.0, 5.0), (0.01, 5.0)]
+        )
+    )
+    return p
+
+def dense_gp(gp):
+    """Make a :py:class:`gptools.GaussianProcess` with the same data and a dense transform.
+    """
+    dense = gptools.GaussianProcess(gp.k, noise_k=gp.noise_k)
+    dense.add_data(gp.X, gp.y, err_y=gp.err_y, n=gp.n, T=gp.T.toarray())
+    return dense
+
+def test_add_data_and_condense_duplicates():
+    p = make_profile()
+    p.gp.add_data([0.0], [0.0], n=1)
+    p.gp.add_data([1.0, 1.0], [0.0, 0.0], err_y=0.01)
+    p.gp.add_data(p.gp.X[:3], [0.1], err_y=0.1, T=scipy.ones((1, 3)) / 3.0)
+    num_y = len(p.gp.y)
+    X_star = scipy.linspace(0, 1, 20)
+    expected = dense_gp(p.gp).predict(X_star)[0]
+    p.gp.condense_duplicates()
+    assert len(p.gp.y) == num_y
+    assert p.gp.T.shape == (num_y, len(p.gp.X))
+    assert scipy.allclose(p.gp.predict(X_star)[0], expected)
+
+def test_remove_outliers():
+    p = make_profile()
+    num_y = len(p.gp.y)
+    X_bad, y_bad, err_y_bad, n_bad, bad_idxs, T_bad = p.gp.remove_outliers(thresh=3)
+    assert bad_idxs.shape == (num_y,)
+    assert bad_idxs[[10, 30]].all()
+    assert len(y_bad) == bad_idxs.sum()
+    assert T_bad.shape == (len(y_bad), len(X_bad))
+    assert len(p.gp.y) == num_y - bad_idxs.sum()
+    assert p.gp.T.shape == (len(p.gp.y), len(p.gp.X))
+    X_star = scipy.linspace(0, 1, 20)
+    assert scipy.allclose(p.gp.predict(X_star)[0], dense_gp(p.gp).predict(X_star)[0])